@@ -0,0 +1,36 @@
+"""add dataset ingest status
+
+Revision ID: 002_add_dataset_ingest_status
+Revises: 001_add_dashboard_models
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "002_add_dataset_ingest_status"
+down_revision = "001_add_dashboard_models"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing datasets were parsed synchronously on upload
+    op.add_column(
+        "dataset",
+        sa.Column("status", sa.String(50), nullable=False, server_default="profiled"),
+    )
+    op.add_column(
+        "dataset",
+        sa.Column("progress", sa.Float, nullable=False, server_default="1"),
+    )
+    op.add_column("dataset", sa.Column("job_id", sa.String(50)))
+    op.add_column("dataset", sa.Column("error", sa.Text))
+
+
+def downgrade():
+    op.drop_column("dataset", "error")
+    op.drop_column("dataset", "job_id")
+    op.drop_column("dataset", "progress")
+    op.drop_column("dataset", "status")
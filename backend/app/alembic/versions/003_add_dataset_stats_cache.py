@@ -0,0 +1,40 @@
+"""add dataset stats cache
+
+Revision ID: 003_add_dataset_stats_cache
+Revises: 002_add_dataset_ingest_status
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "003_add_dataset_stats_cache"
+down_revision = "002_add_dataset_ingest_status"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("dataset", sa.Column("content_hash", sa.String(64)))
+    op.add_column(
+        "dataset",
+        sa.Column("version", sa.Integer, nullable=False, server_default="1"),
+    )
+
+    op.create_table(
+        "dataset_stats",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("version", sa.Integer, nullable=False),
+        sa.Column("content_hash", sa.String(64)),
+        sa.Column("stats", sa.Text, nullable=False),
+        sa.Column("computed_at", sa.DateTime, default=sa.func.now()),
+        sa.Column("dataset_id", sa.Integer, sa.ForeignKey("dataset.id"), nullable=False),
+        sa.UniqueConstraint("dataset_id", "version", "content_hash"),
+    )
+
+
+def downgrade():
+    op.drop_table("dataset_stats")
+    op.drop_column("dataset", "version")
+    op.drop_column("dataset", "content_hash")
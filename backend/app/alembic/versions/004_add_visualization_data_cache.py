@@ -0,0 +1,40 @@
+"""add visualization data cache
+
+Revision ID: 004_add_visualization_data_cache
+Revises: 003_add_dataset_stats_cache
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "004_add_visualization_data_cache"
+down_revision = "003_add_dataset_stats_cache"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "visualization_data",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("updated_at", sa.DateTime, nullable=False),
+        sa.Column("dataset_version", sa.Integer, nullable=False),
+        sa.Column("content_hash", sa.String(64)),
+        sa.Column("data", sa.Text, nullable=False),
+        sa.Column("computed_at", sa.DateTime, default=sa.func.now()),
+        sa.Column(
+            "visualization_id",
+            sa.Integer,
+            sa.ForeignKey("visualization.id"),
+            nullable=False,
+        ),
+        sa.UniqueConstraint(
+            "visualization_id", "updated_at", "dataset_version", "content_hash"
+        ),
+    )
+
+
+def downgrade():
+    op.drop_table("visualization_data")
@@ -0,0 +1,43 @@
+"""add request parameters to the visualization data cache
+
+Revision ID: 005_add_visualization_params
+Revises: 004_add_visualization_data_cache
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "005_add_visualization_params"
+down_revision = "004_add_visualization_data_cache"
+branch_labels = None
+depends_on = None
+
+OLD_KEY = ["visualization_id", "updated_at", "dataset_version", "content_hash"]
+
+
+def upgrade():
+    op.add_column(
+        "visualization_data",
+        sa.Column("params", sa.String, nullable=False, server_default=""),
+    )
+    op.drop_constraint(
+        "visualization_data_visualization_id_updated_at_dataset_vers_key",
+        "visualization_data",
+        type_="unique",
+    )
+    op.create_unique_constraint(
+        "visualization_data_key", "visualization_data", OLD_KEY + ["params"]
+    )
+
+
+def downgrade():
+    op.drop_constraint("visualization_data_key", "visualization_data", type_="unique")
+    op.execute("DELETE FROM visualization_data WHERE params <> ''")
+    op.drop_column("visualization_data", "params")
+    op.create_unique_constraint(
+        "visualization_data_visualization_id_updated_at_dataset_vers_key",
+        "visualization_data",
+        OLD_KEY,
+    )
@@ -0,0 +1,23 @@
+"""add dataset column profiles
+
+Revision ID: 006_add_dataset_column_profile
+Revises: 005_add_visualization_params
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "006_add_dataset_column_profile"
+down_revision = "005_add_visualization_params"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("dataset_column", sa.Column("profile", sa.Text))
+
+
+def downgrade():
+    op.drop_column("dataset_column", "profile")
@@ -0,0 +1,50 @@
+"""add dataset versions
+
+Revision ID: 007_add_dataset_versions
+Revises: 006_add_dataset_column_profile
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "007_add_dataset_versions"
+down_revision = "006_add_dataset_column_profile"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "dataset_version",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("version", sa.Integer, nullable=False),
+        sa.Column("content_hash", sa.String(64)),
+        sa.Column("row_count", sa.Integer),
+        sa.Column("created_at", sa.DateTime, default=sa.func.now()),
+        sa.Column("dataset_id", sa.Integer, sa.ForeignKey("dataset.id"), nullable=False),
+        sa.UniqueConstraint("dataset_id", "version"),
+    )
+
+    # The current content of ingested datasets is their first recorded version
+    op.execute(
+        """
+        INSERT INTO dataset_version (version, content_hash, row_count, created_at, dataset_id)
+        SELECT version, content_hash, row_count, updated_at, id
+        FROM dataset
+        WHERE status = 'profiled'
+        """
+    )
+
+    for table in ("visualization", "report"):
+        op.add_column(
+            table,
+            sa.Column("dataset_version_id", sa.Integer, sa.ForeignKey("dataset_version.id")),
+        )
+
+
+def downgrade():
+    for table in ("report", "visualization"):
+        op.drop_column(table, "dataset_version_id")
+    op.drop_table("dataset_version")
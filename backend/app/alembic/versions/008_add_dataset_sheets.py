@@ -0,0 +1,28 @@
+"""add dataset sheets
+
+Revision ID: 008_add_dataset_sheets
+Revises: 007_add_dataset_versions
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "008_add_dataset_sheets"
+down_revision = "007_add_dataset_versions"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("dataset", sa.Column("sheet_name", sa.String))
+    op.add_column(
+        "dataset",
+        sa.Column("parent_id", sa.Integer, sa.ForeignKey("dataset.id", ondelete="SET NULL")),
+    )
+
+
+def downgrade():
+    op.drop_column("dataset", "parent_id")
+    op.drop_column("dataset", "sheet_name")
@@ -0,0 +1,23 @@
+"""add dataset memory footprint
+
+Revision ID: 009_add_dataset_memory_footprint
+Revises: 008_add_dataset_sheets
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "009_add_dataset_memory_footprint"
+down_revision = "008_add_dataset_sheets"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("dataset", sa.Column("memory_footprint", sa.Text))
+
+
+def downgrade():
+    op.drop_column("dataset", "memory_footprint")
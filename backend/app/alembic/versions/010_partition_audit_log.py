@@ -0,0 +1,120 @@
+"""partition audit log
+
+Revision ID: 010_partition_audit_log
+Revises: 009_add_dataset_memory_footprint
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "010_partition_audit_log"
+down_revision = "009_add_dataset_memory_footprint"
+branch_labels = None
+depends_on = None
+
+# Partitions created past the current month, the daily
+# audit_log_maintenance task keeps creating them from then on
+MONTHS_AHEAD = 3
+
+COLUMNS = "id, action, entity_type, entity_id, details, ip_address, timestamp, user_id"
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def upgrade():
+    op.execute("ALTER TABLE audit_log RENAME TO audit_log_unpartitioned")
+    op.execute("ALTER INDEX audit_log_pkey RENAME TO audit_log_unpartitioned_pkey")
+
+    # The primary key of a partitioned table must include the partition key
+    op.execute(
+        """
+        CREATE TABLE audit_log (
+            id INTEGER NOT NULL DEFAULT nextval('audit_log_id_seq'),
+            action VARCHAR(50) NOT NULL,
+            entity_type VARCHAR(50) NOT NULL,
+            entity_id INTEGER NOT NULL,
+            details TEXT,
+            ip_address VARCHAR(50),
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            user_id INTEGER NOT NULL REFERENCES "user" (id),
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+        """
+    )
+    op.execute("ALTER SEQUENCE audit_log_id_seq OWNED BY audit_log.id")
+    op.create_index("ix_audit_log_id", "audit_log", ["id"])
+    op.create_index("ix_audit_log_timestamp", "audit_log", ["timestamp", "id"])
+    op.create_index("ix_audit_log_user_timestamp", "audit_log", ["user_id", "timestamp"])
+    op.create_index(
+        "ix_audit_log_entity_timestamp", "audit_log", ["entity_type", "entity_id", "timestamp"]
+    )
+    op.execute("CREATE TABLE audit_log_default PARTITION OF audit_log DEFAULT")
+
+    # One partition per month from the oldest entry to a few months ahead
+    today = datetime.datetime.utcnow().date()
+    oldest = op.get_bind().execute(
+        "SELECT min(timestamp) FROM audit_log_unpartitioned"
+    ).scalar()
+    month = datetime.date((oldest or today).year, (oldest or today).month, 1)
+    last = add_months(datetime.date(today.year, today.month, 1), MONTHS_AHEAD)
+    while month <= last:
+        end = add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE audit_log_y{month.year:04d}m{month.month:02d} "
+            f"PARTITION OF audit_log FOR VALUES FROM ('{month}') TO ('{end}')"
+        )
+        month = end
+
+    # Entries logged before timestamps were always set are dated of the migration
+    op.execute(
+        f"""
+        INSERT INTO audit_log ({COLUMNS})
+        SELECT id, action, entity_type, entity_id, details, ip_address,
+               coalesce(timestamp, now() AT TIME ZONE 'utc'), user_id
+        FROM audit_log_unpartitioned
+        """
+    )
+    op.drop_table("audit_log_unpartitioned")
+
+    op.create_table(
+        "audit_log_daily",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("day", sa.Date, nullable=False),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("user.id")),
+        sa.Column("entity_type", sa.String(50), nullable=False),
+        sa.Column("action", sa.String(50), nullable=False),
+        sa.Column("count", sa.Integer, nullable=False),
+        sa.UniqueConstraint("day", "user_id", "entity_type", "action"),
+    )
+
+
+def downgrade():
+    op.drop_table("audit_log_daily")
+
+    op.execute("ALTER TABLE audit_log RENAME TO audit_log_partitioned")
+    op.execute("ALTER INDEX audit_log_pkey RENAME TO audit_log_partitioned_pkey")
+    op.execute("ALTER SEQUENCE audit_log_id_seq RENAME TO audit_log_partitioned_id_seq")
+    op.create_table(
+        "audit_log",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("action", sa.String(50), nullable=False),
+        sa.Column("entity_type", sa.String(50), nullable=False),
+        sa.Column("entity_id", sa.Integer, nullable=False),
+        sa.Column("details", sa.Text),
+        sa.Column("ip_address", sa.String(50)),
+        sa.Column("timestamp", sa.DateTime),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("user.id"), nullable=False),
+    )
+    op.execute(
+        f"INSERT INTO audit_log ({COLUMNS}) SELECT {COLUMNS} FROM audit_log_partitioned"
+    )
+    op.execute("SELECT setval('audit_log_id_seq', coalesce(max(id), 0) + 1, false) FROM audit_log")
+    # Also drops the partitions
+    op.drop_table("audit_log_partitioned")
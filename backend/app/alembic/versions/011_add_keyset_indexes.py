@@ -0,0 +1,35 @@
+"""add keyset pagination indexes
+
+Revision ID: 011_add_keyset_indexes
+Revises: 010_partition_audit_log
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "011_add_keyset_indexes"
+down_revision = "010_partition_audit_log"
+branch_labels = None
+depends_on = None
+
+OWNERS = {"dataset": "owner_id", "visualization": "creator_id", "report": "creator_id"}
+
+
+def upgrade():
+    for table, owner in OWNERS.items():
+        op.create_index(f"ix_{table}_{owner}_id", table, [owner, "id"])
+        op.create_index(
+            f"ix_{table}_public_id", table, ["id"], postgresql_where=sa.text("is_public")
+        )
+    for table in ("visualization", "report"):
+        op.create_index(f"ix_{table}_dataset_id_id", table, ["dataset_id", "id"])
+
+
+def downgrade():
+    for table in ("report", "visualization"):
+        op.drop_index(f"ix_{table}_dataset_id_id", table)
+    for table, owner in reversed(list(OWNERS.items())):
+        op.drop_index(f"ix_{table}_public_id", table)
+        op.drop_index(f"ix_{table}_{owner}_id", table)
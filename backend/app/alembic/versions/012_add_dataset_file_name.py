@@ -0,0 +1,23 @@
+"""add dataset file name
+
+Revision ID: 012_add_dataset_file_name
+Revises: 011_add_keyset_indexes
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "012_add_dataset_file_name"
+down_revision = "011_add_keyset_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("dataset", sa.Column("file_name", sa.String))
+
+
+def downgrade():
+    op.drop_column("dataset", "file_name")
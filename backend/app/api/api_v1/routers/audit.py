@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
+from datetime import datetime
 
-from app.db.session import get_db
-from app.db import crud, schemas, models
+from app import exports
+from app.db.session import AsyncSession, get_async_db, get_db
+from app.db import crud, crud_async, pagination, schemas, models
 from app.core.auth import get_current_active_user, get_current_active_superuser
 
 audit_router = r = APIRouter()
@@ -12,41 +15,99 @@ audit_router = r = APIRouter()
 @r.get("/audit-logs", response_model=List[schemas.AuditLogOut])
 async def get_audit_logs(
     request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     user_id: Optional[int] = None,
     entity_type: Optional[str] = None,
     entity_id: Optional[int] = None,
     action: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_active_superuser)  # Only superusers can see all logs
 ):
     """
-    Get audit logs with optional filtering (admin only)
+    Get audit logs with optional filtering (admin only), newest first. Pass
+    the X-Next-Cursor header of a page as cursor to get the next one
     """
-    logs = crud.get_audit_logs(
+    logs = await crud_async.get_audit_logs(
         db, skip=skip, limit=limit, user_id=user_id, 
-        entity_type=entity_type, entity_id=entity_id, action=action
+        entity_type=entity_type, entity_id=entity_id, action=action, cursor=cursor
     )
+    pagination.set_page_headers(response, logs, limit, keys=("timestamp", "id"))
     return logs
 
 
 @r.get("/audit-logs/my-activity", response_model=List[schemas.AuditLogOut])
 async def get_my_activity(
     request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     entity_type: Optional[str] = None,
     entity_id: Optional[int] = None,
     action: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """
-    Get current user's activity logs with optional filtering
+    Get current user's activity logs with optional filtering, newest first.
+    Pass the X-Next-Cursor header of a page as cursor to get the next one
     """
-    logs = crud.get_audit_logs(
+    logs = await crud_async.get_audit_logs(
         db, skip=skip, limit=limit, user_id=current_user.id, 
-        entity_type=entity_type, entity_id=entity_id, action=action
+        entity_type=entity_type, entity_id=entity_id, action=action, cursor=cursor
+    )
+    pagination.set_page_headers(response, logs, limit, keys=("timestamp", "id"))
+    return logs
+
+
+@r.get("/audit-logs/export")
+def export_audit_logs(
+    request: Request,
+    format: str = Query("ndjson", regex="^(ndjson|csv)$"),
+    gzip: bool = False,
+    user_id: Optional[int] = None,
+    entity_type: Optional[str] = None,
+    action: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_superuser)
+):
+    """
+    Export audit logs, oldest first, as newline-delimited JSON or CSV,
+    gzipped if asked (admin only). Filters as for /audit-logs, and on the
+    time range from start to before end. The rows are streamed from the
+    database as they are sent, whatever their number
+    """
+    filters = {
+        "user_id": user_id, "entity_type": entity_type, "action": action,
+        "start": start, "end": end,
+    }
+    crud.log_action(
+        db,
+        current_user.id,
+        "EXPORT",
+        "AuditLog",
+        0,
+        {"format": format, **{k: str(v) for k, v in filters.items() if v is not None}},
+        request.client.host
+    )
+
+    # The session of the request stays open until the response is sent
+    rows = crud.iter_audit_logs(db, **filters)
+    chunks = exports.encode(models.AuditLog.__table__.columns.keys(), rows, format)
+    filename = f"audit_logs.{format}"
+    media_type = exports.FORMATS[format]
+    if gzip:
+        chunks = exports.gzip(chunks)
+        filename += ".gz"
+        media_type = "application/gzip"
+
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
-    return logs
\ No newline at end of file
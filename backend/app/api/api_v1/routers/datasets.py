@@ -1,16 +1,20 @@
-from fastapi import APIRouter, Depends, File, UploadFile, Query, Request
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, Query, Request, Response
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Optional
-import pandas as pd
 
-from app.db.session import get_db
-from app.db import crud, schemas, models
+from app import jobs
+from app.db.session import AsyncSession, get_async_db, get_db
+from app.db import crud, crud_async, pagination, schemas, models
+from app.datasets import storage
 from app.core.auth import get_current_active_user, get_current_active_superuser
+from app.core.celery_app import celery_app
+from app.core.executor import process_pool
 
 datasets_router = r = APIRouter()
 
 
-@r.post("/datasets", response_model=schemas.DatasetOut)
+@r.post("/datasets", response_model=schemas.DatasetStatus, status_code=202)
 async def create_dataset(
     request: Request,
     dataset: schemas.DatasetCreate = Depends(),
@@ -19,19 +23,40 @@ async def create_dataset(
     current_user: models.User = Depends(get_current_active_user)
 ):
     """
-    Upload a new dataset (CSV or XLSX file)
+    Upload a new dataset (CSV or XLSX file). The file is parsed by a
+    background job, poll /datasets/{id}/status for its progress. Every sheet
+    of a workbook becomes a dataset, listed by /datasets/{id}/sheets and
+    parsed by a job of its own
     """
-    # Create the dataset
-    db_dataset = crud.create_dataset(db, dataset, file, current_user.id)
+    # Store and index the file off the event loop, then hand it to the
+    # ingest workers
+    file_location, file_type, content_hash, sheets = await run_in_threadpool(
+        crud.save_dataset_file, file
+    )
+    try:
+        db_dataset = await run_in_threadpool(
+            crud.create_dataset,
+            db, dataset, file_location, file_type, content_hash, sheets, current_user.id,
+            file.filename
+        )
+    except BaseException:
+        crud.remove_dataset_file(file_location)
+        raise
+    db_sheets = await run_in_threadpool(crud.get_dataset_sheets, db, db_dataset)
+    for db_sheet in db_sheets:
+        celery_app.send_task(
+            "app.tasks.ingest_dataset", args=[db_sheet.id], task_id=db_sheet.job_id
+        )
     
     # Log the action
-    crud.log_action(
+    await run_in_threadpool(
+        crud.log_action,
         db, 
         current_user.id, 
         "CREATE", 
         "Dataset", 
         db_dataset.id, 
-        {"name": dataset.name},
+        {"name": dataset.name, "file": file.filename},
         request.client.host
     )
     
@@ -41,15 +66,20 @@ async def create_dataset(
 @r.get("/datasets", response_model=List[schemas.DatasetOut])
 async def read_datasets(
     request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """
-    Get all datasets (owned by user or public)
+    Get all datasets (owned by user or public). Pass the X-Next-Cursor
+    header of a page as cursor to get the next one
     """
-    datasets = crud.get_datasets(db, skip, limit, current_user.id)
+    datasets = await crud_async.get_datasets(db, skip, limit, current_user.id, cursor)
+    total = await crud_async.count_datasets(db, current_user.id)
+    pagination.set_page_headers(response, datasets, limit, total=total)
     return datasets
 
 
@@ -57,18 +87,46 @@ async def read_datasets(
 async def read_dataset(
     request: Request,
     dataset_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """
     Get a specific dataset by ID
     """
-    dataset = crud.get_dataset(db, dataset_id, current_user.id)
+    dataset = await crud_async.get_dataset(db, dataset_id, current_user.id)
+    return dataset
+
+
+@r.get("/datasets/{dataset_id}/status", response_model=schemas.DatasetStatus)
+async def read_dataset_status(
+    request: Request,
+    dataset_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """
+    Get the ingest stage (stored, parsed, profiled or failed) of a dataset
+    """
+    dataset = await crud_async.get_dataset(db, dataset_id, current_user.id)
     return dataset
 
 
+@r.get("/datasets/{dataset_id}/sheets", response_model=List[schemas.DatasetStatus])
+def read_dataset_sheets(
+    dataset_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """
+    Get the datasets of every sheet of the workbook a dataset was read from
+    """
+    dataset = crud.get_dataset(db, dataset_id, current_user.id)
+    sheets = crud.get_dataset_sheets(db, dataset)
+    return sheets
+
+
 @r.put("/datasets/{dataset_id}", response_model=schemas.DatasetOut)
-async def update_dataset(
+def update_dataset(
     request: Request,
     dataset_id: int,
     dataset: schemas.DatasetEdit,
@@ -94,8 +152,55 @@ async def update_dataset(
     return db_dataset
 
 
+@r.put("/datasets/{dataset_id}/file", response_model=schemas.DatasetStatus, status_code=202)
+async def replace_dataset_file(
+    request: Request,
+    dataset_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """
+    Upload a new file as the next version of a dataset. Earlier versions
+    stay readable, poll /datasets/{id}/status for the progress of the new one
+    """
+    db_dataset = await run_in_threadpool(
+        crud.replace_dataset_file, db, dataset_id, file, current_user.id
+    )
+    celery_app.send_task(
+        "app.tasks.ingest_dataset", args=[db_dataset.id], task_id=db_dataset.job_id
+    )
+
+    # Log the action
+    await run_in_threadpool(
+        crud.log_action,
+        db,
+        current_user.id,
+        "REPLACE",
+        "Dataset",
+        dataset_id,
+        {"version": db_dataset.version, "file": file.filename},
+        request.client.host
+    )
+
+    return db_dataset
+
+
+@r.get("/datasets/{dataset_id}/versions", response_model=List[schemas.DatasetVersion])
+def read_dataset_versions(
+    dataset_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """
+    Get the versions of a dataset, which visualizations and reports can pin
+    """
+    versions = crud.get_dataset_versions(db, dataset_id, current_user.id)
+    return versions
+
+
 @r.delete("/datasets/{dataset_id}", response_model=schemas.DatasetOut)
-async def delete_dataset(
+def delete_dataset(
     request: Request,
     dataset_id: int,
     db: Session = Depends(get_db),
@@ -125,58 +230,160 @@ async def preview_dataset(
     request: Request,
     dataset_id: int,
     n_rows: int = Query(10, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    version: Optional[int] = Query(None, ge=1),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """
-    Preview first n rows of a dataset
+    Preview n rows of a dataset, starting at row offset, from the given
+    version or the latest one
     """
-    preview_data = crud.preview_dataset(db, dataset_id, current_user.id, n_rows)
+    source = await run_in_threadpool(
+        crud.get_preview_source, db, dataset_id, current_user.id, version
+    )
+    try:
+        preview_data = await process_pool.run(
+            jobs.read_rows, offset, n_rows, **source, request=request
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     return preview_data
 
 
+@r.post("/datasets/{dataset_id}/append", response_model=schemas.DatasetOut)
+async def append_rows(
+    request: Request,
+    dataset_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """
+    Append rows to a dataset, sent as a CSV body (text/csv) or a JSON list
+    of objects (application/json) with the columns of the dataset
+    """
+    body = await request.body()
+    db_dataset = await run_in_threadpool(
+        crud.append_rows,
+        db,
+        dataset_id,
+        body,
+        request.headers.get("content-type", ""),
+        current_user.id,
+    )
+
+    # Log the action
+    await run_in_threadpool(
+        crud.log_action,
+        db,
+        current_user.id,
+        "APPEND",
+        "Dataset",
+        dataset_id,
+        {"version": db_dataset.version, "row_count": db_dataset.row_count},
+        request.client.host
+    )
+
+    return db_dataset
+
+
+@r.get("/datasets/{dataset_id}/memory")
+def read_memory_footprint(
+    request: Request,
+    dataset_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """
+    Get the memory a dataset takes loaded with the column types pandas
+    infers and with the compact types chosen at ingest, per column
+    """
+    memory = crud.get_memory_footprint(db, dataset_id, current_user.id)
+    return memory
+
+
+@r.get("/datasets/{dataset_id}/columns/{column_name}/profile")
+def read_column_profile(
+    request: Request,
+    dataset_id: int,
+    column_name: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """
+    Get the histograms (numeric and date columns) or most frequent values
+    (other columns) of a column, precomputed at ingest
+    """
+    profile = crud.get_column_profile(db, dataset_id, column_name, current_user.id)
+    return profile
+
+
+@r.post("/datasets/{dataset_id}/query", response_model=schemas.QueryResult)
+def query_dataset(
+    request: Request,
+    dataset_id: int,
+    query: schemas.DatasetQuery,
+    version: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """
+    Filter, group and aggregate a dataset on the server and return only the
+    result rows, from the given version or the latest one
+    """
+    result = crud.query_dataset(db, dataset_id, query, current_user.id, version)
+    return result
+
+
 @r.get("/datasets/{dataset_id}/analyze")
 async def analyze_dataset(
     request: Request,
     dataset_id: int,
+    mode: str = Query("exact", regex="^(exact|approx)$"),
+    sample: int = Query(100000, ge=100, le=10000000),
+    confidence: float = Query(0.95, gt=0, lt=1),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """
-    Get basic statistics for a dataset
+    Get basic statistics for a dataset. Exact statistics are computed once per
+    version of the data and served from the dataset_stats cache afterwards.
+    mode=approx estimates them from a random sample of `sample` rows instead,
+    with confidence intervals for every metric
     """
-    dataset = crud.get_dataset(db, dataset_id, current_user.id)
-    
-    # Load the dataset
-    if dataset.file_type == "csv":
-        df = pd.read_csv(dataset.file_path)
-    elif dataset.file_type in ["xlsx", "xls"]:
-        df = pd.read_excel(dataset.file_path)
-    else:
+    dataset = await run_in_threadpool(crud.get_dataset, db, dataset_id, current_user.id)
+    if dataset.status != "profiled":
+        raise HTTPException(status_code=409, detail="Dataset is still being ingested")
+    if dataset.file_type not in ["csv", "xlsx", "xls"]:
         return {"error": "Unsupported file type"}
-    
-    # Get basic statistics
-    numeric_columns = df.select_dtypes(include=['number']).columns
-    stats = {}
-    
-    if not numeric_columns.empty:
-        stats["summary"] = df[numeric_columns].describe().to_dict()
-    
-    # Missing values
-    missing_values = df.isnull().sum().to_dict()
-    stats["missing_values"] = {col: count for col, count in missing_values.items() if count > 0}
-    
-    # Data types
-    stats["data_types"] = {col: str(dtype) for col, dtype in df.dtypes.items()}
-    
+
+    # Datasets uploaded before the columnar store existed are read from the file
+    store = await run_in_threadpool(storage.open_store, dataset.id)
+    store_path = store.path if store is not None else None
+    if mode == "approx":
+        stats = await process_pool.run(
+            jobs.analyze, store_path, dataset.file_path, dataset.file_type,
+            sample, confidence, request=request
+        )
+    else:
+        stats = await run_in_threadpool(crud.get_dataset_stats, db, dataset)
+        if stats is None:
+            stats = await process_pool.run(
+                jobs.analyze, store_path, dataset.file_path, dataset.file_type,
+                request=request
+            )
+            await run_in_threadpool(crud.save_dataset_stats, db, dataset, stats)
+        stats = {"mode": "exact", **stats}
+
     # Log the action
-    crud.log_action(
+    await run_in_threadpool(
+        crud.log_action,
         db, 
         current_user.id, 
         "ANALYZE", 
         "Dataset", 
         dataset_id, 
-        None,
+        {"mode": mode},
         request.client.host
     )
     
@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends
+
+from app.db import models
+from app.core.auth import get_current_active_superuser
+from app.core.executor import process_pool
+from app.db.audit import audit_sink
+from app.db.session import DB_THREADS, async_engine, engine
+
+metrics_router = r = APIRouter()
+
+
+@r.get("/metrics/executor")
+async def read_executor_metrics(
+    current_user: models.User = Depends(get_current_active_superuser)
+):
+    """
+    Get the workers, queue depth and task counters of the process pool
+    running CPU-bound dataset and report work (admin only)
+    """
+    return process_pool.metrics()
+
+
+@r.get("/metrics/db-pool")
+async def read_db_pool_metrics(
+    current_user: models.User = Depends(get_current_active_superuser)
+):
+    """
+    Get the connections in use, overflow connections and checkout wait
+    times of the database pool, and the threads and asyncpg connections
+    sharing it (admin only)
+    """
+    return {
+        "sync": {"threads": DB_THREADS, **engine.pool.metrics()},
+        "async": async_engine.metrics(),
+    }
+
+
+@r.get("/metrics/audit")
+async def read_audit_metrics(
+    current_user: models.User = Depends(get_current_active_superuser)
+):
+    """
+    Get the entries queued and written by the audit log writer (admin only)
+    """
+    return audit_sink.metrics()
@@ -1,20 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, BackgroundTasks
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import io
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
-from app.db.session import get_db
-from app.db import crud, schemas, models
+from app import jobs
+from app.db.session import AsyncSession, get_async_db, get_db
+from app.db import crud, crud_async, pagination, schemas, models
 from app.core.auth import get_current_active_user, get_current_active_superuser
+from app.core.executor import process_pool
 
 reports_router = r = APIRouter()
 
 
 @r.post("/reports", response_model=schemas.ReportOut)
-async def create_report(
+def create_report(
     request: Request,
     report: schemas.ReportCreate,
     db: Session = Depends(get_db),
@@ -43,15 +44,20 @@ async def create_report(
 @r.get("/reports", response_model=List[schemas.ReportOut])
 async def read_reports(
     request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """
-    Get all reports (created by user or public)
+    Get all reports (created by user or public). Pass the X-Next-Cursor
+    header of a page as cursor to get the next one
     """
-    reports = crud.get_reports(db, skip, limit, current_user.id)
+    reports = await crud_async.get_reports(db, skip, limit, current_user.id, cursor)
+    total = await crud_async.count_reports(db, current_user.id)
+    pagination.set_page_headers(response, reports, limit, total=total)
     return reports
 
 
@@ -59,18 +65,18 @@ async def read_reports(
 async def read_report(
     request: Request,
     report_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """
     Get a specific report by ID
     """
-    report = crud.get_report(db, report_id, current_user.id)
+    report = await crud_async.get_report(db, report_id, current_user.id)
     return report
 
 
 @r.put("/reports/{report_id}", response_model=schemas.ReportOut)
-async def update_report(
+def update_report(
     request: Request,
     report_id: int,
     report: schemas.ReportEdit,
@@ -97,7 +103,7 @@ async def update_report(
 
 
 @r.delete("/reports/{report_id}", response_model=schemas.ReportOut)
-async def delete_report(
+def delete_report(
     request: Request,
     report_id: int,
     db: Session = Depends(get_db),
@@ -133,40 +139,18 @@ async def export_report_pdf(
     Export a report as PDF
     """
     # Get the report
-    report = crud.get_report(db, report_id, current_user.id)
-    
-    # Create a PDF using ReportLab
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    
-    # Add title
-    c.setFont("Helvetica-Bold", 18)
-    c.drawString(50, height - 50, report.name)
-    
-    # Add description if available
-    if report.description:
-        c.setFont("Helvetica", 12)
-        c.drawString(50, height - 80, report.description)
+    report = await run_in_threadpool(crud.get_report, db, report_id, current_user.id)
     
-    # Add content if available (simplified, actual implementation would need HTML->PDF conversion)
-    if report.content:
-        c.setFont("Helvetica", 10)
-        # Very simple text rendering, in a real implementation you'd use a HTML->PDF converter
-        y_position = height - 120
-        for line in report.content.split('\n'):
-            c.drawString(50, y_position, line[:80])  # Truncate long lines
-            y_position -= 15
-            if y_position < 50:  # Start a new page if we run out of space
-                c.showPage()
-                y_position = height - 50
-    
-    c.showPage()
-    c.save()
-    buffer.seek(0)
+    # Render the PDF in the process pool, off the event loop
+    pdf = await process_pool.run(
+        jobs.render_report_pdf, report.name, report.description, report.content,
+        request=request
+    )
+    buffer = io.BytesIO(pdf)
     
     # Log the action
-    crud.log_action(
+    await run_in_threadpool(
+        crud.log_action,
         db, 
         current_user.id, 
         "EXPORT", 
@@ -186,21 +170,25 @@ async def export_report_pdf(
 @r.get("/datasets/{dataset_id}/reports", response_model=List[schemas.ReportOut])
 async def get_dataset_reports(
     dataset_id: int,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """
-    Get all reports for a specific dataset
+    Get all reports for a specific dataset. Pass the X-Next-Cursor header
+    of a page as cursor to get the next one
     """
     # Check if user has access to the dataset
-    dataset = crud.get_dataset(db, dataset_id, current_user.id)
+    dataset = await crud_async.get_dataset(db, dataset_id, current_user.id)
     
     # Get reports for this dataset
-    reports = db.query(models.Report).filter(
-        models.Report.dataset_id == dataset_id,
-        (models.Report.creator_id == current_user.id) | (models.Report.is_public == True)
-    ).offset(skip).limit(limit).all()
+    reports = await crud_async.get_dataset_reports(
+        db, dataset_id, skip, limit, current_user.id, cursor
+    )
+    total = await crud_async.count_dataset_reports(db, dataset_id, current_user.id)
+    pagination.set_page_headers(response, reports, limit, total=total)
     
     return reports
\ No newline at end of file
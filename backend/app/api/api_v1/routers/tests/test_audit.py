@@ -0,0 +1,92 @@
+import csv
+import datetime
+import gzip
+import io
+import json
+
+from app.db import models, pagination
+
+
+def add_logs(test_db, user_id, count, timestamp=datetime.datetime(2026, 10, 1)):
+    # Same timestamp for all, pages are split on id
+    for i in range(count):
+        test_db.add(models.AuditLog(
+            action="UPDATE", entity_type="Dataset", entity_id=i,
+            timestamp=timestamp, user_id=user_id,
+        ))
+    test_db.commit()
+
+
+def read_pages(client, url, headers, limit):
+    pages, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = client.get(url, params=params, headers=headers)
+        assert response.status_code == 200
+        pages.append([log["id"] for log in response.json()])
+        cursor = response.headers.get(pagination.NEXT_CURSOR_HEADER)
+        if not cursor:
+            return pages
+
+
+def test_audit_logs_cursor(client, superuser_token_headers, test_superuser, test_db):
+    add_logs(test_db, test_superuser.id, 5)
+    add_logs(test_db, test_superuser.id, 2, datetime.datetime(2026, 10, 2))
+
+    pages = read_pages(client, "/api/v1/audit-logs", superuser_token_headers, 3)
+    ids = [i for page in pages for i in page]
+    assert [len(page) for page in pages] == [3, 3, 1]
+    logs = test_db.query(models.AuditLog).order_by(
+        models.AuditLog.timestamp.desc(), models.AuditLog.id.desc()
+    ).all()
+    assert ids == [log.id for log in logs]
+
+
+def test_my_activity_cursor(client, user_token_headers, test_user, test_superuser, test_db):
+    add_logs(test_db, test_user.id, 4)
+    add_logs(test_db, test_superuser.id, 3)
+
+    pages = read_pages(client, "/api/v1/audit-logs/my-activity", user_token_headers, 2)
+    # A full last page is followed by an empty one
+    assert [len(page) for page in pages] == [2, 2, 0]
+
+
+def test_invalid_cursor(client, superuser_token_headers):
+    response = client.get(
+        "/api/v1/audit-logs", params={"cursor": "not-a-cursor"}, headers=superuser_token_headers
+    )
+    assert response.status_code == 400
+
+
+def test_export_audit_logs(client, superuser_token_headers, test_superuser, test_user, test_db):
+    add_logs(test_db, test_user.id, 3)
+    add_logs(test_db, test_superuser.id, 2, datetime.datetime(2026, 10, 2))
+
+    response = client.get(
+        "/api/v1/audit-logs/export",
+        params={"user_id": test_user.id},
+        headers=superuser_token_headers,
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    logs = [json.loads(line) for line in response.text.splitlines()]
+    assert [log["entity_id"] for log in logs] == [0, 1, 2]
+    assert logs[0]["timestamp"] == "2026-10-01T00:00:00"
+
+    response = client.get(
+        "/api/v1/audit-logs/export",
+        params={"format": "csv", "start": "2026-10-02T00:00:00", "gzip": True},
+        headers=superuser_token_headers,
+    )
+    assert response.headers["content-type"] == "application/gzip"
+    assert "audit_logs.csv.gz" in response.headers["content-disposition"]
+    rows = list(csv.reader(io.StringIO(gzip.decompress(response.content).decode())))
+    assert rows[0] == ["id", "action", "entity_type", "entity_id", "details",
+                       "ip_address", "timestamp", "user_id"]
+    # Exports are logged, this one and the previous are in the range
+    assert [row[2] for row in rows[1:]] == ["Dataset", "Dataset", "AuditLog", "AuditLog"]
+
+
+def test_export_audit_logs_forbidden(client, user_token_headers):
+    response = client.get("/api/v1/audit-logs/export", headers=user_token_headers)
+    assert response.status_code == 403
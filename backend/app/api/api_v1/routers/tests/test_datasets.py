@@ -0,0 +1,564 @@
+import io
+import os
+
+import openpyxl
+import pytest
+
+from app.core import config
+from app.core.celery_app import celery_app
+from app.datasets import storage
+from app.db import crud, models
+
+CSV = b"region,amount,units\nnorth,1.5,1\nsouth,,2\nnorth,4.5,3\n"
+
+
+@pytest.fixture
+def data_dirs(tmp_path, monkeypatch, test_db):
+    monkeypatch.setattr(config, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(config, "DATASET_STORE_DIR", str(tmp_path / "store"))
+
+    # Run ingest jobs inline, on the test database
+    def send_task(name, args=None, **kwargs):
+        assert name == "app.tasks.ingest_dataset"
+        try:
+            crud.ingest_dataset(test_db, *args)
+        except Exception:
+            pass  # Recorded on the dataset, as in the worker
+
+    monkeypatch.setattr(celery_app, "send_task", send_task)
+    return tmp_path
+
+
+def upload(client, headers, name="sales.csv", content=CSV):
+    return client.post(
+        "/api/v1/datasets",
+        params={"name": "sales", "file_type": "csv"},
+        files={"file": (name, content)},
+        headers=headers,
+    )
+
+
+def test_create_dataset(client, user_token_headers, data_dirs):
+    response = upload(client, user_token_headers)
+    assert response.status_code == 202
+    job = response.json()
+    assert job["job_id"]
+
+    response = client.get(
+        f"/api/v1/datasets/{job['id']}/status", headers=user_token_headers
+    )
+    assert response.json()["status"] == "profiled"
+    assert response.json()["progress"] == 1.0
+
+    response = client.get(
+        f"/api/v1/datasets/{job['id']}", headers=user_token_headers
+    )
+    dataset = response.json()
+    assert dataset["row_count"] == 3
+    assert dataset["column_count"] == 3
+    assert [(c["name"], c["data_type"]) for c in dataset["columns"]] == [
+        ("region", "object"),
+        ("amount", "float32"),
+        ("units", "int8"),
+    ]
+
+
+def test_create_dataset_unsupported_type(client, user_token_headers, data_dirs):
+    response = upload(client, user_token_headers, "notes.txt", b"hello")
+    assert response.status_code == 400
+    assert list(data_dirs.iterdir()) == []
+
+
+def test_preview_dataset(client, user_token_headers, data_dirs):
+    dataset_id = upload(client, user_token_headers).json()["id"]
+
+    response = client.get(
+        f"/api/v1/datasets/{dataset_id}/preview",
+        params={"n_rows": 2},
+        headers=user_token_headers,
+    )
+    assert response.status_code == 200
+    assert response.json()[0] == {"region": "north", "amount": 1.5, "units": 1}
+    assert len(response.json()) == 2
+
+
+def test_analyze_dataset(client, user_token_headers, data_dirs):
+    dataset_id = upload(client, user_token_headers).json()["id"]
+
+    response = client.get(
+        f"/api/v1/datasets/{dataset_id}/analyze", headers=user_token_headers
+    )
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["mode"] == "exact"
+    assert stats["missing_values"] == {"amount": 1}
+    assert stats["data_types"] == {
+        "region": "object",
+        "amount": "float32",
+        "units": "int8",
+    }
+    assert stats["summary"]["amount"]["mean"] == 3.0
+    assert stats["summary"]["units"]["max"] == 3.0
+
+
+def test_ingest_failure_is_recorded(client, user_token_headers, data_dirs):
+    response = upload(client, user_token_headers, content=b'a\n"x\n')
+    dataset_id = response.json()["id"]
+
+    response = client.get(
+        f"/api/v1/datasets/{dataset_id}/status", headers=user_token_headers
+    )
+    assert response.json()["status"] == "failed"
+    assert response.json()["error"]
+
+    response = client.get(
+        f"/api/v1/datasets/{dataset_id}/analyze", headers=user_token_headers
+    )
+    assert response.status_code == 409
+
+
+def test_analyze_dataset_is_cached_per_version(
+    client, user_token_headers, data_dirs, test_db
+):
+    dataset_id = upload(client, user_token_headers).json()["id"]
+    url = f"/api/v1/datasets/{dataset_id}/analyze"
+
+    # Computed at ingest and served from the cache, even without the store
+    storage.delete_store(dataset_id)
+    stats = client.get(url, headers=user_token_headers).json()
+    assert stats["missing_values"] == {"amount": 1}
+
+    # A new version of the data invalidates the cached statistics
+    dataset = test_db.query(models.Dataset).get(dataset_id)
+    dataset.version += 1
+    test_db.commit()
+    with open(dataset.file_path, "wb") as f:
+        f.write(b"amount\n1\n")
+    stats = client.get(url, headers=user_token_headers).json()
+    assert stats["data_types"] == {"amount": "int64"}
+
+
+def test_analyze_dataset_approx(client, user_token_headers, data_dirs):
+    dataset_id = upload(client, user_token_headers).json()["id"]
+
+    response = client.get(
+        f"/api/v1/datasets/{dataset_id}/analyze",
+        params={"mode": "approx", "sample": 100},
+        headers=user_token_headers,
+    )
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["mode"] == "approx"
+    assert stats["sample_size"] == 3
+    assert stats["summary"]["units"]["mean"] == 2.0
+    assert "units" in stats["confidence_intervals"]["summary"]
+
+
+def test_preview_dataset_offset(client, user_token_headers, data_dirs):
+    content = b"n\n" + b"".join(b"%d\n" % i for i in range(5000))
+    dataset_id = upload(client, user_token_headers, content=content).json()["id"]
+    url = f"/api/v1/datasets/{dataset_id}/preview"
+
+    response = client.get(
+        url, params={"offset": 4998, "n_rows": 5}, headers=user_token_headers
+    )
+    assert response.json() == [{"n": 4998}, {"n": 4999}]
+
+    # Raw file fallback, through the row index built during the upload
+    storage.delete_store(dataset_id)
+    response = client.get(
+        url, params={"offset": 2500, "n_rows": 2}, headers=user_token_headers
+    )
+    assert response.json() == [{"n": 2500}, {"n": 2501}]
+
+
+def test_query_dataset(client, user_token_headers, data_dirs):
+    dataset_id = upload(client, user_token_headers).json()["id"]
+    url = f"/api/v1/datasets/{dataset_id}/query"
+
+    response = client.post(
+        url,
+        json={
+            "group_by": ["region"],
+            "aggregates": [{"func": "sum", "column": "units", "alias": "total"}],
+            "order_by": [{"column": "total", "desc": True}],
+        },
+        headers=user_token_headers,
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "columns": ["region", "total"],
+        "rows": [{"region": "north", "total": 4}, {"region": "south", "total": 2}],
+        "row_count": 2,
+    }
+
+    response = client.post(
+        url,
+        json={"aggregates": [{"func": "mean", "column": "region"}]},
+        headers=user_token_headers,
+    )
+    assert response.status_code == 400
+
+
+def test_column_profile(client, user_token_headers, data_dirs):
+    dataset_id = upload(client, user_token_headers).json()["id"]
+    url = f"/api/v1/datasets/{dataset_id}/columns/{{}}/profile"
+
+    response = client.get(url.format("region"), headers=user_token_headers)
+    assert response.status_code == 200
+    assert response.json()["top_k"] == [
+        {"value": "north", "count": 2}, {"value": "south", "count": 1}
+    ]
+
+    profile = client.get(url.format("units"), headers=user_token_headers).json()
+    assert profile["data_type"] == "int8"
+    assert sum(profile["equi_width"]["counts"]) == 3
+
+    response = client.get(url.format("missing"), headers=user_token_headers)
+    assert response.status_code == 404
+
+
+def test_create_dataset_indexes_upload(client, user_token_headers, data_dirs, test_db):
+    dataset = upload(client, user_token_headers).json()
+
+    db_dataset = crud.get_dataset(test_db, dataset["id"])
+    assert db_dataset.file_name == "sales.csv"
+    uploads = data_dirs / "uploads"
+    assert sorted(p.name for p in uploads.iterdir()) == [
+        os.path.basename(db_dataset.file_path),
+        os.path.basename(db_dataset.file_path) + ".rowidx.npz",
+    ]
+
+
+def test_uploads_of_the_same_name_are_kept_apart(client, user_token_headers, data_dirs):
+    first = upload(client, user_token_headers).json()["id"]
+    second = upload(
+        client, user_token_headers, content=b"region,amount,units\nwest,9.0,9\n"
+    ).json()["id"]
+    outside = upload(client, user_token_headers, name="../../outside.csv")
+    assert outside.status_code == 202
+
+    previews = [
+        client.get(f"/api/v1/datasets/{i}/preview", headers=user_token_headers).json()
+        for i in (first, second)
+    ]
+    assert [len(rows) for rows in previews] == [3, 1]
+    assert not (data_dirs / "outside.csv").exists()
+    assert len(list((data_dirs / "uploads").glob("*.csv"))) == 3
+
+
+def test_failed_uploads_leave_no_file(client, user_token_headers, data_dirs, monkeypatch):
+    response = upload(
+        client, user_token_headers, name="broken.xlsx", content=b"not a workbook"
+    )
+    assert response.status_code == 400
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("database is down")
+
+    monkeypatch.setattr(crud, "create_dataset", fail)
+    with pytest.raises(RuntimeError):
+        upload(client, user_token_headers)
+
+    assert list((data_dirs / "uploads").iterdir()) == []
+
+
+def test_failed_replace_keeps_previous_version(
+    client, user_token_headers, data_dirs, monkeypatch
+):
+    dataset_id = upload(client, user_token_headers).json()["id"]
+    url = f"/api/v1/datasets/{dataset_id}"
+    uploads = sorted((data_dirs / "uploads").iterdir())
+
+    response = client.put(
+        f"{url}/file",
+        files={"file": ("sales.xlsx", b"not a workbook")},
+        headers=user_token_headers,
+    )
+    assert response.status_code == 400
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(storage, "save_version", fail)
+    with pytest.raises(RuntimeError):
+        client.put(
+            f"{url}/file",
+            files={"file": ("sales.csv", CSV)},
+            headers=user_token_headers,
+        )
+
+    assert sorted((data_dirs / "uploads").iterdir()) == uploads
+    dataset = client.get(url, headers=user_token_headers).json()
+    assert (dataset["version"], dataset["status"]) == (1, "profiled")
+    rows = client.get(f"{url}/preview", headers=user_token_headers).json()
+    assert len(rows) == 3
+
+
+def test_append_rows(client, user_token_headers, data_dirs):
+    dataset_id = upload(client, user_token_headers).json()["id"]
+    url = f"/api/v1/datasets/{dataset_id}/append"
+    client.get(f"/api/v1/datasets/{dataset_id}/analyze", headers=user_token_headers)
+
+    response = client.post(
+        url,
+        data=b"region,amount,units\neast,2.0,4\n",
+        headers={**user_token_headers, "Content-Type": "text/csv"},
+    )
+    assert response.status_code == 200
+    assert response.json()["row_count"] == 4
+
+    response = client.post(
+        url,
+        json=[{"region": "north", "amount": None, "units": 5}],
+        headers=user_token_headers,
+    )
+    assert response.json()["row_count"] == 5
+
+    stats = client.get(
+        f"/api/v1/datasets/{dataset_id}/analyze", headers=user_token_headers
+    ).json()
+    assert stats["summary"]["units"]["count"] == 5.0
+    assert stats["summary"]["units"]["max"] == 5.0
+    assert stats["missing_values"] == {"amount": 2}
+
+    profile = client.get(
+        f"/api/v1/datasets/{dataset_id}/columns/region/profile",
+        headers=user_token_headers,
+    ).json()
+    assert profile["top_k"][0] == {"value": "north", "count": 3}
+
+    response = client.post(
+        url, json=[{"region": "west"}], headers=user_token_headers
+    )
+    assert response.status_code == 400
+
+
+def test_append_rows_rejects_values_that_do_not_fit(
+    client, user_token_headers, data_dirs
+):
+    dataset_id = upload(client, user_token_headers).json()["id"]
+    url = f"/api/v1/datasets/{dataset_id}"
+
+    for body, content_type in [
+        (b"region,amount,units\neast,2.0,99999999999999999999\n", "text/csv"),
+        (
+            b'[{"region": "east", "amount": 2.0, "units": 99999999999999999999}]',
+            "application/json",
+        ),
+        (b"region,amount,units\neast,2.0,four\n", "text/csv"),
+        (b'[{"region": "east", "amount": "two", "units": 4}]', "application/json"),
+    ]:
+        response = client.post(
+            f"{url}/append",
+            data=body,
+            headers={**user_token_headers, "Content-Type": content_type},
+        )
+        assert response.status_code == 400
+
+    dataset = client.get(url, headers=user_token_headers).json()
+    assert (dataset["version"], dataset["row_count"]) == (1, 3)
+
+
+def test_append_rows_widens_columns(client, user_token_headers, data_dirs):
+    dataset_id = upload(client, user_token_headers).json()["id"]
+    url = f"/api/v1/datasets/{dataset_id}"
+
+    # units was stored as int8, 300 and -200 must not wrap around
+    response = client.post(
+        f"{url}/append",
+        data=b"region,amount,units\neast,2.0,300\nwest,1.0,-200\n",
+        headers={**user_token_headers, "Content-Type": "text/csv"},
+    )
+    assert response.status_code == 200
+    assert ("units", "int16") in [
+        (c["name"], c["data_type"]) for c in response.json()["columns"]
+    ]
+
+    rows = client.get(f"{url}/preview", headers=user_token_headers).json()
+    assert [row["units"] for row in rows] == [1, 2, 3, 300, -200]
+    rows = client.get(
+        f"{url}/preview", params={"version": 1}, headers=user_token_headers
+    ).json()
+    assert [row["units"] for row in rows] == [1, 2, 3]
+
+
+def test_replace_dataset_file(client, user_token_headers, data_dirs):
+    dataset_id = upload(client, user_token_headers).json()["id"]
+
+    response = client.put(
+        f"/api/v1/datasets/{dataset_id}/file",
+        files={"file": ("sales.csv", CSV + b"east,2.0,4\n")},
+        headers=user_token_headers,
+    )
+    assert response.status_code == 202
+    assert response.json()["status"] == "profiled"
+    assert response.json()["row_count"] == 4
+
+    versions = client.get(
+        f"/api/v1/datasets/{dataset_id}/versions", headers=user_token_headers
+    ).json()
+    assert [(v["version"], v["row_count"]) for v in versions] == [(1, 3), (2, 4)]
+
+    url = f"/api/v1/datasets/{dataset_id}/preview"
+    assert len(client.get(url, headers=user_token_headers).json()) == 4
+    response = client.get(url, params={"version": 1}, headers=user_token_headers)
+    assert len(response.json()) == 3
+    response = client.get(url, params={"version": 3}, headers=user_token_headers)
+    assert response.status_code == 404
+
+
+def test_create_dataset_from_workbook(client, user_token_headers, data_dirs):
+    workbook = openpyxl.Workbook()
+    workbook.active.title = "north"
+    for row in [["city", "units"], ["lille", 1], ["caen", 2]]:
+        workbook.active.append(row)
+    south = workbook.create_sheet("south")
+    for row in [["city", "units"], ["nice", 3]]:
+        south.append(row)
+    content = io.BytesIO()
+    workbook.save(content)
+
+    response = upload(
+        client, user_token_headers, name="sales.xlsx", content=content.getvalue()
+    )
+    assert response.status_code == 202
+    dataset_id = response.json()["id"]
+
+    sheets = client.get(
+        f"/api/v1/datasets/{dataset_id}/sheets", headers=user_token_headers
+    ).json()
+    assert [(s["sheet_name"], s["status"], s["row_count"]) for s in sheets] == [
+        ("north", "profiled", 2),
+        ("south", "profiled", 1),
+    ]
+
+    response = client.get(
+        f"/api/v1/datasets/{sheets[1]['id']}/preview", headers=user_token_headers
+    )
+    assert response.json() == [{"city": "nice", "units": 3}]
+
+
+
+def workbook_content(*titles):
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for title in titles:
+        sheet = workbook.create_sheet(title)
+        for row in [["city", "units"], ["lille", 1]]:
+            sheet.append(row)
+    content = io.BytesIO()
+    workbook.save(content)
+    return content.getvalue()
+
+
+def test_replace_workbook_keeps_sheet(client, user_token_headers, data_dirs):
+    response = upload(
+        client, user_token_headers, name="sales.xlsx",
+        content=workbook_content("north", "south"),
+    )
+    sheets = client.get(
+        f"/api/v1/datasets/{response.json()['id']}/sheets", headers=user_token_headers
+    ).json()
+    url = f"/api/v1/datasets/{sheets[1]['id']}"
+    uploads = sorted((data_dirs / "uploads").iterdir())
+
+    for name, content in [
+        ("sales.xlsx", workbook_content("north")),
+        ("sales.csv", CSV),
+    ]:
+        response = client.put(
+            f"{url}/file", files={"file": (name, content)}, headers=user_token_headers
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"] == "The uploaded file has no sheet named south."
+    assert sorted((data_dirs / "uploads").iterdir()) == uploads
+
+    response = client.put(
+        f"{url}/file",
+        files={"file": ("sales.xlsx", workbook_content("south", "north"))},
+        headers=user_token_headers,
+    )
+    assert response.status_code == 202
+    dataset = client.get(url, headers=user_token_headers).json()
+    assert (dataset["version"], dataset["status"]) == (2, "profiled")
+    assert dataset["sheet_name"] == "south"
+
+def test_memory_footprint(client, user_token_headers, data_dirs):
+    content = b"city,day,units\n" + b"".join(
+        b"%s,2024-01-%02d,%d\n" % (city, day, day)
+        for day in range(1, 29)
+        for city in (b"paris", b"lyon")
+    )
+    dataset_id = upload(client, user_token_headers, content=content).json()["id"]
+
+    dataset = client.get(
+        f"/api/v1/datasets/{dataset_id}", headers=user_token_headers
+    ).json()
+    assert [c["data_type"] for c in dataset["columns"]] == [
+        "category", "datetime64[ns]", "int8"
+    ]
+
+    memory = client.get(
+        f"/api/v1/datasets/{dataset_id}/memory", headers=user_token_headers
+    ).json()
+    assert memory["row_count"] == 56
+    assert memory["bytes_after"] < memory["bytes_before"]
+    assert [(c["dtype_before"], c["bytes_after"]) for c in memory["columns"]][1:] == [
+        ("object", 56 * 8), ("int64", 56)
+    ]
+
+    response = client.post(
+        f"/api/v1/datasets/{dataset_id}/query",
+        json={
+            "filters": [{"column": "day", "op": "ge", "value": "2024-01-27"}],
+            "group_by": ["city"],
+            "aggregates": [{"func": "sum", "column": "units"}],
+            "order_by": [{"column": "city"}],
+        },
+        headers=user_token_headers,
+    )
+    assert response.json()["rows"] == [
+        {"city": "lyon", "sum_units": 55}, {"city": "paris", "sum_units": 55}
+    ]
+
+
+def test_list_datasets_cursor(client, user_token_headers, test_user, test_superuser, test_db):
+    def add(owner, is_public):
+        dataset = models.Dataset(
+            name="sales", file_path="sales.csv", file_type="csv",
+            owner_id=owner.id, is_public=is_public,
+        )
+        test_db.add(dataset)
+        test_db.commit()
+        return dataset.id
+
+    visible = [
+        add(test_user, False),
+        add(test_superuser, True),
+        add(test_user, True),
+        add(test_superuser, True),
+        add(test_user, False),
+    ]
+    add(test_superuser, False)
+
+    pages, cursor = [], None
+    while True:
+        response = client.get(
+            "/api/v1/datasets",
+            params={"limit": 2, **({"cursor": cursor} if cursor else {})},
+            headers=user_token_headers,
+        )
+        assert response.status_code == 200
+        assert response.headers["X-Total-Count"] == "5"
+        pages.append([d["id"] for d in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert pages == [visible[:2], visible[2:4], visible[4:]]
+
+    # Offsets still apply, after the cursor if given
+    response = client.get(
+        "/api/v1/datasets", params={"skip": 1, "limit": 2}, headers=user_token_headers
+    )
+    assert [d["id"] for d in response.json()] == visible[1:3]
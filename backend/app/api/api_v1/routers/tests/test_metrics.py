@@ -0,0 +1,28 @@
+def test_executor_metrics(client, superuser_token_headers):
+    response = client.get("/api/v1/metrics/executor", headers=superuser_token_headers)
+    assert response.status_code == 200
+    metrics = response.json()
+    assert metrics["workers"] >= 1
+    assert {"queue_depth", "running", "submitted", "timed_out"} <= set(metrics)
+
+
+def test_executor_metrics_forbidden(client, user_token_headers):
+    response = client.get("/api/v1/metrics/executor", headers=user_token_headers)
+    assert response.status_code == 403
+
+
+def test_db_pool_metrics(client, superuser_token_headers):
+    response = client.get("/api/v1/metrics/db-pool", headers=superuser_token_headers)
+    assert response.status_code == 200
+    metrics = response.json()
+    assert {"in_use", "overflow", "checkouts", "wait_seconds"} <= set(metrics["sync"])
+    assert metrics["sync"]["threads"] >= metrics["sync"]["size"]
+    assert "max_size" in metrics["async"]
+
+
+def test_audit_metrics(client, superuser_token_headers):
+    response = client.get("/api/v1/metrics/audit", headers=superuser_token_headers)
+    assert response.status_code == 200
+    metrics = response.json()
+    assert metrics["sync"] is True
+    assert {"queued", "queue_size", "written", "batches", "failures"} <= set(metrics)
@@ -108,3 +108,23 @@ def test_unauthorized_routes(client, user_token_headers):
     assert response.status_code == 403
     response = client.get("/api/v1/users/123", headers=user_token_headers)
     assert response.status_code == 403
+
+
+def test_get_users_range(client, test_superuser, test_user, superuser_token_headers):
+    response = client.get(
+        "/api/v1/users", params={"range": "[1, 9]"}, headers=superuser_token_headers
+    )
+    assert response.status_code == 200
+    assert [u["id"] for u in response.json()] == [test_user.id]
+    assert response.headers["Content-Range"] == "users 1-1/2"
+
+    response = client.get(
+        "/api/v1/users", params={"range": "[5, 9]"}, headers=superuser_token_headers
+    )
+    assert response.json() == []
+    assert response.headers["Content-Range"] == "users */2"
+
+    response = client.get(
+        "/api/v1/users", params={"range": "[3, 1]"}, headers=superuser_token_headers
+    )
+    assert response.status_code == 400
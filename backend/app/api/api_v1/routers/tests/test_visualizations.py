@@ -0,0 +1,165 @@
+import json
+
+from app.db import models
+
+from .test_datasets import data_dirs, upload  # noqa: F401
+
+
+def create_visualization(client, headers, dataset_id, type="bar", **config):
+    response = client.post(
+        "/api/v1/visualizations",
+        json={
+            "name": "sales by region",
+            "type": type,
+            "config": json.dumps({"type": type, **config}),
+            "dataset_id": dataset_id,
+        },
+        headers=headers,
+    )
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def test_visualization_data(client, user_token_headers, data_dirs, test_db):
+    dataset_id = upload(client, user_token_headers).json()["id"]
+    viz_id = create_visualization(
+        client,
+        user_token_headers,
+        dataset_id,
+        xAxis="region",
+        yAxis="units",
+        aggregation="sum",
+    )
+    url = f"/api/v1/visualizations/{viz_id}/data"
+
+    response = client.get(url, headers=user_token_headers)
+    assert response.status_code == 200
+    assert response.json() == {
+        "type": "bar",
+        "labels": ["north", "south"],
+        "datasets": [{"label": "units", "data": [4, 2]}],
+        "truncated": False,
+        "total": 2,
+    }
+    assert test_db.query(models.VisualizationData).count() == 1
+
+    # Served from the cache until the visualization or the data changes
+    cached = test_db.query(models.VisualizationData).one()
+    cached.data = json.dumps({"type": "bar", "cached": True})
+    test_db.commit()
+    assert client.get(url, headers=user_token_headers).json()["cached"]
+
+    client.put(
+        f"/api/v1/visualizations/{viz_id}",
+        json={
+            "name": "units by region",
+            "type": "bar",
+            "config": json.dumps(
+                {"xAxis": "region", "yAxis": "units", "aggregation": "count"}
+            ),
+        },
+        headers=user_token_headers,
+    )
+    response = client.get(url, headers=user_token_headers)
+    assert response.json()["datasets"] == [{"label": "units", "data": [2, 1]}]
+    assert test_db.query(models.VisualizationData).count() == 1
+
+
+def test_visualization_data_invalid_config(
+    client, user_token_headers, data_dirs
+):
+    dataset_id = upload(client, user_token_headers).json()["id"]
+    viz_id = create_visualization(
+        client, user_token_headers, dataset_id, xAxis="region", yAxis="missing"
+    )
+
+    response = client.get(
+        f"/api/v1/visualizations/{viz_id}/data", headers=user_token_headers
+    )
+    assert response.status_code == 400
+
+
+def test_visualization_data_downsampled(
+    client, user_token_headers, data_dirs, test_db
+):
+    content = b"t,v\n" + b"".join(b"%d,%d\n" % (i, i % 7) for i in range(200))
+    dataset_id = upload(client, user_token_headers, content=content).json()["id"]
+    viz_id = create_visualization(
+        client, user_token_headers, dataset_id, type="line", xAxis="t", yAxis="v"
+    )
+    url = f"/api/v1/visualizations/{viz_id}/data"
+
+    response = client.get(url, params={"points": 10}, headers=user_token_headers)
+    assert response.status_code == 200
+    assert len(response.json()["labels"]) == 10
+    assert len(client.get(url, headers=user_token_headers).json()["labels"]) == 200
+
+    # Each set of parameters is cached separately
+    assert test_db.query(models.VisualizationData).count() == 2
+
+
+def test_visualization_pinned_version(client, user_token_headers, data_dirs):
+    dataset_id = upload(client, user_token_headers).json()["id"]
+    client.post(
+        f"/api/v1/datasets/{dataset_id}/append",
+        json=[{"region": "south", "amount": 1.0, "units": 10}],
+        headers=user_token_headers,
+    )
+    versions = client.get(
+        f"/api/v1/datasets/{dataset_id}/versions", headers=user_token_headers
+    ).json()
+
+    response = client.post(
+        "/api/v1/visualizations",
+        json={
+            "name": "sales by region",
+            "type": "bar",
+            "config": json.dumps({"xAxis": "region", "yAxis": "units"}),
+            "dataset_id": dataset_id,
+            "dataset_version_id": versions[0]["id"],
+        },
+        headers=user_token_headers,
+    )
+    assert response.json()["dataset_version_id"] == versions[0]["id"]
+    url = f"/api/v1/visualizations/{response.json()['id']}/data"
+
+    data = client.get(url, headers=user_token_headers).json()
+    assert data["datasets"][0]["data"] == [4, 2]
+    data = client.get(url, params={"version": 2}, headers=user_token_headers).json()
+    assert data["datasets"][0]["data"] == [4, 12]
+
+    # Versions of another dataset cannot be pinned
+    other_id = upload(client, user_token_headers).json()["id"]
+    response = client.post(
+        "/api/v1/visualizations",
+        json={
+            "name": "other",
+            "type": "bar",
+            "config": "{}",
+            "dataset_id": other_id,
+            "dataset_version_id": versions[0]["id"],
+        },
+        headers=user_token_headers,
+    )
+    assert response.status_code == 400
+
+
+def test_dataset_visualizations_cursor(client, user_token_headers, data_dirs):
+    dataset_id = upload(client, user_token_headers).json()["id"]
+    viz_ids = [
+        create_visualization(client, user_token_headers, dataset_id, xAxis="region")
+        for _ in range(3)
+    ]
+    url = f"/api/v1/datasets/{dataset_id}/visualizations"
+
+    response = client.get(url, params={"limit": 2}, headers=user_token_headers)
+    assert [v["id"] for v in response.json()] == viz_ids[:2]
+    assert response.headers["X-Total-Count"] == "3"
+
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get(url, params={"limit": 2, "cursor": cursor}, headers=user_token_headers)
+    assert [v["id"] for v in response.json()] == viz_ids[2:]
+    assert "X-Next-Cursor" not in response.headers
+
+    response = client.get(f"/api/v1/datasets/{dataset_id + 1}/visualizations", headers=user_token_headers)
+    assert response.status_code == 404
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Request, Depends, Response, encoders
+from fastapi import APIRouter, Request, Depends, HTTPException, Query, Response, encoders
+import json
 import typing as t
 
 from app.db.session import get_db
 from app.db.crud import (
     get_users,
+    count_users,
     get_user,
     create_user,
     delete_user,
@@ -20,22 +22,34 @@ users_router = r = APIRouter()
     response_model=t.List[User],
     response_model_exclude_none=True,
 )
-async def users_list(
+def users_list(
     response: Response,
+    positions: t.Optional[str] = Query(None, alias="range"),
     db=Depends(get_db),
     current_user=Depends(get_current_active_superuser),
 ):
     """
-    Get all users
+    Get all users, or those of range, [first, last] positions as sent by
+    react-admin
     """
-    users = get_users(db)
+    first, last = 0, 99
+    if positions:
+        try:
+            first, last = (int(i) for i in json.loads(positions))
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid range")
+        if first < 0 or last < first:
+            raise HTTPException(status_code=400, detail="Invalid range")
+    users = get_users(db, skip=first, limit=last - first + 1)
     # This is necessary for react-admin to work
-    response.headers["Content-Range"] = f"0-9/{len(users)}"
+    total = count_users(db)
+    returned = f"{first}-{first + len(users) - 1}" if users else "*"
+    response.headers["Content-Range"] = f"users {returned}/{total}"
     return users
 
 
 @r.get("/users/me", response_model=User, response_model_exclude_none=True)
-async def user_me(current_user=Depends(get_current_active_user)):
+def user_me(current_user=Depends(get_current_active_user)):
     """
     Get own user
     """
@@ -47,7 +61,7 @@ async def user_me(current_user=Depends(get_current_active_user)):
     response_model=User,
     response_model_exclude_none=True,
 )
-async def user_details(
+def user_details(
     request: Request,
     user_id: int,
     db=Depends(get_db),
@@ -64,7 +78,7 @@ async def user_details(
 
 
 @r.post("/users", response_model=User, response_model_exclude_none=True)
-async def user_create(
+def user_create(
     request: Request,
     user: UserCreate,
     db=Depends(get_db),
@@ -79,7 +93,7 @@ async def user_create(
 @r.put(
     "/users/{user_id}", response_model=User, response_model_exclude_none=True
 )
-async def user_edit(
+def user_edit(
     request: Request,
     user_id: int,
     user: UserEdit,
@@ -95,7 +109,7 @@ async def user_edit(
 @r.delete(
     "/users/{user_id}", response_model=User, response_model_exclude_none=True
 )
-async def user_delete(
+def user_delete(
     request: Request,
     user_id: int,
     db=Depends(get_db),
@@ -1,16 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
-from app.db.session import get_db
-from app.db import crud, schemas, models
+from app.db.session import AsyncSession, get_async_db, get_db
+from app.db import crud, crud_async, pagination, schemas, models
 from app.core.auth import get_current_active_user, get_current_active_superuser
 
 visualizations_router = r = APIRouter()
 
 
 @r.post("/visualizations", response_model=schemas.VisualizationOut)
-async def create_visualization(
+def create_visualization(
         request: Request,
         visualization: schemas.VisualizationCreate,
         db: Session = Depends(get_db),
@@ -38,15 +38,20 @@ async def create_visualization(
 @r.get("/visualizations", response_model=List[schemas.VisualizationOut])
 async def read_visualizations(
     request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """
-    Get all visualizations (created by user or public)
+    Get all visualizations (created by user or public). Pass the
+    X-Next-Cursor header of a page as cursor to get the next one
     """
-    visualizations = crud.get_visualizations(db, skip, limit, current_user.id)
+    visualizations = await crud_async.get_visualizations(db, skip, limit, current_user.id, cursor)
+    total = await crud_async.count_visualizations(db, current_user.id)
+    pagination.set_page_headers(response, visualizations, limit, total=total)
     return visualizations
 
 
@@ -54,18 +59,39 @@ async def read_visualizations(
 async def read_visualization(
     request: Request,
     viz_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """
     Get a specific visualization by ID
     """
-    visualization = crud.get_visualization(db, viz_id, current_user.id)
+    visualization = await crud_async.get_visualization(db, viz_id, current_user.id)
     return visualization
 
 
+@r.get("/visualizations/{viz_id}/data")
+def read_visualization_data(
+    request: Request,
+    viz_id: int,
+    points: Optional[int] = Query(None, ge=3, le=100000),
+    downsample: str = Query("lttb", regex="^(lttb|minmax)$"),
+    version: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """
+    Get the series a visualization draws, computed on the server from its
+    config and dataset. Line and scatter series are reduced to at most
+    `points` points each, with Largest-Triangle-Three-Buckets (lttb) or the
+    minimum and maximum of every pair of pixels (minmax). The data is read
+    from the given dataset version, else the pinned or the latest one
+    """
+    data = crud.get_visualization_data(db, viz_id, current_user.id, points, downsample, version)
+    return data
+
+
 @r.put("/visualizations/{viz_id}", response_model=schemas.VisualizationOut)
-async def update_visualization(
+def update_visualization(
     request: Request,
     viz_id: int,
     visualization: schemas.VisualizationEdit,
@@ -92,7 +118,7 @@ async def update_visualization(
 
 
 @r.delete("/visualizations/{viz_id}", response_model=schemas.VisualizationOut)
-async def delete_visualization(
+def delete_visualization(
     request: Request,
     viz_id: int,
     db: Session = Depends(get_db),
@@ -120,21 +146,25 @@ async def delete_visualization(
 @r.get("/datasets/{dataset_id}/visualizations", response_model=List[schemas.VisualizationOut])
 async def get_dataset_visualizations(
     dataset_id: int,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """
-    Get all visualizations for a specific dataset
+    Get all visualizations for a specific dataset. Pass the X-Next-Cursor
+    header of a page as cursor to get the next one
     """
     # Check if user has access to the dataset
-    dataset = crud.get_dataset(db, dataset_id, current_user.id)
+    dataset = await crud_async.get_dataset(db, dataset_id, current_user.id)
     
     # Get visualizations for this dataset
-    visualizations = db.query(models.Visualization).filter(
-        models.Visualization.dataset_id == dataset_id,
-        (models.Visualization.creator_id == current_user.id) | (models.Visualization.is_public == True)
-    ).offset(skip).limit(limit).all()
+    visualizations = await crud_async.get_dataset_visualizations(
+        db, dataset_id, skip, limit, current_user.id, cursor
+    )
+    total = await crud_async.count_dataset_visualizations(db, dataset_id, current_user.id)
+    pagination.set_page_headers(response, visualizations, limit, total=total)
     
     return visualizations
\ No newline at end of file
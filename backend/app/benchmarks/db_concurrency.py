@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Latency of the API under concurrent, mixed, database-bound traffic.
+
+Run against a running server, before and after a change, e.g.
+
+    python -m app.benchmarks.db_concurrency --url http://localhost:8888 \\
+        --email admin@projet-esic.com --password admin --concurrency 64
+
+Every client repeatedly picks a request from MIX and the latency of each is
+recorded; p50, p95 and p99 are reported per endpoint and overall.
+"""
+import argparse
+import asyncio
+import random
+import time
+import typing as t
+
+import httpx
+import numpy as np
+
+# Read endpoints hit by the clients, with their relative weights
+MIX = [
+    ("GET", "/api/v1/users/me", 4),
+    ("GET", "/api/v1/datasets", 3),
+    ("GET", "/api/v1/visualizations", 2),
+    ("GET", "/api/v1/reports", 2),
+    ("GET", "/api/v1/audit-logs/my-activity", 1),
+]
+
+
+async def login(client: httpx.AsyncClient, email: str, password: str) -> str:
+    response = await client.post(
+        "/api/token", data={"username": email, "password": password}
+    )
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def worker(
+    client: httpx.AsyncClient,
+    headers: t.Dict[str, str],
+    deadline: float,
+    latencies: t.Dict[str, t.List[float]],
+    errors: t.Dict[str, int],
+) -> None:
+    paths = [path for _, path, _ in MIX]
+    weights = [weight for _, _, weight in MIX]
+    while time.monotonic() < deadline:
+        path = random.choices(paths, weights)[0]
+        start = time.perf_counter()
+        try:
+            response = await client.get(path, headers=headers)
+            failed = response.status_code >= 400
+        except httpx.HTTPError:
+            failed = True
+        latencies[path].append(time.perf_counter() - start)
+        errors[path] += failed
+
+
+def report(latencies: t.Dict[str, t.List[float]], errors: t.Dict[str, int],
+           duration: float) -> None:
+    rows = list(latencies.items()) + [
+        ("all", [x for values in latencies.values() for x in values])
+    ]
+    print(f"{'endpoint':40} {'requests':>9} {'errors':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for path, values in rows:
+        if not values:
+            continue
+        p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+        failed = sum(errors.values()) if path == "all" else errors[path]
+        print(f"{path:40} {len(values):9d} {failed:7d} "
+              f"{p50:8.1f} {p95:8.1f} {p99:8.1f}")
+    print(f"throughput: {len(rows[-1][1]) / duration:.0f} requests/s")
+
+
+async def main(args: argparse.Namespace) -> None:
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=args.url, timeout=60, limits=limits
+    ) as client:
+        token = await login(client, args.email, args.password)
+        headers = {"Authorization": f"Bearer {token}"}
+        latencies: t.Dict[str, t.List[float]] = {path: [] for _, path, _ in MIX}
+        errors = {path: 0 for _, path, _ in MIX}
+
+        deadline = time.monotonic() + args.duration
+        await asyncio.gather(*(
+            worker(client, headers, deadline, latencies, errors)
+            for _ in range(args.concurrency)
+        ))
+    report(latencies, errors, args.duration)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://localhost:8888")
+    parser.add_argument("--email", default="admin@projet-esic.com")
+    parser.add_argument("--password", default="admin")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=30,
+                        help="seconds of traffic")
+    asyncio.run(main(parser.parse_args()))
@@ -2,13 +2,13 @@ import jwt
 from fastapi import Depends, HTTPException, status
 from jwt import PyJWTError
 
-from app.db import models, schemas, session
+from app.db import crud_async, models, schemas, session
 from app.db.crud import get_user_by_email, create_user
 from app.core import security
 
 
 async def get_current_user(
-    db=Depends(session.get_db), token: str = Depends(security.oauth2_scheme)
+    db=Depends(session.get_async_db), token: str = Depends(security.oauth2_scheme)
 ):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -26,7 +26,7 @@ async def get_current_user(
         token_data = schemas.TokenData(email=email, permissions=permissions)
     except PyJWTError:
         raise credentials_exception
-    user = get_user_by_email(db, token_data.email)
+    user = await crud_async.get_user_by_email(db, token_data.email)
     if user is None:
         raise credentials_exception
     return user
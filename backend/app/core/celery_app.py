@@ -1,5 +1,13 @@
 from celery import Celery
+from celery.schedules import crontab
 
 celery_app = Celery("worker", broker="redis://redis:6379/0")
 
 celery_app.conf.task_routes = {"app.tasks.*": "main-queue"}
+
+celery_app.conf.beat_schedule = {
+    "audit-log-maintenance": {
+        "task": "app.tasks.audit_log_maintenance",
+        "schedule": crontab(hour=3, minute=0),
+    },
+}
@@ -3,5 +3,56 @@ import os
 PROJECT_NAME = "Projet ESIC"
 
 SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+# Test connections before use, and replace them after this many seconds
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+# Connections of the asyncpg pool serving the async read paths of the API,
+# and seconds a statement waits for one of them before a 503
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", 10))
+ASYNC_DB_ACQUIRE_TIMEOUT = float(os.getenv("ASYNC_DB_ACQUIRE_TIMEOUT", 10))
 
 API_V1_STR = "/api/v1"
+
+# Dataset ingestion
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "data/uploads")
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+INGEST_CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", 100000))
+ROW_INDEX_EVERY = int(os.getenv("ROW_INDEX_EVERY", 1000))
+DATASET_STORE_DIR = os.getenv("DATASET_STORE_DIR", "data/store")
+SEGMENT_ROWS = int(os.getenv("SEGMENT_ROWS", 1000000))
+PROFILE_BINS = int(os.getenv("PROFILE_BINS", 20))
+PROFILE_TOP_K = int(os.getenv("PROFILE_TOP_K", 20))
+
+# Process pool running CPU-bound request work off the event loop
+PROCESS_POOL_WORKERS = int(os.getenv("PROCESS_POOL_WORKERS", os.cpu_count() or 1))
+PROCESS_POOL_TIMEOUT = float(os.getenv("PROCESS_POOL_TIMEOUT", 60))
+PROCESS_POOL_START_METHOD = os.getenv("PROCESS_POOL_START_METHOD", "forkserver")
+
+# Write-behind audit log: entries are queued and written in batches of
+# AUDIT_BATCH_SIZE, or AUDIT_FLUSH_INTERVAL seconds after the first of a
+# batch. AUDIT_SYNC writes each entry at once, in the session of the caller
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", 500))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", 1.0))
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", 10000))
+AUDIT_ENQUEUE_TIMEOUT = float(os.getenv("AUDIT_ENQUEUE_TIMEOUT", 0.5))
+AUDIT_SYNC = os.getenv("AUDIT_SYNC", "false").lower() == "true"
+# Retries of a batch that failed, AUDIT_FLUSH_INTERVAL seconds apart at first
+# and twice as long each time, before its entries are written one by one
+AUDIT_WRITE_RETRIES = int(os.getenv("AUDIT_WRITE_RETRIES", 5))
+
+# Monthly audit_log partitions created ahead, and months of entries kept
+# before their partition is rolled up into daily counts and dropped
+AUDIT_PARTITIONS_AHEAD = int(os.getenv("AUDIT_PARTITIONS_AHEAD", 3))
+AUDIT_RETENTION_MONTHS = int(os.getenv("AUDIT_RETENTION_MONTHS", 12))
+
+# Totals of listings are counted exactly below this many rows, and taken
+# from the estimate of the query planner above
+COUNT_EXACT_BELOW = int(os.getenv("COUNT_EXACT_BELOW", 10000))
+
+# Streamed exports: rows fetched from the server-side cursor at a time,
+# and bytes of encoded rows sent to the client at a time
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", 5000))
+EXPORT_CHUNK_BYTES = int(os.getenv("EXPORT_CHUNK_BYTES", 64 * 1024))
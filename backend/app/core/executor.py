@@ -0,0 +1,190 @@
+"""
+Process pool for CPU-bound request work.
+
+pandas and reportlab hold the GIL for most of their work, so running them
+in a route handler, or in the thread pool, stalls every other request. Route
+handlers submit such work to `process_pool` instead and await its result:
+
+    stats = await process_pool.run(jobs.analyze, path, request=request)
+
+The pool is started and stopped with the app, and started on first use
+otherwise. Every task has a timeout (504) and is given up on when the client
+disconnects (499). A task no worker has picked up is cancelled, one running
+keeps its worker busy until it ends and its result is dropped.
+
+Submitted functions and their arguments are pickled: they must be defined
+at module level, and must not rely on state of the web process such as
+config changed at runtime or database sessions.
+"""
+import asyncio
+import multiprocessing
+import threading
+import time
+import typing as t
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.core import config
+
+# Seconds between two checks of whether the client is still connected
+DISCONNECT_POLL = 0.25
+
+# Status of requests whose client went away, as nginx logs them
+CLIENT_CLOSED_REQUEST = 499
+
+
+async def _disconnected(request: Request) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL)
+
+
+class ProcessPool:
+    """ProcessPoolExecutor with timeouts, cancellation and usage counters"""
+
+    def __init__(
+        self,
+        workers: t.Optional[int] = None,
+        timeout: t.Optional[float] = None,
+        start_method: t.Optional[str] = None,
+    ):
+        self.workers = workers or config.PROCESS_POOL_WORKERS
+        self.timeout = timeout or config.PROCESS_POOL_TIMEOUT
+        self.start_method = start_method or config.PROCESS_POOL_START_METHOD
+        self._executor: t.Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending: t.Dict[Future, float] = {}
+        self.counters = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "timed_out": 0,
+            "disconnected": 0,
+        }
+        self.task_seconds = 0.0
+
+    @property
+    def started(self) -> bool:
+        return self._executor is not None
+
+    def start(self) -> None:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                )
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the workers, cancelling the tasks still queued"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            pending = list(self._pending)
+        if executor is not None:
+            # What shutdown(cancel_futures=True) does from Python 3.9 on.
+            # Tasks already handed to a worker cannot be cancelled and run
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=wait)
+
+    def submit(self, func: t.Callable, *args: t.Any, **kwargs: t.Any) -> Future:
+        self.start()
+        try:
+            future = self._executor.submit(func, *args, **kwargs)
+        except BrokenProcessPool:
+            # A worker died, e.g. killed for its memory: start a new pool
+            self.shutdown(wait=False)
+            self.start()
+            future = self._executor.submit(func, *args, **kwargs)
+
+        with self._lock:
+            self.counters["submitted"] += 1
+            self._pending[future] = time.monotonic()
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Future) -> None:
+        with self._lock:
+            submitted = self._pending.pop(future, None)
+            if future.cancelled():
+                self.counters["cancelled"] += 1
+                return
+            if future.exception() is not None:
+                self.counters["failed"] += 1
+            else:
+                self.counters["completed"] += 1
+            if submitted is not None:
+                self.task_seconds += time.monotonic() - submitted
+
+    async def run(
+        self,
+        func: t.Callable,
+        *args: t.Any,
+        timeout: t.Optional[float] = None,
+        request: t.Optional[Request] = None,
+        **kwargs: t.Any,
+    ) -> t.Any:
+        """
+        Run func(*args, **kwargs) in a worker and return its result. Raises
+        a 504 after timeout seconds, the pool default if None, and a 499 when
+        the client of request disconnects first
+        """
+        timeout = self.timeout if timeout is None else timeout
+        result = asyncio.wrap_future(self.submit(func, *args, **kwargs))
+        waiters: t.Set[asyncio.Future] = {result}
+        disconnect = None
+        if request is not None:
+            disconnect = asyncio.ensure_future(_disconnected(request))
+            waiters.add(disconnect)
+
+        try:
+            done, _ = await asyncio.wait(
+                waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            if disconnect is not None:
+                disconnect.cancel()
+            # Also cancels the queued task, if it has not started yet
+            result.cancel()
+
+        if result in done:
+            return result.result()
+        if disconnect is not None and disconnect in done:
+            self._count("disconnected")
+            raise HTTPException(
+                status_code=CLIENT_CLOSED_REQUEST, detail="Client disconnected"
+            )
+        self._count("timed_out")
+        raise HTTPException(
+            status_code=504, detail=f"Task did not finish within {timeout:g} seconds"
+        )
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self.counters[counter] += 1
+
+    def metrics(self) -> t.Dict[str, t.Any]:
+        """Usage counters, and the tasks running and waiting for a worker"""
+        with self._lock:
+            pending = len(self._pending)
+            counters = dict(self.counters)
+            finished = counters["completed"] + counters["failed"]
+            task_seconds = self.task_seconds
+        # Futures are marked running once handed to the queue feeding the
+        # workers, which holds more tasks than there are workers
+        running = min(pending, self.workers)
+        return {
+            "started": self.started,
+            "workers": self.workers,
+            "timeout": self.timeout,
+            "running": running,
+            "queue_depth": pending - running,
+            **counters,
+            "mean_task_seconds": task_seconds / finished if finished else None,
+        }
+
+
+process_pool = ProcessPool()
@@ -0,0 +1,113 @@
+"""
+Summary statistics returned by /datasets/{id}/analyze.
+
+Both stored datasets and raw uploads are summarised with the streaming
+accumulators of app.datasets.stats, so memory stays bounded by the chunk size
+whatever the size of the dataset.
+"""
+import json
+import os
+import typing as t
+
+import numpy as np
+
+from app.core import config
+from app.datasets import ingest, sampling, stats
+from app.datasets.storage import DatasetStore, Segment
+
+SEGMENT_STATS = "stats.json"
+
+
+def segment_stats(
+    store: DatasetStore, segment: Segment
+) -> t.Dict[str, stats.ColumnStats]:
+    """
+    Accumulate every column of one segment of a store. The accumulators are
+    saved with the segment, which never changes once written, so merging
+    them again after rows are appended needs no scan of old segments.
+    """
+    path = os.path.join(segment.path, SEGMENT_STATS)
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+        return {
+            name: stats.ColumnStats.from_dict(data) for name, data in saved.items()
+        }
+    except FileNotFoundError:
+        pass
+
+    chunk_rows = config.INGEST_CHUNK_ROWS
+    columns = {}
+
+    for name, dtype in store.dtypes.items():
+        column = stats.ColumnStats(dtype)
+        values, dictionary = store.segment_column(segment, name)
+        if dictionary is not None:
+            column.update_encoded(values, dictionary)
+        else:
+            for start in range(0, len(values), chunk_rows):
+                column.update(values[start:start + chunk_rows])
+        columns[name] = column
+
+    with open(f"{path}.tmp", "w") as f:
+        json.dump({name: column.to_dict() for name, column in columns.items()}, f)
+    os.replace(f"{path}.tmp", path)
+    return columns
+
+
+def store_stats(store: DatasetStore) -> t.Dict[str, stats.ColumnStats]:
+    """Accumulate a store segment by segment and merge the results"""
+    return stats.merge_all(
+        segment_stats(store, segment) for segment in store.segments
+    )
+
+
+def analyze_store(store: DatasetStore) -> t.Dict[str, t.Any]:
+    """Compute the statistics of a stored dataset in a single pass"""
+    return stats.report(store_stats(store))
+
+
+def analyze_file(path: str, file_type: str) -> t.Dict[str, t.Any]:
+    """
+    Compute the statistics of an uploaded file chunk by chunk, for datasets
+    that have no columnar store
+    """
+    profile = ingest.profile_file(path, file_type)
+    columns = {
+        name: stats.ColumnStats(dtype) for name, dtype in profile.dtypes.items()
+    }
+
+    for chunk in ingest.iter_chunks(path, file_type, dtypes=profile.dtypes):
+        chunk.columns = [str(c) for c in chunk.columns]
+        for name, column in columns.items():
+            column.update(chunk[name].to_numpy())
+
+    return stats.report(columns)
+
+
+def analyze_store_sample(
+    store: DatasetStore,
+    sample_size: int,
+    confidence: float,
+    rng: t.Optional[np.random.Generator] = None,
+) -> t.Dict[str, t.Any]:
+    """Estimate the statistics of a stored dataset from a random sample"""
+    rng = rng or np.random.default_rng()
+    sample = sampling.sample_store(store, sample_size, rng)
+    return sampling.estimate(sample, store.dtypes, store.row_count, confidence)
+
+
+def analyze_file_sample(
+    path: str,
+    file_type: str,
+    sample_size: int,
+    confidence: float,
+    rng: t.Optional[np.random.Generator] = None,
+) -> t.Dict[str, t.Any]:
+    """Estimate the statistics of an uploaded file from a reservoir sample"""
+    rng = rng or np.random.default_rng()
+    profile = ingest.profile_file(path, file_type)
+    sample, row_count = sampling.reservoir_sample(
+        ingest.iter_chunks(path, file_type, dtypes=profile.dtypes), sample_size, rng
+    )
+    return sampling.estimate(sample, profile.dtypes, row_count, confidence)
@@ -0,0 +1,405 @@
+"""
+Server-side execution of Visualization.config.
+
+The config saved by the frontend is parsed and turned into exactly the series
+the chart draws, computed over the columnar store of the dataset:
+
+- bar, line and pie charts group by xAxis (and colorBy) and aggregate yAxis,
+- scatter charts select the xAxis/yAxis points,
+- histograms count the values of xAxis in `bins` equal-width bins,
+- tables return the first rows.
+
+Line and scatter series can be downsampled to a target number of points
+before they are serialised. Downsampled scatter series are reduced while the
+store is scanned, segment by segment, to the lowest and highest point of
+every series in each bucket of an equal-width grid over x, so that no row is
+left out. Series are returned in the labels/datasets shape of Chart.js.
+
+Series that are not downsampled are cut to MAX_GROUPS groups (grouped
+charts) or MAX_POINTS points (scatter charts). Their charts tell how many
+there are in `total`, and whether they were cut in `truncated`.
+"""
+import json
+import typing as t
+
+import numpy as np
+import pandas as pd
+
+from app.db import schemas
+from app.datasets.downsample import as_numeric, downsample
+from app.datasets.dtypes import physical_dtype
+from app.datasets.query import QueryError, execute, records, run_query, scan, validate
+from app.datasets.stats import null_mask
+from app.datasets.storage import DatasetStore
+
+GROUPED_CHARTS = ("bar", "line", "pie")
+CHART_TYPES = GROUPED_CHARTS + ("scatter", "histogram", "table")
+
+# Aggregations of the frontend, as query aggregates
+AGGREGATIONS = {
+    "sum": "sum",
+    "average": "mean",
+    "mean": "mean",
+    "count": "count",
+    "min": "min",
+    "max": "max",
+}
+
+DEFAULT_BINS = 20
+MAX_BINS = 1000
+MAX_GROUPS = 10000
+MAX_POINTS = 10000
+# Buckets of the x grid of a scatter series per point kept by lttb, whose
+# lowest and highest points lttb chooses from
+LTTB_BUCKETS_PER_POINT = 4
+TABLE_ROWS = 100
+
+_VALUE = "__value__"
+_BUCKET = "__bucket__"
+
+
+class ConfigError(ValueError):
+    """A visualization config that cannot be drawn"""
+
+
+class ChartConfig(t.NamedTuple):
+    type: str
+    x: t.Optional[str]
+    y: t.Optional[str]
+    color: t.Optional[str]
+    aggregation: str
+    bins: int
+
+
+def parse_config(viz_type: str, config: str) -> ChartConfig:
+    try:
+        data = json.loads(config) if config else {}
+    except ValueError:
+        raise ConfigError("Visualization config is not valid JSON")
+    if not isinstance(data, dict):
+        raise ConfigError("Visualization config must be a JSON object")
+
+    chart_type = viz_type or data.get("type")
+    if chart_type not in CHART_TYPES:
+        raise ConfigError(f"Unsupported chart type: {chart_type}")
+
+    aggregation = data.get("aggregation") or "sum"
+    if aggregation not in AGGREGATIONS:
+        raise ConfigError(f"Unsupported aggregation: {aggregation}")
+
+    bins = data.get("bins")
+    bins = DEFAULT_BINS if bins is None else bins
+    if not isinstance(bins, int) or not 1 <= bins <= MAX_BINS:
+        raise ConfigError(f"bins must be an integer between 1 and {MAX_BINS}")
+
+    spec = ChartConfig(
+        type=chart_type,
+        x=data.get("xAxis") or None,
+        y=data.get("yAxis") or None,
+        color=data.get("colorBy") or None,
+        aggregation=aggregation,
+        bins=bins,
+    )
+    if chart_type != "table" and spec.x is None:
+        raise ConfigError("Visualization config has no xAxis")
+    if chart_type == "scatter" and spec.y is None:
+        raise ConfigError("Visualization config has no yAxis")
+    if (
+        chart_type in GROUPED_CHARTS
+        and spec.y is None
+        and AGGREGATIONS[aggregation] != "count"
+    ):
+        raise ConfigError("Visualization config has no yAxis")
+    return spec
+
+
+def _downsample(
+    frame: pd.DataFrame,
+    spec: ChartConfig,
+    y: str,
+    points: int,
+    method: str,
+) -> pd.DataFrame:
+    """Keep at most `points` rows of every series of a frame sorted by x"""
+    if spec.color:
+        groups = list(
+            frame.groupby(spec.color, sort=False, dropna=False).indices.values()
+        )
+    else:
+        groups = [np.arange(len(frame))]
+
+    xs, ys = frame[spec.x].to_numpy(), frame[y].to_numpy()
+    keep = []
+    for rows in groups:
+        rows = rows[pd.notnull(xs[rows]) & pd.notnull(ys[rows])]
+        selected = downsample(
+            as_numeric(xs[rows]), as_numeric(ys[rows]), points, method
+        )
+        keep.append(rows[selected])
+    if not keep:
+        return frame
+    return frame.iloc[np.sort(np.concatenate(keep))]
+
+
+def _grouped(
+    store: DatasetStore,
+    spec: ChartConfig,
+    column_types: t.Dict[str, str],
+    points: t.Optional[int],
+    method: str,
+) -> t.Dict[str, t.Any]:
+    func = AGGREGATIONS[spec.aggregation]
+    keys = [spec.x] + ([spec.color] if spec.color else [])
+    downsampled = points is not None and spec.type == "line"
+    query = schemas.DatasetQuery(
+        group_by=keys,
+        aggregates=[{
+            "func": func,
+            "column": None if func == "count" else spec.y,
+            "alias": _VALUE,
+        }],
+        order_by=[{"column": spec.x}],
+    ).copy(update={"limit": max(store.row_count, 1)})
+    # Every group is aggregated anyway, keep them all to downsample or count
+    frame = execute(store, query, column_types)
+    total = len(frame)
+    if downsampled:
+        frame = _downsample(frame, spec, _VALUE, points, method)
+    else:
+        frame = frame.head(MAX_GROUPS)
+    rows = records(frame)
+    cut = {"truncated": not downsampled and len(frame) < total, "total": total}
+
+    labels = list(dict.fromkeys(row[spec.x] for row in rows))
+    if not spec.color:
+        return {
+            "labels": labels,
+            "datasets": [{
+                "label": spec.y or "count",
+                "data": [row[_VALUE] for row in rows],
+            }],
+            **cut,
+        }
+
+    # One series per colorBy value, aligned on the labels
+    position = {label: i for i, label in enumerate(labels)}
+    series: t.Dict[t.Any, t.List[t.Any]] = {}
+    for row in rows:
+        data = series.setdefault(row[spec.color], [None] * len(labels))
+        data[position[row[spec.x]]] = row[_VALUE]
+    return {
+        "labels": labels,
+        "datasets": [
+            {"label": label, "data": data} for label, data in series.items()
+        ],
+        **cut,
+    }
+
+
+def _value_range(
+    store: DatasetStore, column: str
+) -> t.Optional[t.Tuple[float, float]]:
+    """Lowest and highest value of a numeric or date column, as floats"""
+    index = store.column_index(column)
+    low, high = np.inf, -np.inf
+    for segment in store.segments:
+        zone = segment.zone_maps.get(index)
+        if zone is None:
+            # All missing, a date column, or written before zone maps existed
+            values, _ = store.segment_column(segment, column)
+            values = values[~null_mask(values)]
+            if not len(values):
+                continue
+            zone = as_numeric(np.array([values.min(), values.max()]))
+        low, high = min(low, zone[0]), max(high, zone[1])
+    return None if low > high else (float(low), float(high))
+
+
+def _extremes(frame: pd.DataFrame, keys: t.List[str], y: str) -> pd.DataFrame:
+    """Rows of the lowest and highest y of every group of keys"""
+    values = frame[y]
+    if values.dtype.kind == "M":
+        values = pd.Series(as_numeric(values.to_numpy()))
+    grouped = values.groupby([frame[key] for key in keys], sort=False, dropna=False)
+    rows = np.union1d(grouped.idxmin().to_numpy(), grouped.idxmax().to_numpy())
+    return frame.iloc[rows].reset_index(drop=True)
+
+
+def _scan_extremes(
+    store: DatasetStore,
+    spec: ChartConfig,
+    query: schemas.DatasetQuery,
+    column_types: t.Dict[str, str],
+    x_range: t.Tuple[float, float],
+    buckets: int,
+) -> t.Tuple[pd.DataFrame, int]:
+    """
+    Lowest and highest point of every series in each of `buckets` equal-width
+    buckets over x_range, from all the rows of the query, and their count
+    """
+    columns, predicates = validate(query, column_types)
+    keys = ([spec.color] if spec.color else []) + [_BUCKET]
+    low, high = x_range
+    span = high - low
+
+    kept, total = None, 0
+    for frame in scan(store, predicates, columns):
+        total += len(frame)
+        x = as_numeric(frame[spec.x].to_numpy())
+        if span > 0:
+            bucket = ((x - low) / span * buckets).astype(np.int64)
+        else:
+            bucket = np.zeros(len(frame), dtype=np.int64)
+        frame[_BUCKET] = np.clip(bucket, 0, buckets - 1)
+        if kept is not None:
+            frame = pd.concat([kept, frame], ignore_index=True)
+        kept = _extremes(frame, keys, spec.y)
+
+    if kept is None:
+        return pd.DataFrame(columns=columns), total
+    return kept.drop(columns=_BUCKET), total
+
+
+def _scatter(
+    store: DatasetStore,
+    spec: ChartConfig,
+    column_types: t.Dict[str, str],
+    points: t.Optional[int],
+    method: str,
+) -> t.Dict[str, t.Any]:
+    select = [spec.x, spec.y] + ([spec.color] if spec.color else [])
+    filters = [
+        {"column": spec.x, "op": "not_null"},
+        {"column": spec.y, "op": "not_null"},
+    ]
+    query = schemas.DatasetQuery(select=select, filters=filters).copy(
+        update={"limit": MAX_POINTS}
+    )
+
+    x_range = None
+    if points is not None and all(
+        physical_dtype(store.dtypes[column]).kind in "biufM"
+        for column in (spec.x, spec.y)
+    ):
+        x_range = _value_range(store, spec.x)
+    if x_range is not None:
+        buckets = max(points // 2, 1)
+        if method == "lttb":
+            buckets = points * LTTB_BUCKETS_PER_POINT
+        frame, total = _scan_extremes(
+            store, spec, query, column_types, x_range, buckets
+        )
+        truncated = False
+    else:
+        # Without a numeric x there is no grid to reduce the rows on
+        frame = execute(store, query, column_types)
+        total = len(frame)
+        if total == MAX_POINTS:
+            count = schemas.DatasetQuery(
+                filters=filters,
+                aggregates=[{"func": "count", "column": None, "alias": _VALUE}],
+            )
+            total = int(execute(store, count, column_types)[_VALUE][0])
+        truncated = total > len(frame)
+
+    if points is not None:
+        frame = frame.sort_values(spec.x, kind="mergesort", ignore_index=True)
+        if x_range is None or method == "lttb":
+            frame = _downsample(frame, spec, spec.y, points, method)
+
+    series: t.Dict[t.Any, t.List[t.Dict[str, t.Any]]] = {}
+    for row in records(frame):
+        label = row[spec.color] if spec.color else spec.y
+        series.setdefault(label, []).append({"x": row[spec.x], "y": row[spec.y]})
+    return {
+        "datasets": [
+            {"label": label, "data": data} for label, data in series.items()
+        ],
+        "truncated": truncated,
+        "total": total,
+    }
+
+
+def histogram(
+    store: DatasetStore, column: str, bins: int
+) -> t.Tuple[np.ndarray, np.ndarray]:
+    """Counts and edges of equal-width bins over a numeric column"""
+    if physical_dtype(store.dtypes[column]).kind not in "iuf":
+        raise QueryError(f"Cannot bin non-numeric column {column}")
+
+    value_range = _value_range(store, column)
+    if value_range is None:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+    edges = np.histogram_bin_edges([], bins=bins, range=value_range)
+    counts = np.zeros(bins, dtype=np.int64)
+    for segment in store.segments:
+        values, _ = store.segment_column(segment, column)
+        counts += np.histogram(values[~null_mask(values)], bins=edges)[0]
+    return counts, edges
+
+
+def _histogram(
+    store: DatasetStore,
+    spec: ChartConfig,
+    profile: t.Optional[t.Dict[str, t.Any]],
+) -> t.Dict[str, t.Any]:
+    if (
+        profile is not None
+        and profile.get("kind") == "number"
+        and len(profile["equi_width"]["counts"]) == spec.bins
+    ):
+        # Precomputed at ingest, no scan needed
+        counts = np.asarray(profile["equi_width"]["counts"])
+        edges = np.asarray(profile["equi_width"]["edges"])
+    else:
+        counts, edges = histogram(store, spec.x, spec.bins)
+    return {
+        "labels": [f"{a:g} - {b:g}" for a, b in zip(edges[:-1], edges[1:])],
+        "bins": edges.tolist(),
+        "datasets": [{"label": spec.x, "data": counts.tolist()}],
+    }
+
+
+def _table(
+    store: DatasetStore, spec: ChartConfig, column_types: t.Dict[str, str]
+) -> t.Dict[str, t.Any]:
+    select = [c for c in (spec.x, spec.y, spec.color) if c]
+    result = run_query(
+        store,
+        schemas.DatasetQuery(select=select, limit=TABLE_ROWS),
+        column_types,
+    )
+    return {"columns": result["columns"], "rows": result["rows"]}
+
+
+def chart_data(
+    store: DatasetStore,
+    viz_type: str,
+    config: str,
+    column_types: t.Dict[str, str],
+    points: t.Optional[int] = None,
+    method: str = "lttb",
+    profiles: t.Optional[t.Dict[str, t.Dict[str, t.Any]]] = None,
+) -> t.Dict[str, t.Any]:
+    """
+    Compute the series of a visualization, line and scatter series reduced
+    to at most `points` per series with the given downsampling method.
+    Histograms are read from the column profiles when they have the bins
+    asked for. Raises ConfigError for configs that cannot be drawn and
+    QueryError when they do not fit the columns.
+    """
+    spec = parse_config(viz_type, config)
+    for column in (spec.x, spec.y, spec.color):
+        if column is not None and column not in column_types:
+            raise QueryError(f"Unknown column: {column}")
+
+    if spec.type in GROUPED_CHARTS:
+        data = _grouped(store, spec, column_types, points, method)
+    elif spec.type == "scatter":
+        data = _scatter(store, spec, column_types, points, method)
+    elif spec.type == "histogram":
+        data = _histogram(store, spec, (profiles or {}).get(spec.x))
+    else:
+        data = _table(store, spec, column_types)
+    return {"type": spec.type, **data}
@@ -0,0 +1,90 @@
+"""
+Downsampling of line and scatter series to a target number of points.
+
+Both methods return the positions of the points to keep, so every column of
+a series can be subset alike. x must be sorted in ascending order.
+
+- lttb keeps the shape of a line: Largest-Triangle-Three-Buckets picks in
+  every bucket the point forming the largest triangle with the point kept in
+  the bucket before and the average of the bucket after.
+- minmax keeps the extremes: the x range is cut into equal-width buckets,
+  one per pair of pixels, and the lowest and highest point of each is kept.
+"""
+import typing as t
+
+import numpy as np
+
+METHODS = ("lttb", "minmax")
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # The first and last points are always kept, the others are split into
+    # threshold - 2 buckets [edges[b], edges[b + 1])
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    sizes = np.diff(edges)
+    x_avg = np.add.reduceat(x[:n - 1], edges[:-1]) / sizes
+    y_avg = np.add.reduceat(y[:n - 1], edges[:-1]) / sizes
+    # Third vertex of each bucket: the average of the next bucket
+    next_x = np.append(x_avg[1:], x[-1])
+    next_y = np.append(y_avg[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for b in range(threshold - 2):
+        lo, hi = edges[b], edges[b + 1]
+        area = np.abs(
+            (x[a] - next_x[b]) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (next_y[b] - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        selected[b + 1] = a
+    return selected
+
+
+def minmax(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    buckets = max(threshold // 2, 1)
+
+    span = x[-1] - x[0]
+    if span > 0:
+        bucket = ((x - x[0]) / span * buckets).astype(np.int64)
+        bucket = np.minimum(bucket, buckets - 1)
+    else:
+        bucket = np.zeros(n, dtype=np.int64)
+
+    # Sorted by bucket then y: the first and last of each bucket are its
+    # minimum and maximum
+    order = np.lexsort((y, bucket))
+    sorted_buckets = bucket[order]
+    starts = np.flatnonzero(np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1]])
+    ends = np.r_[starts[1:], n] - 1
+    return np.unique(np.concatenate([order[starts], order[ends]]))
+
+
+def downsample(
+    x: np.ndarray, y: np.ndarray, threshold: int, method: str = "lttb"
+) -> np.ndarray:
+    """Positions of at most threshold points of a series sorted by x"""
+    if method not in METHODS:
+        raise ValueError(f"Unknown downsampling method: {method}")
+    return lttb(x, y, threshold) if method == "lttb" else minmax(x, y, threshold)
+
+
+def as_numeric(values: t.Any) -> np.ndarray:
+    """x values as floats: dates as nanoseconds, other values by position"""
+    values = np.asarray(values)
+    if values.dtype.kind == "M":
+        return values.astype("datetime64[ns]").astype(np.int64).astype(np.float64)
+    if values.dtype.kind in "iufb":
+        return values.astype(np.float64)
+    return np.arange(len(values), dtype=np.float64)
@@ -0,0 +1,232 @@
+"""
+Compact physical types chosen at ingest.
+
+The profiling pass over a file feeds every chunk to a DtypeOptimizer, which
+picks for every column the smallest type holding all of its values:
+
+- integers are downcast to the smallest signed integer type,
+- floats become float32 when every value converts without loss,
+- strings that all are dates in one of DATE_FORMATS become datetime64[ns],
+- strings with few distinct values become categoricals. In the store they
+  are dictionary encoded like every string column, and loaded as pandas
+  categoricals instead of arrays of Python strings.
+
+It also reports the memory a DataFrame of the file takes with the types
+pandas infers and with the optimized ones. Rows appended later may not fit
+these types, widen_dtype gives the wider type a column then takes.
+"""
+import datetime
+import re
+import sys
+import typing as t
+
+import numpy as np
+import pandas as pd
+
+CATEGORY = "category"
+
+# Strings become categoricals when they have at most this many distinct
+# values, and at most this fraction of their values are distinct
+CATEGORY_MAX_VALUES = 10000
+CATEGORY_MAX_RATIO = 0.5
+
+# Values tried as dates before a whole chunk is parsed
+DATE_PROBE = 100
+
+# Formats of the strings read as dates, with the pattern a string must match
+# in full. pandas alone also reads strings such as "1.2.3", and "now" or
+# "today" as the time of the ingest, even given a format
+DATE_FORMATS = (
+    (
+        "%Y-%m-%d",
+        re.compile(r"\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d{1,9})?)?)?"),
+    ),
+    ("%d/%m/%Y", re.compile(r"\d{2}/\d{2}/\d{4}")),
+)
+
+INTEGER_TYPES = (np.int8, np.int16, np.int32, np.int64)
+POINTER_SIZE = np.dtype(object).itemsize
+
+
+def physical_dtype(dtype: str) -> np.dtype:
+    """numpy dtype of the values of a column, categoricals hold objects"""
+    return np.dtype(object) if dtype == CATEGORY else np.dtype(dtype)
+
+
+def to_dates(values: pd.Series) -> pd.Series:
+    """
+    Values as datetime64[ns], NaT where a value is missing, or neither a
+    date nor a string in one of DATE_FORMATS
+    """
+    if values.dtype.kind == "M":
+        return values.astype("datetime64[ns]")
+    dates = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    if values.dtype != object or not len(values):
+        return dates
+    is_date = values.map(lambda v: isinstance(v, datetime.date)).astype(bool)
+    if is_date.any():
+        dates[is_date] = pd.to_datetime(values[is_date])
+    for date_format, pattern in DATE_FORMATS:
+        matches = values.map(
+            lambda v: isinstance(v, str) and pattern.fullmatch(v) is not None
+        ).astype(bool)
+        if matches.any():
+            dates[matches] = pd.to_datetime(
+                values[matches], format=date_format, errors="coerce"
+            )
+    return dates
+
+
+def _parse_dates(values: pd.Series) -> bool:
+    """Whether every value is a date, or a string in one of DATE_FORMATS"""
+    for sample in (values[:DATE_PROBE], values):
+        if to_dates(sample).isna().any():
+            return False
+    return True
+
+
+def integer_dtype(low: int, high: int) -> t.Optional[str]:
+    """Smallest signed integer type holding low to high, None if none does"""
+    for candidate in INTEGER_TYPES:
+        info = np.iinfo(candidate)
+        if info.min <= low and high <= info.max:
+            return np.dtype(candidate).name
+    return None
+
+
+def _float32_exact(numbers: np.ndarray) -> bool:
+    """Whether numbers convert to float32 without loss"""
+    exact = numbers.astype(np.float32).astype(np.float64)
+    return bool(np.array_equal(exact, numbers.astype(np.float64), equal_nan=True))
+
+
+def widen_dtype(dtype: str, values: np.ndarray) -> str:
+    """
+    Type of a stored column of type dtype once numbers are appended to it:
+    dtype when it holds all of them, else the smallest wider type of the
+    same kind that does. Raises ValueError when none does
+    """
+    kind = physical_dtype(dtype).kind
+    if not len(values) or kind not in "iuf":
+        return dtype
+    if kind in "iu":
+        info = np.iinfo(dtype)
+        low, high = int(values.min()), int(values.max())
+        if info.min <= low and high <= info.max:
+            return dtype
+        wider = integer_dtype(min(low, info.min), max(high, info.max))
+        if wider is None:
+            raise ValueError(f"Values {low} to {high} do not fit {dtype}")
+        return wider
+    if dtype == "float32" and not _float32_exact(values):
+        return "float64"
+    return dtype
+
+
+def _codes_size(categories: int) -> int:
+    """Item size of the codes of a pandas categorical"""
+    for dtype in INTEGER_TYPES:
+        if categories < np.iinfo(dtype).max:
+            return np.dtype(dtype).itemsize
+    return 8
+
+
+class _Column:
+    def __init__(self):
+        self.rows = 0
+        self.count = 0
+        self.bytes = 0
+        self.min: t.Optional[int] = None
+        self.max: t.Optional[int] = None
+        self.float32 = True
+        self.dates = True
+        # Memory of every distinct string, None once there are too many
+        self.values: t.Optional[t.Dict[t.Any, int]] = {}
+
+    def update(self, values: pd.Series, size: int) -> None:
+        self.rows += len(values)
+        self.bytes += size
+        present = values[values.notna()]
+        self.count += len(present)
+        if not len(present):
+            return
+
+        kind = values.dtype.kind
+        if kind in "iuf":
+            numbers = present.to_numpy()
+            self.dates = False
+            if kind in "iu":
+                low, high = int(numbers.min()), int(numbers.max())
+                self.min = low if self.min is None else min(self.min, low)
+                self.max = high if self.max is None else max(self.max, high)
+            if self.float32:
+                self.float32 = _float32_exact(numbers)
+        elif kind == "O":
+            if self.dates:
+                self.dates = _parse_dates(present)
+            if self.values is not None:
+                for value in present.unique():
+                    self.values.setdefault(value, sys.getsizeof(value))
+                if len(self.values) > CATEGORY_MAX_VALUES:
+                    self.values = None
+        else:
+            self.dates = False
+
+    def optimize(self, dtype: str) -> t.Tuple[str, int]:
+        """Smallest type for a column inferred as dtype, and its memory"""
+        kind = np.dtype(dtype).kind
+        if kind in "iu" and self.min is not None:
+            candidate = integer_dtype(self.min, self.max)
+            if candidate is not None:
+                return candidate, self.rows * np.dtype(candidate).itemsize
+        if kind == "f" and self.float32 and self.count:
+            return "float32", self.rows * 4
+        if kind == "O" and self.count:
+            if self.dates:
+                return "datetime64[ns]", self.rows * 8
+            if (
+                self.values is not None
+                and len(self.values) <= self.count * CATEGORY_MAX_RATIO
+            ):
+                categories = sum(self.values.values()) + POINTER_SIZE * len(self.values)
+                return CATEGORY, self.rows * _codes_size(len(self.values)) + categories
+        return dtype, self.bytes
+
+
+class DtypeOptimizer:
+    """Accumulate the chunks of a file to pick compact column types"""
+
+    def __init__(self):
+        self.columns: t.Dict[str, _Column] = {}
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        usage = chunk.memory_usage(deep=True, index=False)
+        for name in chunk.columns:
+            column = self.columns.setdefault(str(name), _Column())
+            column.update(chunk[name], int(usage[name]))
+
+    def optimize(
+        self, dtypes: t.Dict[str, str]
+    ) -> t.Tuple[t.Dict[str, str], t.Dict[str, t.Any]]:
+        """
+        Optimized types of columns inferred as dtypes, and the memory report
+        of the file with both
+        """
+        optimized: t.Dict[str, str] = {}
+        columns = []
+        for name, dtype in dtypes.items():
+            column = self.columns.get(name, _Column())
+            optimized[name], size = column.optimize(dtype)
+            columns.append({
+                "name": name,
+                "dtype_before": dtype,
+                "dtype_after": optimized[name],
+                "bytes_before": column.bytes,
+                "bytes_after": size,
+            })
+        memory = {
+            "bytes_before": sum(c["bytes_before"] for c in columns),
+            "bytes_after": sum(c["bytes_after"] for c in columns),
+            "columns": columns,
+        }
+        return optimized, memory
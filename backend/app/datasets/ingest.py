@@ -0,0 +1,378 @@
+"""
+Streaming ingestion of uploaded dataset files.
+
+Uploads are copied to disk in fixed-size chunks and profiled with a chunked
+parse, so peak memory is bounded by the chunk sizes instead of the file size.
+XLSX sheets are streamed row by row with openpyxl's read-only mode instead of
+loading the whole workbook.
+"""
+import hashlib
+import io
+import json
+import os
+import typing as t
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from app.core import config
+from app.datasets import storage
+from app.datasets.dtypes import DtypeOptimizer, physical_dtype, to_dates, widen_dtype
+
+SUPPORTED_FILE_TYPES = ("csv", "xlsx", "xls")
+
+
+Progress = t.Callable[[float], None]
+
+
+class FileProfile(t.NamedTuple):
+    row_count: int
+    dtypes: t.Dict[str, str]  # As inferred by pandas
+    optimized: t.Dict[str, str] = {}  # Compact types the file is stored with
+    memory: t.Dict[str, t.Any] = {}  # Memory footprint with both
+
+
+def save_upload(
+    source: t.BinaryIO,
+    destination: str,
+    chunk_size: t.Optional[int] = None,
+    on_chunk: t.Optional[t.Callable[[bytes], None]] = None,
+) -> t.Tuple[int, str]:
+    """
+    Copy a file object to disk chunk by chunk and return the number of bytes
+    written and the SHA-256 of the content. on_chunk sees every chunk, e.g.
+    to index the file in the same pass.
+    """
+    chunk_size = chunk_size or config.UPLOAD_CHUNK_SIZE
+    os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+
+    size = 0
+    digest = hashlib.sha256()
+    with open(destination, "wb") as f:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            f.write(chunk)
+            digest.update(chunk)
+            if on_chunk:
+                on_chunk(chunk)
+            size += len(chunk)
+
+    return size, digest.hexdigest()
+
+
+def sheet_names(path: str, file_type: str) -> t.List[str]:
+    """Names of the sheets of a workbook, read without loading any cell"""
+    if file_type == "xlsx":
+        workbook = openpyxl.load_workbook(path, read_only=True)
+        try:
+            return list(workbook.sheetnames)
+        finally:
+            workbook.close()
+    if file_type == "xls":
+        with pd.ExcelFile(path) as workbook:
+            return [str(name) for name in workbook.sheet_names]
+    return []
+
+
+def _header(cells: t.Sequence[t.Any]) -> t.List[str]:
+    """Column names of a header row, named and deduplicated like pandas"""
+    cells = list(cells)
+    while cells and cells[-1] is None:
+        cells.pop()
+    names: t.List[str] = []
+    for i, cell in enumerate(cells):
+        name = f"Unnamed: {i}" if cell is None else str(cell)
+        base, n = name, 0
+        while name in names:
+            n += 1
+            name = f"{base}.{n}"
+        names.append(name)
+    return names
+
+
+def _split_dates(
+    dtypes: t.Optional[t.Dict[str, str]]
+) -> t.Tuple[t.Optional[t.Dict[str, str]], t.List[str]]:
+    """Readers take dates as strings, they are parsed once read"""
+    if not dtypes:
+        return dtypes, []
+    dates = [name for name, dtype in dtypes.items() if physical_dtype(dtype).kind == "M"]
+    return {**dtypes, **{name: "object" for name in dates}}, dates
+
+
+def _parse_dates(chunk: pd.DataFrame, dates: t.List[str]) -> pd.DataFrame:
+    for name in dates:
+        chunk[name] = to_dates(chunk[name])
+    return chunk
+
+
+def _cast(chunk: pd.DataFrame, dtypes: t.Dict[str, str]) -> pd.DataFrame:
+    for name, dtype in dtypes.items():
+        if name in chunk:
+            if physical_dtype(dtype).kind == "M":
+                chunk[name] = to_dates(chunk[name])
+            else:
+                chunk[name] = chunk[name].astype(dtype)
+    return chunk
+
+
+def iter_xlsx_chunks(
+    path: str,
+    sheet: t.Optional[str] = None,
+    chunk_rows: t.Optional[int] = None,
+    dtypes: t.Optional[t.Dict[str, str]] = None,
+    progress: t.Optional[Progress] = None,
+    start: int = 0,
+    stop: t.Optional[int] = None,
+) -> t.Iterator[pd.DataFrame]:
+    """
+    Stream data rows [start, stop) of a sheet, the first one by default, as
+    DataFrames of at most chunk_rows. Rows are parsed one at a time from the
+    sheet XML, the workbook is never loaded as a whole.
+    """
+    chunk_rows = chunk_rows or config.INGEST_CHUNK_ROWS
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.worksheets[0]
+        header = next(worksheet.iter_rows(max_row=1, values_only=True), ())
+        columns = _header(header)
+        total = max((worksheet.max_row or 1) - 1, 1)
+
+        rows = worksheet.iter_rows(
+            min_row=start + 2,
+            max_row=None if stop is None else stop + 1,
+            max_col=len(columns) or 1,
+            values_only=True,
+        )
+        batch: t.List[t.Sequence[t.Any]] = []
+        read, chunks = start, 0
+        for row in rows:
+            read += 1
+            # Formatted but empty cells are reported as rows of None
+            if all(value is None for value in row):
+                continue
+            batch.append(tuple(row) + (None,) * (len(columns) - len(row)))
+            if len(batch) == chunk_rows:
+                yield _xlsx_frame(batch, columns, dtypes)
+                batch, chunks = [], chunks + 1
+                if progress:
+                    progress(min(read / total, 1.0))
+        if batch or not chunks:
+            # A sheet without rows still has its columns
+            yield _xlsx_frame(batch, columns, dtypes)
+        if progress:
+            progress(1.0)
+    finally:
+        workbook.close()
+
+
+def _xlsx_frame(
+    rows: t.List[t.Sequence[t.Any]],
+    columns: t.List[str],
+    dtypes: t.Optional[t.Dict[str, str]],
+) -> pd.DataFrame:
+    chunk = pd.DataFrame.from_records(rows, columns=columns)
+    # Empty columns are read as missing floats, like read_csv does
+    for name in chunk.columns[chunk.isna().all().to_numpy() & (len(chunk) > 0)]:
+        chunk[name] = chunk[name].astype(np.float64)
+    return _cast(chunk, dtypes) if dtypes else chunk
+
+
+def iter_chunks(
+    path: str,
+    file_type: str,
+    chunk_rows: t.Optional[int] = None,
+    dtypes: t.Optional[t.Dict[str, str]] = None,
+    progress: t.Optional[Progress] = None,
+    sheet: t.Optional[str] = None,
+) -> t.Iterator[pd.DataFrame]:
+    """
+    Yield the rows of a dataset file, or of one sheet of a workbook, as
+    DataFrames of at most chunk_rows. progress is called after each chunk
+    with the fraction of the file read.
+    """
+    chunk_rows = chunk_rows or config.INGEST_CHUNK_ROWS
+    read_dtypes, dates = _split_dates(dtypes)
+
+    if file_type == "csv":
+        size = os.path.getsize(path) or 1
+        with open(path, "rb") as f, pd.read_csv(
+            f, chunksize=chunk_rows, dtype=read_dtypes
+        ) as reader:
+            for chunk in reader:
+                yield _parse_dates(chunk, dates)
+                if progress:
+                    progress(min(f.tell() / size, 1.0))
+    elif file_type == "xlsx":
+        yield from iter_xlsx_chunks(path, sheet, chunk_rows, dtypes, progress)
+    elif file_type == "xls":
+        # Legacy binary workbooks have no streaming reader, the sheet is
+        # loaded at once
+        chunk = pd.read_excel(path, sheet_name=sheet or 0, dtype=read_dtypes)
+        yield _parse_dates(chunk, dates)
+        if progress:
+            progress(1.0)
+    else:
+        raise ValueError(f"Unsupported file type: {file_type}")
+
+
+def _fit_column(name: str, values: pd.Series, dtype: str) -> t.Tuple[pd.Series, str]:
+    """
+    Values appended to a column stored as dtype, and the type of the column
+    once they are: integers and floats that the type does not hold widen it
+    """
+    kind = physical_dtype(dtype).kind
+    if kind == "O" or not len(values):
+        return values, dtype
+    if kind in "biu" and values.isna().any():
+        raise ValueError(f"Column {name} does not allow missing values")
+    if values.isna().all():
+        # e.g. JSON nulls, which pandas reads as objects
+        values = values.astype(np.float64)
+
+    if kind == "M":
+        dates = to_dates(values)
+        if (dates.isna() & values.notna()).any():
+            raise ValueError(f"Column {name} expects dates such as 2024-01-31")
+        return dates.astype(dtype), dtype
+    if kind == "b":
+        if values.dtype.kind != "b":
+            raise ValueError(f"Column {name} expects booleans")
+        return values, dtype
+    if values.dtype.kind not in ("iu" if kind in "iu" else "iuf"):
+        expected = "integers" if kind in "iu" else "numbers"
+        raise ValueError(f"Column {name} expects {expected}")
+    try:
+        dtype = widen_dtype(dtype, values.to_numpy())
+    except ValueError as e:
+        raise ValueError(f"Column {name}: {e}")
+    return values.astype(dtype), dtype
+
+
+def parse_rows(
+    body: bytes, content_type: str, dtypes: t.Dict[str, str]
+) -> t.Tuple[pd.DataFrame, t.Dict[str, str]]:
+    """
+    Parse rows sent as CSV or as a JSON list of objects into the columns of
+    a dataset stored with dtypes. Returns them with the types the columns
+    take once they are appended, wider than dtypes for numbers that do not
+    fit the compact types chosen at ingest. Raises ValueError when they do
+    not fit the columns at all
+    """
+    if content_type.startswith("application/json"):
+        records = json.loads(body or b"[]")
+        if not isinstance(records, list) or not all(
+            isinstance(record, dict) for record in records
+        ):
+            raise ValueError("Expected a JSON list of objects")
+        rows = pd.DataFrame.from_records(records)
+    elif content_type.startswith("text/csv"):
+        # Numbers are read as pandas infers them and checked against the
+        # stored types after: read as those types, they would wrap around
+        strings = {
+            name: "object"
+            for name, dtype in dtypes.items()
+            if physical_dtype(dtype).kind in "OM"
+        }
+        try:
+            rows = pd.read_csv(io.BytesIO(body), dtype=strings)
+        except pd.errors.EmptyDataError:
+            rows = pd.DataFrame()
+    else:
+        raise ValueError("Rows must be sent as text/csv or application/json")
+
+    rows.columns = [str(c) for c in rows.columns]
+    if len(rows) and set(rows.columns) != set(dtypes):
+        raise ValueError(
+            f"Expected columns {sorted(dtypes)}, got {sorted(rows.columns)}"
+        )
+
+    columns, fitted = {}, {}
+    for name, dtype in dtypes.items():
+        values = rows[name] if name in rows else pd.Series([], dtype=object)
+        columns[name], fitted[name] = _fit_column(name, values, dtype)
+    return pd.DataFrame(columns, columns=list(dtypes)), fitted
+
+
+def merge_dtypes(left: np.dtype, right: np.dtype) -> np.dtype:
+    """
+    Combine the dtypes inferred for the same column in two chunks the way a
+    single pass of pandas over both chunks would
+    """
+    if left == right:
+        return left
+    if (
+        pd.api.types.is_numeric_dtype(left)
+        and pd.api.types.is_numeric_dtype(right)
+        and not pd.api.types.is_bool_dtype(left)
+        and not pd.api.types.is_bool_dtype(right)
+    ):
+        return np.result_type(left, right)
+    return np.dtype(object)
+
+
+def profile_file(
+    path: str,
+    file_type: str,
+    chunk_rows: t.Optional[int] = None,
+    progress: t.Optional[Progress] = None,
+    sheet: t.Optional[str] = None,
+) -> FileProfile:
+    """
+    Count rows, infer column dtypes and choose the compact types they are
+    stored with in a single chunked pass
+    """
+    row_count = 0
+    dtypes: t.Dict[str, np.dtype] = {}
+    optimizer = DtypeOptimizer()
+
+    chunks = iter_chunks(path, file_type, chunk_rows, progress=progress, sheet=sheet)
+    for chunk in chunks:
+        row_count += len(chunk)
+        optimizer.update(chunk)
+        for column, dtype in chunk.dtypes.items():
+            column = str(column)
+            if column in dtypes:
+                dtypes[column] = merge_dtypes(dtypes[column], dtype)
+            else:
+                dtypes[column] = dtype
+
+    inferred = {column: str(dtype) for column, dtype in dtypes.items()}
+    optimized, memory = optimizer.optimize(inferred)
+    return FileProfile(
+        row_count=row_count,
+        dtypes=inferred,
+        optimized=optimized,
+        memory={"row_count": row_count, **memory},
+    )
+
+
+def convert_file(
+    dataset_id: int,
+    path: str,
+    file_type: str,
+    dtypes: t.Dict[str, str],
+    chunk_rows: t.Optional[int] = None,
+    progress: t.Optional[Progress] = None,
+    version: t.Optional[int] = None,
+    sheet: t.Optional[str] = None,
+) -> storage.DatasetStore:
+    """
+    Parse an uploaded file, or one sheet of it, once more with the profiled
+    dtypes and write it into the columnar store of the dataset, as the given
+    version
+    """
+    dest = storage.dataset_dir(dataset_id)
+    writer = storage.DatasetWriter(dest, dtypes, version=version)
+    try:
+        chunks = iter_chunks(path, file_type, chunk_rows, dtypes, progress, sheet)
+        for chunk in chunks:
+            writer.write(chunk)
+    except Exception:
+        writer.abort()
+        raise
+    writer.close()
+    return storage.DatasetStore(dest)
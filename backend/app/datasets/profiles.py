@@ -0,0 +1,235 @@
+"""
+Column profiles precomputed at ingest and stored on DatasetColumn.profile.
+
+Numeric and date columns get an equi-width and an equi-depth histogram,
+string and boolean columns a list of their most frequent values, so
+histogram charts and filter pickers are served without scanning the data.
+
+Profiles are built from mergeable per-segment accumulators that are saved
+next to each segment. Appending rows only profiles the new segment and
+merges it with the saved accumulators of the others. Histogram counts come
+from the ranks of a KLL sketch: exact while a column fits in the sketch,
+within its rank error beyond.
+"""
+import heapq
+import json
+import operator
+import os
+import typing as t
+
+import numpy as np
+import pandas as pd
+
+from app.core import config
+from app.datasets.query import column_kind
+from app.datasets.stats import KLLSketch, null_mask
+from app.datasets.storage import DatasetStore, Segment
+
+SEGMENT_PROFILE = "profile.json"
+
+# Distinct values tracked per column while counting the most frequent ones
+TOP_K_CAPACITY = 10000
+
+
+def _present(values: np.ndarray) -> np.ndarray:
+    """Non-missing values, dates as nanoseconds"""
+    values = values[~null_mask(values)]
+    if values.dtype.kind == "M":
+        return values.astype("datetime64[ns]").view(np.int64)
+    return values
+
+
+def _iso(value: float) -> str:
+    return pd.Timestamp(int(value)).isoformat()
+
+
+class ColumnProfile:
+    """Mergeable accumulator for the profile of one column"""
+
+    def __init__(self, dtype: str):
+        self.dtype = dtype
+        self.kind = column_kind(dtype)
+        self.ordered = self.kind in ("number", "date")
+        self.count = 0
+        self.nulls = 0
+        self.min: t.Optional[float] = None
+        self.max: t.Optional[float] = None
+        self.sketch = KLLSketch() if self.ordered else None
+        self.values: t.Dict[t.Any, int] = {}
+        self.approximate = False
+
+    def update(
+        self, values: np.ndarray, dictionary: t.Optional[np.ndarray] = None
+    ) -> None:
+        """Add a chunk of column values, or codes into dictionary"""
+        if self.ordered:
+            present = _present(values)
+            self.nulls += len(values) - len(present)
+            self.count += len(present)
+            if len(present):
+                self._merge_range(float(present.min()), float(present.max()))
+                self.sketch.update(present)
+            return
+
+        if dictionary is not None:
+            present = values[values >= 0]
+            counts = np.bincount(present, minlength=len(dictionary))
+            uniques = dictionary
+        else:
+            present = values[~null_mask(values)]
+            uniques, counts = np.unique(present, return_counts=True)
+        self.nulls += len(values) - len(present)
+        self.count += len(present)
+
+        seen = np.flatnonzero(counts)
+        if len(seen) > TOP_K_CAPACITY:
+            self.approximate = True
+            heaviest = np.argpartition(counts[seen], -TOP_K_CAPACITY)
+            seen = seen[heaviest[-TOP_K_CAPACITY:]]
+        self._merge_values(zip(uniques[seen].tolist(), counts[seen].tolist()))
+
+    def _merge_range(self, low: float, high: float) -> None:
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def _merge_values(self, items: t.Iterable[t.Tuple[t.Any, int]]) -> None:
+        for value, count in items:
+            self.values[value] = self.values.get(value, 0) + count
+        if len(self.values) > TOP_K_CAPACITY:
+            # Values that are rare early on may be undercounted from now on
+            self.approximate = True
+            self.values = dict(heapq.nlargest(
+                TOP_K_CAPACITY, self.values.items(), key=operator.itemgetter(1)
+            ))
+
+    def merge(self, other: "ColumnProfile") -> None:
+        self.count += other.count
+        self.nulls += other.nulls
+        if self.ordered:
+            if other.count:
+                self._merge_range(other.min, other.max)
+                self.sketch.merge(other.sketch)
+            return
+        self.approximate = self.approximate or other.approximate
+        self._merge_values(other.values.items())
+
+    def _histogram(self, edges: np.ndarray) -> t.Dict[str, t.Any]:
+        # Bins are closed on the left, the last one on both sides
+        ranks = self.sketch.ranks(edges[:-1])
+        counts = np.diff(np.r_[ranks, self.count])
+        return {"edges": edges.tolist(), "counts": counts.tolist()}
+
+    def _histograms(self, bins: int) -> t.Dict[str, t.Any]:
+        if not self.count:
+            empty = {"edges": [], "counts": []}
+            return {"min": None, "max": None,
+                    "equi_width": empty, "equi_depth": dict(empty)}
+
+        low, high = self.min, self.max
+        width_edges = np.histogram_bin_edges([], bins=bins, range=(low, high))
+        # Ties can merge equi-depth bins, the edges always span the full range
+        quantiles = self.sketch.quantiles(np.linspace(0, 1, bins + 1)[1:-1])
+        depth_edges = np.unique(np.clip(np.r_[low, quantiles, high], low, high))
+        if len(depth_edges) == 1:
+            depth_edges = np.r_[low, high]
+
+        return {
+            "min": low,
+            "max": high,
+            "equi_width": self._histogram(width_edges),
+            "equi_depth": self._histogram(depth_edges),
+            "approximate": not self.sketch.is_exact,
+        }
+
+    def profile(self, bins: int, top_k: int) -> t.Dict[str, t.Any]:
+        profile: t.Dict[str, t.Any] = {
+            "kind": self.kind, "count": self.count, "nulls": self.nulls
+        }
+        if not self.ordered:
+            top = heapq.nlargest(
+                top_k, self.values.items(), key=operator.itemgetter(1)
+            )
+            profile["distinct"] = None if self.approximate else len(self.values)
+            profile["approximate"] = self.approximate
+            profile["top_k"] = [
+                {"value": value, "count": count} for value, count in top
+            ]
+            return profile
+
+        profile.update(self._histograms(bins))
+        if self.kind == "date" and self.count:
+            profile["min"], profile["max"] = _iso(self.min), _iso(self.max)
+            for key in ("equi_width", "equi_depth"):
+                edges = profile[key]["edges"]
+                profile[key]["edges"] = [_iso(edge) for edge in edges]
+        return profile
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {
+            "dtype": self.dtype,
+            "count": self.count,
+            "nulls": self.nulls,
+            "min": self.min,
+            "max": self.max,
+            "sketch": self.sketch.to_dict() if self.ordered else None,
+            "values": list(self.values.items()),
+            "approximate": self.approximate,
+        }
+
+    @classmethod
+    def from_dict(cls, data: t.Dict[str, t.Any]) -> "ColumnProfile":
+        profile = cls(data["dtype"])
+        profile.count = data["count"]
+        profile.nulls = data["nulls"]
+        profile.min = data["min"]
+        profile.max = data["max"]
+        if profile.ordered:
+            profile.sketch = KLLSketch.from_dict(data["sketch"])
+        profile.values = {value: count for value, count in data["values"]}
+        profile.approximate = data["approximate"]
+        return profile
+
+
+def segment_profiles(
+    store: DatasetStore, segment: Segment
+) -> t.Dict[str, ColumnProfile]:
+    """
+    Profile accumulators of one segment, computed on first use and saved
+    with the segment, which never changes once written
+    """
+    path = os.path.join(segment.path, SEGMENT_PROFILE)
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+        return {name: ColumnProfile.from_dict(data) for name, data in saved.items()}
+    except FileNotFoundError:
+        pass
+
+    columns = {}
+    for name, dtype in store.dtypes.items():
+        column = ColumnProfile(dtype)
+        column.update(*store.segment_column(segment, name))
+        columns[name] = column
+
+    with open(f"{path}.tmp", "w") as f:
+        json.dump({name: column.to_dict() for name, column in columns.items()}, f)
+    os.replace(f"{path}.tmp", path)
+    return columns
+
+
+def profile_store(
+    store: DatasetStore,
+    bins: t.Optional[int] = None,
+    top_k: t.Optional[int] = None,
+) -> t.Dict[str, t.Dict[str, t.Any]]:
+    """Profile every column of a store by merging its segment profiles"""
+    bins = bins or config.PROFILE_BINS
+    top_k = top_k or config.PROFILE_TOP_K
+
+    merged: t.Dict[str, ColumnProfile] = {
+        name: ColumnProfile(dtype) for name, dtype in store.dtypes.items()
+    }
+    for segment in store.segments:
+        for name, column in segment_profiles(store, segment).items():
+            merged[name].merge(column)
+    return {name: column.profile(bins, top_k) for name, column in merged.items()}
@@ -0,0 +1,402 @@
+"""
+Filter / group-by / aggregate queries over a columnar dataset store.
+
+Queries run segment by segment, so memory is bounded by one segment plus the
+partial result:
+
+- only the columns a query references are read (column pruning),
+- segments whose min/max rule out every match of a filter are skipped, and
+  filters run on the memory-mapped values, string filters on the dictionary
+  of each segment instead of every row (predicate pushdown),
+- the other columns are materialised for the matching rows only,
+- aggregates are computed per segment and the partials combined.
+"""
+import operator
+import typing as t
+
+import numpy as np
+import pandas as pd
+
+from app.db import schemas
+from app.datasets.stats import null_mask
+from app.datasets.storage import DatasetStore, Segment
+
+COMPARISONS = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "lt": operator.lt,
+    "le": operator.le,
+    "gt": operator.gt,
+    "ge": operator.ge,
+}
+SET_OPERATORS = ("in", "not_in")
+NULL_OPERATORS = ("is_null", "not_null")
+AGGREGATES = ("count", "sum", "mean", "min", "max")
+
+# How the partial aggregates of each segment are combined
+COMBINE = {"count": "sum", "sum": "sum", "min": "min", "max": "max"}
+
+# Key of the single group of an aggregate without group_by
+_ALL = "__all__"
+
+
+class QueryError(ValueError):
+    """A query that does not fit the columns of the dataset"""
+
+
+class Predicate(t.NamedTuple):
+    column: str
+    op: str
+    value: t.Any
+
+
+def column_kind(data_type: str) -> str:
+    """number, date, boolean or string, for a DatasetColumn data_type"""
+    if data_type in ("number", "date", "boolean", "string"):
+        return data_type
+    try:
+        kind = np.dtype(data_type).kind
+    except TypeError:
+        return "string"
+    if kind == "b":
+        return "boolean"
+    if kind in "iuf":
+        return "number"
+    if kind == "M":
+        return "date"
+    return "string"
+
+
+def _coerce(kind: str, value: t.Any, column: str) -> t.Any:
+    """Convert a filter value to the type of the column it is compared with"""
+    if kind == "number":
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise QueryError(f"Column {column} expects a number, got {value!r}")
+        return value
+    if kind == "date":
+        try:
+            return pd.Timestamp(value).to_datetime64()
+        except (TypeError, ValueError):
+            raise QueryError(f"Column {column} expects a date, got {value!r}")
+    if kind == "boolean":
+        if not isinstance(value, bool):
+            raise QueryError(f"Column {column} expects a boolean, got {value!r}")
+        return value
+    if isinstance(value, (list, dict)) or value is None:
+        raise QueryError(f"Column {column} expects a string, got {value!r}")
+    return str(value)
+
+
+def compile_filters(
+    query: schemas.DatasetQuery, kinds: t.Dict[str, str]
+) -> t.List[Predicate]:
+    predicates = []
+    for f in query.filters:
+        kind = kinds[f.column]
+        if f.op in NULL_OPERATORS:
+            value = None
+        elif f.op in ("eq", "ne"):
+            value = _coerce(kind, f.value, f.column)
+        elif f.op in COMPARISONS:
+            if kind == "boolean":
+                raise QueryError(
+                    f"Operator {f.op} does not apply to boolean column {f.column}"
+                )
+            value = _coerce(kind, f.value, f.column)
+        elif f.op in SET_OPERATORS:
+            if not isinstance(f.value, list):
+                raise QueryError(f"Operator {f.op} expects a list of values")
+            value = [_coerce(kind, v, f.column) for v in f.value]
+        elif f.op == "contains":
+            if kind != "string":
+                raise QueryError(
+                    f"Operator contains only applies to string columns, not {f.column}"
+                )
+            value = _coerce(kind, f.value, f.column)
+        else:
+            raise QueryError(f"Unknown filter operator: {f.op}")
+        predicates.append(Predicate(f.column, f.op, value))
+    return predicates
+
+
+def validate(
+    query: schemas.DatasetQuery, column_types: t.Dict[str, str]
+) -> t.Tuple[t.List[str], t.List[Predicate]]:
+    """
+    Check a query against the column metadata of the dataset. Returns the
+    output columns and the filters with their values converted.
+    """
+    kinds = {name: column_kind(dtype) for name, dtype in column_types.items()}
+    referenced = (
+        query.select
+        + [f.column for f in query.filters]
+        + query.group_by
+        + [a.column for a in query.aggregates if a.column is not None]
+    )
+    for name in referenced:
+        if name not in kinds:
+            raise QueryError(f"Unknown column: {name}")
+
+    if query.aggregates:
+        if query.select:
+            raise QueryError("select cannot be combined with aggregates, use group_by")
+        for agg in query.aggregates:
+            if agg.func not in AGGREGATES:
+                raise QueryError(f"Unknown aggregate: {agg.func}")
+            if agg.column is None:
+                if agg.func != "count":
+                    raise QueryError(f"Aggregate {agg.func} needs a column")
+                continue
+            kind = kinds[agg.column]
+            if agg.func in ("sum", "mean") and kind != "number":
+                raise QueryError(
+                    f"Aggregate {agg.func} needs a numeric column, "
+                    f"{agg.column} is {kind}"
+                )
+            if agg.func in ("min", "max") and kind not in ("number", "date"):
+                raise QueryError(
+                    f"Aggregate {agg.func} needs a numeric or date column, "
+                    f"{agg.column} is {kind}"
+                )
+        output = query.group_by + [agg.name for agg in query.aggregates]
+    elif query.group_by:
+        raise QueryError("group_by needs at least one aggregate")
+    else:
+        output = list(dict.fromkeys(query.select)) or list(column_types)
+
+    if len(set(output)) != len(output):
+        raise QueryError("Duplicate output column names, set an alias")
+    for order in query.order_by:
+        if order.column not in output:
+            raise QueryError(
+                f"Cannot order by {order.column}, it is not in the result"
+            )
+
+    return output, compile_filters(query, kinds)
+
+
+def _test(predicate: Predicate, values: np.ndarray) -> np.ndarray:
+    if predicate.op in COMPARISONS:
+        compare = COMPARISONS[predicate.op]
+        return np.asarray(compare(values, predicate.value), dtype=bool)
+    if predicate.op == "in":
+        return np.isin(values, predicate.value)
+    if predicate.op == "not_in":
+        return ~np.isin(values, predicate.value)
+    # contains
+    return (
+        pd.Series(values, dtype=object)
+        .str.contains(predicate.value, regex=False)
+        .to_numpy(dtype=bool)
+    )
+
+
+def _evaluate(
+    predicate: Predicate, values: np.ndarray, dictionary: t.Optional[np.ndarray]
+) -> np.ndarray:
+    """Mask of the rows of a segment matching a predicate; nulls never match"""
+    if dictionary is not None:
+        if predicate.op not in NULL_OPERATORS:
+            # Test every distinct value once, then match the codes
+            return np.isin(values, np.flatnonzero(_test(predicate, dictionary)))
+        missing = values < 0
+    else:
+        missing = null_mask(values)
+        if predicate.op not in NULL_OPERATORS:
+            return _test(predicate, values) & ~missing
+    return missing if predicate.op == "is_null" else ~missing
+
+
+def _excluded(store: DatasetStore, segment: Segment, predicate: Predicate) -> bool:
+    """Whether the min/max of a segment rule out any match of a predicate"""
+    zone = segment.zone_maps.get(store.column_index(predicate.column))
+    if zone is None:
+        return False
+    low, high = zone
+    op, value = predicate.op, predicate.value
+    if op == "eq":
+        return value < low or value > high
+    if op == "lt":
+        return low >= value
+    if op == "le":
+        return low > value
+    if op == "gt":
+        return high <= value
+    if op == "ge":
+        return high < value
+    if op == "in":
+        return all(v < low or v > high for v in value)
+    return False
+
+
+def _materialize(
+    store: DatasetStore, segment: Segment, name: str, rows: t.Optional[np.ndarray]
+) -> np.ndarray:
+    values, dictionary = store.segment_column(segment, name)
+    if rows is not None:
+        values = values[rows]
+    if dictionary is None:
+        return values
+    return segment.dictionary(store.column_index(name))[values]
+
+
+def scan(
+    store: DatasetStore, predicates: t.List[Predicate], columns: t.List[str]
+) -> t.Iterator[pd.DataFrame]:
+    """Yield, segment by segment, the given columns of the matching rows"""
+    for segment in store.segments:
+        if any(_excluded(store, segment, p) for p in predicates):
+            continue
+
+        rows = None
+        if predicates:
+            mask = np.ones(segment.row_count, dtype=bool)
+            for predicate in predicates:
+                values, dictionary = store.segment_column(segment, predicate.column)
+                mask &= _evaluate(predicate, values, dictionary)
+            rows = np.flatnonzero(mask)
+            if not len(rows):
+                continue
+
+        yield pd.DataFrame(
+            {name: _materialize(store, segment, name, rows) for name in columns},
+            columns=columns,
+            index=pd.RangeIndex(segment.row_count if rows is None else len(rows)),
+        )
+
+
+def _order(frame: pd.DataFrame, query: schemas.DatasetQuery) -> pd.DataFrame:
+    if query.order_by:
+        frame = frame.sort_values(
+            [o.column for o in query.order_by],
+            ascending=[not o.desc for o in query.order_by],
+            kind="mergesort",
+            na_position="last",
+        )
+    return frame.head(query.limit).reset_index(drop=True)
+
+
+def _project(
+    store: DatasetStore,
+    query: schemas.DatasetQuery,
+    predicates: t.List[Predicate],
+    columns: t.List[str],
+) -> pd.DataFrame:
+    result: t.Optional[pd.DataFrame] = None
+    for frame in scan(store, predicates, columns):
+        # Only the first `limit` rows of a segment can make the final cut
+        frame = _order(frame, query)
+        if result is not None:
+            frame = _order(pd.concat([result, frame], ignore_index=True), query)
+        result = frame
+        if not query.order_by and len(result) >= query.limit:
+            break
+    return pd.DataFrame(columns=columns) if result is None else result
+
+
+def _partials(
+    query: schemas.DatasetQuery,
+) -> t.Dict[str, t.Tuple[t.Optional[str], str]]:
+    """Partial aggregates kept per segment, as name: (column, function)"""
+    partials = {}
+    for i, agg in enumerate(query.aggregates):
+        if agg.func == "count":
+            partials[f"{i}_count"] = (agg.column, "count" if agg.column else "size")
+        elif agg.func == "mean":
+            partials[f"{i}_sum"] = (agg.column, "sum")
+            partials[f"{i}_count"] = (agg.column, "count")
+        else:
+            partials[f"{i}_{agg.func}"] = (agg.column, agg.func)
+    return partials
+
+
+def _aggregate(
+    store: DatasetStore,
+    query: schemas.DatasetQuery,
+    predicates: t.List[Predicate],
+    columns: t.List[str],
+) -> pd.DataFrame:
+    keys = query.group_by or [_ALL]
+    partials = _partials(query)
+    needed = list(dict.fromkeys(
+        query.group_by + [a.column for a in query.aggregates if a.column is not None]
+    ))
+
+    parts = []
+    for frame in scan(store, predicates, needed):
+        # Sums of float32 columns are accumulated in double precision
+        frame = frame.astype({
+            name: np.float64 for name in frame if frame[name].dtype == np.float32
+        })
+        if not query.group_by:
+            frame[_ALL] = 0
+        parts.append(
+            frame.groupby(keys, dropna=False, sort=False)
+            .agg(**{
+                name: (column or keys[0], func)
+                for name, (column, func) in partials.items()
+            })
+            .reset_index()
+        )
+
+    if not parts:
+        if query.group_by:
+            return pd.DataFrame(columns=columns)
+        # An aggregate over no rows still has one row
+        return pd.DataFrame([{
+            agg.name: 0 if agg.func == "count" else None for agg in query.aggregates
+        }])
+
+    combined = (
+        pd.concat(parts, ignore_index=True)
+        .groupby(keys, dropna=False, sort=False)
+        .agg(**{
+            name: (name, COMBINE[name.split("_", 1)[1]]) for name in partials
+        })
+        .reset_index()
+    )
+
+    result = combined[query.group_by].copy()
+    for i, agg in enumerate(query.aggregates):
+        if agg.func == "mean":
+            counts = combined[f"{i}_count"].replace(0, np.nan)
+            result[agg.name] = combined[f"{i}_sum"] / counts
+        else:
+            result[agg.name] = combined[f"{i}_{agg.func}"]
+    return result
+
+
+def execute(
+    store: DatasetStore,
+    query: schemas.DatasetQuery,
+    column_types: t.Dict[str, str],
+) -> pd.DataFrame:
+    """
+    Run a query over a store and return the result as a DataFrame.
+    column_types maps column names to their DatasetColumn data_type and is
+    used to type check the query.
+    """
+    columns, predicates = validate(query, column_types)
+    if query.aggregates:
+        return _order(_aggregate(store, query, predicates, columns), query)
+    return _project(store, query, predicates, columns)
+
+
+def records(frame: pd.DataFrame) -> t.List[t.Dict[str, t.Any]]:
+    # Missing values are not valid JSON floats
+    frame = frame.astype(object).where(pd.notnull(frame), None)
+    return frame.to_dict(orient="records")
+
+
+def run_query(
+    store: DatasetStore,
+    query: schemas.DatasetQuery,
+    column_types: t.Dict[str, str],
+) -> t.Dict[str, t.Any]:
+    """Run a query over a store, with the result rows as JSON records"""
+    frame = execute(store, query, column_types)
+    return {
+        "columns": list(frame.columns),
+        "rows": records(frame),
+        "row_count": len(frame),
+    }
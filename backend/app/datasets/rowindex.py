@@ -0,0 +1,104 @@
+"""
+Sparse row offset index for CSV files.
+
+The index records the byte offset of every `every`-th data row, so the raw
+file can be read from any row by seeking to the nearest indexed row and
+skipping at most `every` rows. crud.save_dataset_file builds it while the
+upload is streamed to disk, from the chunks written, and read_csv_rows
+builds it lazily for files uploaded before indexes existed.
+"""
+import os
+import typing as t
+
+import numpy as np
+import pandas as pd
+
+from app.core import config
+
+QUOTE = ord('"')
+NEWLINE = ord("\n")
+
+
+def index_path(path: str) -> str:
+    return f"{path}.rowidx.npz"
+
+
+class CSVRowIndexer:
+    """
+    Incrementally index a CSV file fed as raw byte chunks. A newline ends a
+    record only outside quoted fields; escaped quotes ("") flip the quote
+    state twice, so counting quotes is enough to track it.
+    """
+
+    def __init__(self, every: t.Optional[int] = None):
+        self.every = every or config.ROW_INDEX_EVERY
+        self.offsets: t.List[int] = []
+        self.position = 0
+        self.records = 0
+        self.in_quotes = False
+
+    def feed(self, chunk: bytes) -> None:
+        data = np.frombuffer(chunk, dtype=np.uint8)
+        quotes = np.cumsum(data == QUOTE)
+        newlines = np.flatnonzero(data == NEWLINE)
+
+        outside = (quotes[newlines] + self.in_quotes) % 2 == 0
+        ends = newlines[outside]
+
+        # The record ended by the n-th terminator (the header being the
+        # first) is followed by data row n
+        rows = self.records + np.arange(len(ends))
+        starts = self.position + ends[rows % self.every == 0] + 1
+        self.offsets.extend(starts.tolist())
+
+        self.records += len(ends)
+        if len(data):
+            self.in_quotes = bool((quotes[-1] + self.in_quotes) % 2)
+        self.position += len(data)
+
+    def save(self, path: str) -> None:
+        np.savez(
+            index_path(path),
+            every=np.int64(self.every),
+            offsets=np.asarray(self.offsets, dtype=np.int64),
+        )
+
+
+def build_index(path: str, chunk_size: t.Optional[int] = None) -> CSVRowIndexer:
+    chunk_size = chunk_size or config.UPLOAD_CHUNK_SIZE
+    indexer = CSVRowIndexer()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            indexer.feed(chunk)
+    indexer.save(path)
+    return indexer
+
+
+def load_index(path: str) -> t.Tuple[int, np.ndarray]:
+    """Row interval and offsets of a CSV file, building the index if missing"""
+    if not os.path.exists(index_path(path)):
+        build_index(path)
+    with np.load(index_path(path)) as index:
+        return int(index["every"]), index["offsets"]
+
+
+def read_csv_rows(path: str, start: int, n_rows: int) -> pd.DataFrame:
+    """Read n_rows data rows of a CSV file starting at row start"""
+    header = pd.read_csv(path, nrows=0).columns
+    every, offsets = load_index(path)
+    block, skip = divmod(start, every)
+
+    if block >= len(offsets):
+        return pd.DataFrame(columns=header)
+
+    with open(path, "rb") as f:
+        f.seek(int(offsets[block]))
+        try:
+            return pd.read_csv(
+                f, header=None, names=header, skiprows=skip, nrows=n_rows
+            )
+        except pd.errors.EmptyDataError:
+            return pd.DataFrame(columns=header)
@@ -0,0 +1,173 @@
+"""
+Sample-based approximate statistics for /datasets/{id}/analyze?mode=approx.
+
+Rows are sampled uniformly without replacement, either by drawing row numbers
+directly from a columnar store or with a one-pass reservoir over raw file
+chunks. Every estimate comes with a confidence interval that includes the
+finite population correction, so intervals shrink to nothing as the sample
+approaches the whole dataset.
+"""
+import math
+import statistics
+import typing as t
+
+import numpy as np
+import pandas as pd
+
+from app.datasets.stats import QUANTILES, is_numeric, null_mask
+from app.datasets.storage import DatasetStore
+
+Interval = t.List[t.Optional[float]]
+
+
+def sample_rows(
+    row_count: int, size: int, rng: np.random.Generator
+) -> np.ndarray:
+    """Sorted row numbers of a uniform sample without replacement"""
+    if size >= row_count:
+        return np.arange(row_count)
+    return np.sort(rng.choice(row_count, size=size, replace=False))
+
+
+def sample_store(
+    store: DatasetStore, size: int, rng: np.random.Generator
+) -> t.Dict[str, np.ndarray]:
+    """Sample every column of a store at the same rows"""
+    rows = sample_rows(store.row_count, size, rng)
+    return {name: store.take(name, rows) for name in store.columns}
+
+
+def reservoir_sample(
+    chunks: t.Iterable[pd.DataFrame], size: int, rng: np.random.Generator
+) -> t.Tuple[t.Dict[str, np.ndarray], int]:
+    """
+    Uniform sample of a stream of chunks, and the number of rows seen. Every
+    row gets a random key and the size smallest keys are kept, which needs a
+    single pass and memory for one chunk plus the reservoir.
+    """
+    reservoir: t.Optional[pd.DataFrame] = None
+    row_count = 0
+
+    for chunk in chunks:
+        row_count += len(chunk)
+        chunk = chunk.assign(_key=rng.random(len(chunk)))
+        if reservoir is not None:
+            chunk = pd.concat([reservoir, chunk], ignore_index=True)
+        reservoir = chunk.nsmallest(size, "_key") if len(chunk) > size else chunk
+
+    if reservoir is None:
+        return {}, 0
+    reservoir = reservoir.drop(columns="_key")
+    return {str(c): reservoir[c].to_numpy() for c in reservoir.columns}, row_count
+
+
+def _z(confidence: float) -> float:
+    return statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+
+
+def _proportion(
+    hits: int, total: int, population: int, z: float, fpc: float
+) -> t.Tuple[float, Interval]:
+    """Estimated count in the population of rows matching hits/total"""
+    if total == 0:
+        return 0.0, [0.0, float(population)]
+    p = hits / total
+    half = z * math.sqrt(p * (1 - p) / total) * fpc
+    return p * population, [
+        max(p - half, 0.0) * population,
+        min(p + half, 1.0) * population,
+    ]
+
+
+def _numeric_estimates(
+    present: np.ndarray, z: float, fpc: float
+) -> t.Tuple[t.Dict[str, t.Optional[float]], t.Dict[str, Interval]]:
+    k = len(present)
+    if k == 0:
+        return {}, {}
+
+    mean = float(present.mean())
+    std = float(present.std(ddof=1)) if k > 1 else None
+    summary = {"mean": mean, "std": std, "min": float(present.min())}
+    intervals: t.Dict[str, Interval] = {}
+
+    if std is not None:
+        half = z * std / math.sqrt(k) * fpc
+        intervals["mean"] = [mean - half, mean + half]
+        half = z * std / math.sqrt(2 * (k - 1)) * fpc
+        intervals["std"] = [max(std - half, 0.0), std + half]
+
+    # The population minimum and maximum can only lie beyond the sample's
+    intervals["min"] = [None, summary["min"]]
+
+    # Distribution-free interval from the order statistics around each rank
+    ordered = np.sort(present)
+    for q in QUANTILES:
+        key = f"{q:.0%}"
+        summary[key] = float(np.quantile(ordered, q))
+        half = z * math.sqrt(k * q * (1 - q)) * fpc
+        low = int(min(max(math.floor(k * q - half), 0), k - 1))
+        high = int(min(max(math.ceil(k * q + half), 0), k - 1))
+        intervals[key] = [float(ordered[low]), float(ordered[high])]
+
+    summary["max"] = float(present.max())
+    intervals["max"] = [summary["max"], None]
+    return summary, intervals
+
+
+def estimate(
+    sample: t.Dict[str, np.ndarray],
+    dtypes: t.Dict[str, str],
+    population: int,
+    confidence: float = 0.95,
+) -> t.Dict[str, t.Any]:
+    """
+    Statistics estimated from a sample, in the shape of the exact analyze
+    response plus a confidence_intervals section
+    """
+    z = _z(confidence)
+    sample_size = len(next(iter(sample.values()))) if sample else 0
+    fpc = (
+        math.sqrt(max(population - sample_size, 0) / (population - 1))
+        if population > 1
+        else 0.0
+    )
+
+    summary: t.Dict[str, t.Any] = {}
+    missing_values: t.Dict[str, float] = {}
+    intervals: t.Dict[str, t.Any] = {"summary": {}, "missing_values": {}}
+
+    for name, dtype in dtypes.items():
+        values = sample[name]
+        missing = null_mask(values)
+        nulls = int(np.count_nonzero(missing))
+
+        estimated_nulls, null_interval = _proportion(
+            nulls, sample_size, population, z, fpc
+        )
+        if nulls:
+            missing_values[name] = round(estimated_nulls)
+            intervals["missing_values"][name] = null_interval
+
+        if not is_numeric(dtype):
+            continue
+        present = np.asarray(values[~missing], dtype=np.float64)
+        count, count_interval = _proportion(
+            sample_size - nulls, sample_size, population, z, fpc
+        )
+        column_summary, column_intervals = _numeric_estimates(present, z, fpc)
+        summary[name] = {"count": count, **column_summary}
+        intervals["summary"][name] = {"count": count_interval, **column_intervals}
+
+    stats: t.Dict[str, t.Any] = {
+        "mode": "approx",
+        "sample_size": sample_size,
+        "row_count": population,
+        "confidence": confidence,
+    }
+    if summary:
+        stats["summary"] = summary
+    stats["missing_values"] = missing_values
+    stats["data_types"] = dict(dtypes)
+    stats["confidence_intervals"] = intervals
+    return stats
@@ -0,0 +1,352 @@
+"""
+Single-pass, mergeable column statistics.
+
+Every accumulator consumes a column in chunks of any size and can be merged
+with the accumulator of another chunk, so datasets larger than memory are
+summarised segment by segment (or in parallel) and the results combined:
+
+- count, mean, variance, min and max are exact (Welford updates combined with
+  Chan's parallel formula),
+- quantiles come from a KLL sketch, exact while a column fits in the sketch,
+- distinct counts come from a HyperLogLog sketch.
+"""
+import base64
+import math
+import typing as t
+
+import numpy as np
+import pandas as pd
+
+from app.datasets.dtypes import physical_dtype
+
+QUANTILES = (0.25, 0.5, 0.75)
+
+# Sketch sizes, chosen for ~1% rank error and ~1.6% distinct count error
+KLL_K = 200
+HLL_PRECISION = 12
+
+
+def is_numeric(dtype: str) -> bool:
+    """Same selection as DataFrame.select_dtypes(include=["number"])"""
+    return np.issubdtype(physical_dtype(dtype), np.number)
+
+
+def null_mask(values: np.ndarray) -> np.ndarray:
+    kind = values.dtype.kind
+    if kind == "f":
+        return np.isnan(values)
+    if kind == "M":
+        return np.isnat(values)
+    if kind == "O":
+        return pd.isnull(values)
+    return np.zeros(len(values), dtype=bool)
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch. Level h holds items of weight 2**h; a level that
+    outgrows its capacity is sorted and every other item is promoted.
+    """
+
+    def __init__(self, k: int = KLL_K, seed: t.Optional[int] = None):
+        self.k = k
+        self.n = 0
+        self.levels: t.List[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(int(math.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self) -> None:
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays at this level
+                keep = items[len(items) - len(items) % 2:]
+                offset = int(self._rng.integers(2))
+                promoted = items[offset:len(items) - len(keep):2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate(
+                    [self.levels[level + 1], promoted]
+                )
+                # Adding a level shrinks the capacity of the ones below
+                level = 0
+                continue
+            level += 1
+
+    def update(self, values: np.ndarray) -> None:
+        if len(values) == 0:
+            return
+        self.levels[0] = np.concatenate(
+            [self.levels[0], np.asarray(values, dtype=np.float64)]
+        )
+        self.n += len(values)
+        self._compress()
+
+    def merge(self, other: "KLLSketch") -> None:
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+
+    def _sorted(self) -> t.Tuple[np.ndarray, np.ndarray]:
+        """All items in order, with the cumulative weight up to each"""
+        items = np.concatenate(self.levels)
+        weights = np.concatenate(
+            [np.full(len(lvl), 2 ** h) for h, lvl in enumerate(self.levels)]
+        )
+        order = np.argsort(items, kind="mergesort")
+        return items[order], np.cumsum(weights[order])
+
+    @property
+    def is_exact(self) -> bool:
+        return len(self.levels) == 1
+
+    def quantiles(self, qs: t.Sequence[float]) -> t.List[t.Optional[float]]:
+        if self.n == 0:
+            return [None for _ in qs]
+        if self.is_exact:
+            # Nothing was compacted: linear interpolation, as in describe()
+            return [float(v) for v in np.quantile(self.levels[0], qs)]
+
+        items, cumulative = self._sorted()
+        positions = np.searchsorted(
+            cumulative, np.asarray(qs) * cumulative[-1], side="left"
+        )
+        positions = np.minimum(positions, len(items) - 1)
+        return [float(items[p]) for p in positions]
+
+    def ranks(self, values: t.Sequence[float]) -> np.ndarray:
+        """Estimated number of items smaller than each value"""
+        items, cumulative = self._sorted()
+        cumulative = np.r_[0, cumulative]
+        return cumulative[np.searchsorted(items, values, side="left")]
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {
+            "k": self.k,
+            "n": self.n,
+            "levels": [lvl.tolist() for lvl in self.levels],
+        }
+
+    @classmethod
+    def from_dict(cls, data: t.Dict[str, t.Any]) -> "KLLSketch":
+        sketch = cls(data["k"])
+        sketch.n = data["n"]
+        sketch.levels = [np.asarray(lvl, dtype=np.float64) for lvl in data["levels"]]
+        return sketch
+
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    """Vectorized int.bit_length for uint64 arrays"""
+    length = np.zeros(len(x), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = x >= np.uint64(1 << shift)
+        length[high] += shift
+        x = np.where(high, x >> np.uint64(shift), x)
+    return length + (x > 0)
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter over 64-bit hashes"""
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, values: np.ndarray) -> None:
+        if len(values) == 0:
+            return
+        hashes = pd.util.hash_array(np.asarray(values))
+        p = np.uint64(self.precision)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.int64)
+        # The guard bit caps the rank at 64 - p + 1 when the rest is zero
+        rest = (hashes << p) | (np.uint64(1) << (p - np.uint64(1)))
+        rank = (65 - _bit_length(rest)).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(2.0 ** -self.registers.astype(float))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Small range correction: linear counting
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {
+            "precision": self.precision,
+            "registers": base64.b64encode(self.registers.tobytes()).decode(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: t.Dict[str, t.Any]) -> "HyperLogLog":
+        sketch = cls(data["precision"])
+        sketch.registers = np.frombuffer(
+            base64.b64decode(data["registers"]), dtype=np.uint8
+        ).copy()
+        return sketch
+
+
+class ColumnStats:
+    """Mergeable accumulator for the statistics of one column"""
+
+    def __init__(self, dtype: str):
+        self.dtype = dtype
+        self.numeric = is_numeric(dtype)
+        self.count = 0
+        self.nulls = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min: t.Optional[float] = None
+        self.max: t.Optional[float] = None
+        self.quantiles = KLLSketch() if self.numeric else None
+        self.distinct = HyperLogLog()
+
+    def update(self, values: np.ndarray) -> None:
+        """Add a chunk of raw column values"""
+        missing = null_mask(values)
+        self.nulls += int(np.count_nonzero(missing))
+        present = values[~missing] if missing.any() else values
+
+        if not self.numeric:
+            self.count += len(present)
+            self.distinct.update(present)
+            return
+
+        present = np.asarray(present, dtype=np.float64)
+        n = len(present)
+        if n == 0:
+            return
+        mean = float(present.mean())
+        m2 = float(np.square(present - mean).sum())
+        self._merge_moments(n, mean, m2, float(present.min()), float(present.max()))
+        self.quantiles.update(present)
+        self.distinct.update(present)
+
+    def update_encoded(self, codes: np.ndarray, dictionary: np.ndarray) -> None:
+        """
+        Add a chunk of a dictionary encoded column without decoding it. The
+        distinct sketch is idempotent, so each dictionary value is hashed once.
+        """
+        missing = int(np.count_nonzero(codes < 0))
+        self.nulls += missing
+        self.count += len(codes) - missing
+        self.distinct.update(dictionary)
+
+    def _merge_moments(
+        self, n: int, mean: float, m2: float, low: float, high: float
+    ) -> None:
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def merge(self, other: "ColumnStats") -> None:
+        self.nulls += other.nulls
+        self.distinct.merge(other.distinct)
+        if not self.numeric:
+            self.count += other.count
+            return
+        if other.count:
+            self._merge_moments(
+                other.count, other.mean, other.m2, other.min, other.max
+            )
+            self.quantiles.merge(other.quantiles)
+
+    @property
+    def std(self) -> t.Optional[float]:
+        # Sample standard deviation, as in describe()
+        if self.count < 2:
+            return None
+        return math.sqrt(self.m2 / (self.count - 1))
+
+    def summary(self) -> t.Dict[str, t.Optional[float]]:
+        """Numeric summary with the keys of DataFrame.describe()"""
+        quantiles = self.quantiles.quantiles(QUANTILES)
+        return {
+            "count": float(self.count),
+            "mean": self.mean if self.count else None,
+            "std": self.std,
+            "min": self.min,
+            "25%": quantiles[0],
+            "50%": quantiles[1],
+            "75%": quantiles[2],
+            "max": self.max,
+        }
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {
+            "dtype": self.dtype,
+            "count": self.count,
+            "nulls": self.nulls,
+            "mean": self.mean,
+            "m2": self.m2,
+            "min": self.min,
+            "max": self.max,
+            "quantiles": self.quantiles.to_dict() if self.numeric else None,
+            "distinct": self.distinct.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: t.Dict[str, t.Any]) -> "ColumnStats":
+        stats = cls(data["dtype"])
+        stats.count = data["count"]
+        stats.nulls = data["nulls"]
+        stats.mean = data["mean"]
+        stats.m2 = data["m2"]
+        stats.min = data["min"]
+        stats.max = data["max"]
+        if stats.numeric:
+            stats.quantiles = KLLSketch.from_dict(data["quantiles"])
+        stats.distinct = HyperLogLog.from_dict(data["distinct"])
+        return stats
+
+
+def merge_all(
+    accumulators: t.Iterable[t.Dict[str, ColumnStats]]
+) -> t.Dict[str, ColumnStats]:
+    """Merge per-chunk accumulators, column by column"""
+    merged: t.Dict[str, ColumnStats] = {}
+    for columns in accumulators:
+        for name, column in columns.items():
+            if name in merged:
+                merged[name].merge(column)
+            else:
+                merged[name] = column
+    return merged
+
+
+def report(columns: t.Dict[str, ColumnStats]) -> t.Dict[str, t.Any]:
+    """Statistics in the shape of the /datasets/{id}/analyze response"""
+    stats: t.Dict[str, t.Any] = {}
+
+    summary = {
+        name: column.summary() for name, column in columns.items() if column.numeric
+    }
+    if summary:
+        stats["summary"] = summary
+
+    stats["missing_values"] = {
+        name: column.nulls for name, column in columns.items() if column.nulls > 0
+    }
+    stats["data_types"] = {name: column.dtype for name, column in columns.items()}
+    stats["distinct_values"] = {
+        name: column.distinct.estimate() for name, column in columns.items()
+    }
+    return stats
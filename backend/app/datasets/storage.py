@@ -0,0 +1,590 @@
+"""
+Columnar on-disk storage for ingested datasets.
+
+Every dataset is converted once into a directory of segments. A segment holds
+one raw binary file per column plus a small JSON metadata file, so reads can
+load only the columns and row ranges they need without parsing any text:
+
+    {DATASET_STORE_DIR}/{dataset_id}/
+        manifest.json           schema, row count and ordered segment names
+                                of the current version
+        versions/000002.json    manifest of every version
+        segments/{sha256}/
+            meta.json           row count and min/max of numeric columns
+            0.bin               values of column 0
+            1.bin               dictionary codes of column 1 (strings)
+            1.dict.json         dictionary of column 1
+
+Segments are immutable and named by the hash of their content, so versions
+are copy-on-write: a version lists its segments, a segment equal to one
+written for an earlier version is not stored twice, and a new version only
+adds the segments that changed. Stores written before versions existed have
+their segments named by position and only a manifest.json.
+"""
+import bisect
+import functools
+import hashlib
+import json
+import os
+import shutil
+import typing as t
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from app.core import config
+from app.datasets.dtypes import CATEGORY, physical_dtype
+
+MANIFEST = "manifest.json"
+SEGMENT_META = "meta.json"
+SEGMENTS = "segments"
+VERSIONS = "versions"
+STORE_FORMAT = 1
+
+# String columns are stored as int32 codes into a per-segment dictionary,
+# -1 marks a missing value
+DICTIONARY_CODE = np.dtype(np.int32)
+
+
+def dataset_dir(dataset_id: int) -> str:
+    return os.path.join(config.DATASET_STORE_DIR, str(dataset_id))
+
+
+def version_manifest(path: str, version: int) -> str:
+    return os.path.join(path, VERSIONS, f"{version:06d}.json")
+
+
+def is_dictionary_encoded(dtype: str) -> bool:
+    """Strings, including categoricals, are stored as dictionary codes"""
+    return physical_dtype(dtype) == np.dtype(object)
+
+
+class _SegmentWriter:
+    def __init__(self, path: str, columns: t.List[t.Tuple[str, str]]):
+        os.makedirs(path)
+        self.path = path
+        self.columns = columns
+        self.row_count = 0
+        self._files = [
+            open(os.path.join(path, f"{i}.bin"), "wb")
+            for i in range(len(columns))
+        ]
+        self._dictionaries: t.Dict[int, t.Dict[str, int]] = {
+            i: {}
+            for i, (_, dtype) in enumerate(columns)
+            if is_dictionary_encoded(dtype)
+        }
+        # Min and max of numeric columns, used to skip whole segments
+        self._zone_maps: t.Dict[int, t.List[float]] = {}
+
+    def _encode(self, index: int, values: pd.Series) -> np.ndarray:
+        local_codes, uniques = pd.factorize(values)
+        dictionary = self._dictionaries[index]
+        mapping = np.array(
+            [dictionary.setdefault(str(v), len(dictionary)) for v in uniques],
+            dtype=DICTIONARY_CODE,
+        )
+        codes = np.full(len(values), -1, dtype=DICTIONARY_CODE)
+        present = local_codes >= 0
+        codes[present] = mapping[local_codes[present]]
+        return codes
+
+    def _update_zone_map(self, index: int, values: np.ndarray) -> None:
+        if values.dtype.kind == "f":
+            values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        low, high = values.min().item(), values.max().item()
+        if index in self._zone_maps:
+            zone = self._zone_maps[index]
+            low, high = min(zone[0], low), max(zone[1], high)
+        self._zone_maps[index] = [low, high]
+
+    def write(self, chunk: pd.DataFrame) -> None:
+        for i, (name, dtype) in enumerate(self.columns):
+            if i in self._dictionaries:
+                values = self._encode(i, chunk[name])
+            else:
+                values = np.asarray(chunk[name], dtype=dtype)
+                if values.dtype.kind in "iuf":
+                    self._update_zone_map(i, values)
+            self._files[i].write(values.tobytes())
+        self.row_count += len(chunk)
+
+    def close(self) -> None:
+        for f in self._files:
+            f.close()
+        for i, dictionary in self._dictionaries.items():
+            with open(os.path.join(self.path, f"{i}.dict.json"), "w") as f:
+                json.dump(list(dictionary), f)
+        with open(os.path.join(self.path, SEGMENT_META), "w") as f:
+            json.dump(
+                {"row_count": self.row_count, "zone_maps": self._zone_maps}, f
+            )
+
+    def digest(self) -> str:
+        """SHA-256 of the schema and files of the closed segment"""
+        digest = hashlib.sha256(json.dumps(self.columns).encode())
+        for name in sorted(os.listdir(self.path)):
+            digest.update(name.encode())
+            with open(os.path.join(self.path, name), "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+        return digest.hexdigest()
+
+
+def _write_segment(
+    path: str, columns: t.List[t.Tuple[str, str]], chunk: pd.DataFrame
+) -> t.Tuple[str, bool]:
+    """Write rows as one segment of the store at path, see _SegmentWriter"""
+    segment = _SegmentWriter(_segment_tmp(path), columns)
+    segment.write(chunk)
+    segment.close()
+    return _commit_segment(path, segment)
+
+
+def _segment_tmp(path: str) -> str:
+    return os.path.join(path, SEGMENTS, f".tmp-{uuid.uuid4().hex}")
+
+
+def _commit_segment(path: str, segment: _SegmentWriter) -> t.Tuple[str, bool]:
+    """
+    Move a closed segment to its content address. Returns its name and
+    whether it is new, an identical segment already stored is reused.
+    """
+    name = segment.digest()
+    dest = os.path.join(path, SEGMENTS, name)
+    if os.path.exists(dest):
+        shutil.rmtree(segment.path)
+        return name, False
+    try:
+        os.rename(segment.path, dest)
+    except OSError:
+        # Written concurrently by another writer
+        shutil.rmtree(segment.path)
+        return name, False
+    return name, True
+
+
+class DatasetWriter:
+    """
+    Write DataFrame chunks as a new version of the store at dest. Segments
+    are written next to those of the previous versions, readers keep seeing
+    the previous version until close() replaces the manifest.
+    """
+
+    def __init__(
+        self,
+        dest: str,
+        dtypes: t.Dict[str, str],
+        segment_rows: t.Optional[int] = None,
+        version: t.Optional[int] = None,
+    ):
+        self.dest = dest
+        self.columns = list(dtypes.items())
+        self.segment_rows = segment_rows or config.SEGMENT_ROWS
+        self.version = version
+        self.segments: t.List[str] = []
+        self.row_count = 0
+        # Segments this writer stored, and no earlier version references
+        self.created: t.List[str] = []
+        os.makedirs(os.path.join(dest, SEGMENTS), exist_ok=True)
+        self._segment: t.Optional[_SegmentWriter] = None
+
+    def _close_segment(self) -> None:
+        if self._segment is not None:
+            self._segment.close()
+            name, created = _commit_segment(self.dest, self._segment)
+            self.segments.append(name)
+            if created:
+                self.created.append(name)
+            self._segment = None
+
+    def write(self, chunk: pd.DataFrame) -> None:
+        chunk.columns = [str(c) for c in chunk.columns]
+        if self._segment is None:
+            self._segment = _SegmentWriter(_segment_tmp(self.dest), self.columns)
+        self._segment.write(chunk)
+        self.row_count += len(chunk)
+        if self._segment.row_count >= self.segment_rows:
+            self._close_segment()
+
+    def close(self) -> None:
+        self._close_segment()
+        manifest = {
+            "format": STORE_FORMAT,
+            "version": self.version,
+            "row_count": self.row_count,
+            "columns": [
+                {"name": name, "dtype": dtype} for name, dtype in self.columns
+            ],
+            "segments": self.segments,
+        }
+        _write_manifest(self.dest, manifest)
+
+    def abort(self) -> None:
+        if self._segment is not None:
+            self._segment.close()
+            shutil.rmtree(self._segment.path, ignore_errors=True)
+            self._segment = None
+        referenced = _referenced_segments(self.dest)
+        for name in self.created:
+            if name not in referenced:
+                shutil.rmtree(
+                    os.path.join(self.dest, SEGMENTS, name), ignore_errors=True
+                )
+
+
+def _write_manifest(path: str, manifest: t.Dict[str, t.Any]) -> None:
+    """Save the manifest of a version, then make it the current one"""
+    if manifest.get("version") is not None:
+        os.makedirs(os.path.join(path, VERSIONS), exist_ok=True)
+        dest = version_manifest(path, manifest["version"])
+        with open(f"{dest}.tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(f"{dest}.tmp", dest)
+
+    tmp = os.path.join(path, f"{MANIFEST}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(path, MANIFEST))
+
+
+def save_version(path: str, version: int) -> None:
+    """
+    Keep the current manifest as the given version before it is replaced,
+    for stores written before versions existed
+    """
+    if os.path.exists(version_manifest(path, version)):
+        return
+    try:
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return
+    if manifest.get("version") is None:
+        os.makedirs(os.path.join(path, VERSIONS), exist_ok=True)
+        dest = version_manifest(path, version)
+        with open(f"{dest}.tmp", "w") as f:
+            json.dump({**manifest, "version": version}, f)
+        os.replace(f"{dest}.tmp", dest)
+
+
+def _referenced_segments(path: str) -> t.Set[str]:
+    """Segments listed by the current manifest or any version"""
+    manifests = [os.path.join(path, MANIFEST)]
+    versions = os.path.join(path, VERSIONS)
+    if os.path.isdir(versions):
+        manifests += [
+            os.path.join(versions, name)
+            for name in os.listdir(versions)
+            if name.endswith(".json")
+        ]
+
+    referenced: t.Set[str] = set()
+    for manifest in manifests:
+        try:
+            with open(manifest) as f:
+                referenced.update(json.load(f)["segments"])
+        except FileNotFoundError:
+            pass
+    return referenced
+
+
+def prune_segments(path: str) -> int:
+    """
+    Delete the segments of a store that no version references, e.g. left
+    over by an interrupted ingest. Must not run while the store is written.
+    """
+    referenced = _referenced_segments(path)
+    segments = os.path.join(path, SEGMENTS)
+    removed = 0
+    for name in os.listdir(segments) if os.path.isdir(segments) else []:
+        if name not in referenced:
+            shutil.rmtree(os.path.join(segments, name), ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def _cast_segment(
+    path: str,
+    name: str,
+    columns: t.List[t.Tuple[str, str]],
+    cast: t.List[t.Tuple[str, str]],
+) -> str:
+    """Write a copy of a segment with the column types of cast"""
+    segment = Segment(os.path.join(path, SEGMENTS, name), 0)
+    chunk = pd.DataFrame(
+        {
+            column: segment.read_column(i, dtype, 0, segment.row_count)
+            for i, (column, dtype) in enumerate(columns)
+        },
+        columns=[column for column, _ in columns],
+    )
+    return _write_segment(path, cast, chunk)[0]
+
+
+def append_segment(
+    path: str,
+    chunk: pd.DataFrame,
+    version: t.Optional[int] = None,
+    dtypes: t.Optional[t.Dict[str, str]] = None,
+) -> None:
+    """
+    Write rows as a new segment on top of the current version, as the given
+    version. Existing segments are left untouched and readers see the new
+    rows once the manifest is replaced. Appends to the same store must not
+    run concurrently.
+
+    dtypes widens the types of columns whose new values they do not hold,
+    e.g. int8 to int16: the segments of the version are then copied with the
+    wider types, earlier versions keep reading the original ones.
+    """
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    columns = [(c["name"], c["dtype"]) for c in manifest["columns"]]
+
+    if dtypes is not None and dtypes != dict(columns):
+        widened = [(column, dtypes[column]) for column, _ in columns]
+        manifest["segments"] = [
+            _cast_segment(path, name, columns, widened)
+            for name in manifest["segments"]
+        ]
+        manifest["columns"] = [
+            {"name": column, "dtype": dtype} for column, dtype in widened
+        ]
+        columns = widened
+
+    name, _ = _write_segment(path, columns, chunk)
+    manifest["version"] = version
+    manifest["segments"].append(name)
+    manifest["row_count"] += len(chunk)
+    _write_manifest(path, manifest)
+
+
+class Segment:
+    """
+    One immutable segment of a store. Columns are opened as read-only memory
+    maps, so every process reading the same segment shares the page cache
+    instead of holding a private copy of the data.
+    """
+
+    def __init__(self, path: str, offset: int):
+        self.path = path
+        self.offset = offset
+        with open(os.path.join(path, SEGMENT_META)) as f:
+            meta = json.load(f)
+        self.row_count = meta["row_count"]
+        self.zone_maps: t.Dict[int, t.List[float]] = {
+            int(index): zone
+            for index, zone in meta.get("zone_maps", {}).items()
+        }
+        self._columns: t.Dict[int, np.ndarray] = {}
+        self._dictionaries: t.Dict[int, np.ndarray] = {}
+
+    def column(self, index: int, dtype: str) -> np.ndarray:
+        """Memory-mapped values of a column, dictionary codes for strings"""
+        if index not in self._columns:
+            file_dtype = (
+                DICTIONARY_CODE
+                if is_dictionary_encoded(dtype)
+                else np.dtype(dtype)
+            )
+            if self.row_count == 0:
+                # Empty files cannot be mapped
+                values = np.empty(0, dtype=file_dtype)
+            else:
+                values = np.memmap(
+                    os.path.join(self.path, f"{index}.bin"),
+                    dtype=file_dtype,
+                    mode="r",
+                    shape=(self.row_count,),
+                )
+            self._columns[index] = values
+        return self._columns[index]
+
+    def dictionary(self, index: int) -> np.ndarray:
+        """Values of a dictionary encoded column, followed by None for code -1"""
+        if index not in self._dictionaries:
+            with open(os.path.join(self.path, f"{index}.dict.json")) as f:
+                self._dictionaries[index] = np.array(
+                    json.load(f) + [None], dtype=object
+                )
+        return self._dictionaries[index]
+
+    def read_column(
+        self, index: int, dtype: str, start: int, stop: int
+    ) -> np.ndarray:
+        """Read rows [start, stop) of a column, relative to this segment"""
+        values = self.column(index, dtype)[start:stop]
+        if not is_dictionary_encoded(dtype):
+            return values
+        return self.dictionary(index)[values]
+
+
+class DatasetStore:
+    """Read access to the current or a given version of a columnar store"""
+
+    def __init__(self, path: str, version: t.Optional[int] = None):
+        self.path = path
+        manifest_path = (
+            os.path.join(path, MANIFEST)
+            if version is None
+            else version_manifest(path, version)
+        )
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        self.version: t.Optional[int] = manifest.get("version")
+        self.row_count: int = manifest["row_count"]
+        self.dtypes: t.Dict[str, str] = {
+            c["name"]: c["dtype"] for c in manifest["columns"]
+        }
+        self._index = {name: i for i, name in enumerate(self.dtypes)}
+        self.segments: t.List[Segment] = []
+        offset = 0
+        for name in manifest["segments"]:
+            segment = Segment(os.path.join(path, SEGMENTS, name), offset)
+            self.segments.append(segment)
+            offset += segment.row_count
+        self._offsets = [segment.offset for segment in self.segments]
+
+    @property
+    def columns(self) -> t.List[str]:
+        return list(self.dtypes)
+
+    def column_index(self, name: str) -> int:
+        return self._index[name]
+
+    def read_column(
+        self, name: str, start: int = 0, stop: t.Optional[int] = None
+    ) -> np.ndarray:
+        index = self._index[name]
+        dtype = self.dtypes[name]
+        stop = self.row_count if stop is None else min(stop, self.row_count)
+
+        parts = []
+        first = max(bisect.bisect_right(self._offsets, start) - 1, 0)
+        for segment in self.segments[first:]:
+            if segment.offset >= stop:
+                break
+            seg_start = max(start - segment.offset, 0)
+            seg_stop = min(stop - segment.offset, segment.row_count)
+            if seg_start < seg_stop:
+                parts.append(
+                    segment.read_column(index, dtype, seg_start, seg_stop)
+                )
+
+        if not parts:
+            return np.array([], dtype=physical_dtype(dtype))
+        # A range inside a single segment stays a view on the memory map
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def take(self, name: str, rows: np.ndarray) -> np.ndarray:
+        """Values of a column at the given sorted row numbers"""
+        index = self._index[name]
+        dtype = self.dtypes[name]
+        offsets = [segment.offset for segment in self.segments[1:]]
+
+        parts = []
+        for segment, segment_rows in zip(
+            self.segments, np.split(rows, np.searchsorted(rows, offsets))
+        ):
+            if len(segment_rows):
+                values = segment.column(index, dtype)[segment_rows - segment.offset]
+                if is_dictionary_encoded(dtype):
+                    values = segment.dictionary(index)[values]
+                parts.append(values)
+
+        if not parts:
+            return np.array([], dtype=physical_dtype(dtype))
+        return np.concatenate(parts)
+
+    def segment_column(
+        self, segment: Segment, name: str
+    ) -> t.Tuple[np.ndarray, t.Optional[np.ndarray]]:
+        """
+        Memory-mapped values of a column in one segment. String columns are
+        returned as codes together with their dictionary.
+        """
+        index = self._index[name]
+        dtype = self.dtypes[name]
+        values = segment.column(index, dtype)
+        if is_dictionary_encoded(dtype):
+            return values, segment.dictionary(index)[:-1]
+        return values, None
+
+    def null_count(self, name: str) -> int:
+        """Count missing values without decoding or copying the column"""
+        index = self._index[name]
+        dtype = self.dtypes[name]
+        kind = physical_dtype(dtype).kind
+
+        count = 0
+        for segment in self.segments:
+            values = segment.column(index, dtype)
+            if is_dictionary_encoded(dtype):
+                count += int(np.count_nonzero(values < 0))
+            elif kind == "f":
+                count += int(np.count_nonzero(np.isnan(values)))
+            elif kind == "M":
+                count += int(np.count_nonzero(np.isnat(values)))
+        return count
+
+    def read(
+        self,
+        columns: t.Optional[t.List[str]] = None,
+        start: int = 0,
+        stop: t.Optional[int] = None,
+    ) -> pd.DataFrame:
+        """
+        Load the given columns for rows [start, stop) into a DataFrame,
+        categorical columns as pandas categoricals
+        """
+        columns = self.columns if columns is None else columns
+        frame = pd.DataFrame(
+            {name: self.read_column(name, start, stop) for name in columns},
+            columns=columns,
+        )
+        for name in columns:
+            if self.dtypes[name] == CATEGORY:
+                frame[name] = frame[name].astype(CATEGORY)
+        return frame
+
+
+@functools.lru_cache(maxsize=64)
+def _load_store(
+    path: str, version: t.Optional[int], manifest_id: t.Tuple[int, int]
+) -> DatasetStore:
+    return DatasetStore(path, version)
+
+
+def open_store(
+    dataset_id: int, version: t.Optional[int] = None
+) -> t.Optional[DatasetStore]:
+    """
+    Open the current or a given version of the store of a dataset, None if
+    it was never converted or has no such version. Stores are cached per
+    process, together with their memory maps, until the manifest is replaced.
+    """
+    return open_store_path(dataset_dir(dataset_id), version)
+
+
+def open_store_path(
+    path: str, version: t.Optional[int] = None
+) -> t.Optional[DatasetStore]:
+    """open_store for the store at path, e.g. in a worker process"""
+    manifest_path = (
+        os.path.join(path, MANIFEST)
+        if version is None
+        else version_manifest(path, version)
+    )
+    try:
+        manifest = os.stat(manifest_path)
+    except FileNotFoundError:
+        return None
+    return _load_store(path, version, (manifest.st_ino, manifest.st_mtime_ns))
+
+
+def delete_store(dataset_id: int) -> None:
+    shutil.rmtree(dataset_dir(dataset_id), ignore_errors=True)
@@ -0,0 +1,195 @@
+"""
+Write-behind sink for the audit trail.
+
+crud.log_action hands entries to `audit_sink`, which queues them in memory
+and lets a background thread write them with one multi-row INSERT per
+batch, once AUDIT_BATCH_SIZE entries are queued or AUDIT_FLUSH_INTERVAL
+seconds after the first of a batch. Requests no longer pay a transaction
+of their own for their audit entry.
+
+The queue holds at most AUDIT_QUEUE_SIZE entries. When it is full, callers
+wait for room up to AUDIT_ENQUEUE_TIMEOUT seconds, then write their entry
+themselves rather than drop it. Entries still queued are written when the
+app shuts down or the process exits. In sync mode (AUDIT_SYNC, used by the
+tests) every entry is written at once, in the session of the caller.
+
+A batch that fails is retried AUDIT_WRITE_RETRIES times with exponential
+backoff, then written one entry at a time so that a single bad entry does
+not hold back the others. Entries that still fail are logged in full to
+the "app.db.audit.dead_letter" logger and counted as dropped.
+"""
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+import typing as t
+
+from sqlalchemy.orm import Session
+
+from app.core import config
+from app.db import models
+from app.db.session import engine
+
+logger = logging.getLogger(__name__)
+dead_letter = logging.getLogger(f"{__name__}.dead_letter")
+
+
+class AuditSink:
+    def __init__(
+        self,
+        batch_size: t.Optional[int] = None,
+        flush_interval: t.Optional[float] = None,
+        queue_size: t.Optional[int] = None,
+        enqueue_timeout: t.Optional[float] = None,
+        sync: t.Optional[bool] = None,
+        write_retries: t.Optional[int] = None,
+    ):
+        self.batch_size = batch_size or config.AUDIT_BATCH_SIZE
+        self.flush_interval = flush_interval or config.AUDIT_FLUSH_INTERVAL
+        self.enqueue_timeout = (
+            config.AUDIT_ENQUEUE_TIMEOUT if enqueue_timeout is None else enqueue_timeout
+        )
+        self.sync = config.AUDIT_SYNC if sync is None else sync
+        self.write_retries = (
+            config.AUDIT_WRITE_RETRIES if write_retries is None else write_retries
+        )
+        self._queue: "queue.Queue[t.Dict[str, t.Any]]" = queue.Queue(
+            queue_size or config.AUDIT_QUEUE_SIZE
+        )
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: t.Optional[threading.Thread] = None
+        self.counters = {
+            "written": 0,
+            "batches": 0,
+            "failures": 0,
+            "retries": 0,
+            "overflowed": 0,
+            "dropped": 0,
+        }
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name="audit-sink", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self) -> None:
+        """Write the entries still queued and stop the writer thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+        self.flush()
+
+    def log(self, db: Session, entry: t.Dict[str, t.Any]) -> None:
+        """Record an audit entry, a dict of AuditLog columns"""
+        if self.sync:
+            db.add(models.AuditLog(**entry))
+            db.commit()
+            return
+
+        self.start()
+        try:
+            self._queue.put(entry, timeout=self.enqueue_timeout)
+        except queue.Full:
+            # The writer is behind or failing, do not lose the entry. No
+            # retries, the caller is serving a request
+            self._count("overflowed")
+            self._deliver([entry], retries=0)
+
+    def flush(self) -> None:
+        """Write every queued entry now, from the calling thread"""
+        while True:
+            batch = self._drain()
+            if not batch:
+                return
+            self._deliver(batch, self.write_retries)
+
+    def _drain(self) -> t.List[t.Dict[str, t.Any]]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            # Fill the batch until it is full or the interval is over
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._deliver(batch, self.write_retries)
+
+    def _deliver(self, batch: t.List[t.Dict[str, t.Any]], retries: int) -> None:
+        """
+        Write batch, retrying it with backoff, e.g. while the database
+        restarts, then entry by entry. Retries end early once stop() is called
+        """
+        if self._write(batch):
+            return
+        for attempt in range(retries):
+            if self._stop.wait(self.flush_interval * 2 ** attempt):
+                break
+            self._count("retries")
+            if self._write(batch):
+                return
+
+        for entry in batch:
+            if len(batch) > 1 and self._write([entry]):
+                continue
+            dead_letter.error(json.dumps(entry, default=str))
+            self._count("dropped")
+
+    def _write(self, batch: t.List[t.Dict[str, t.Any]]) -> bool:
+        try:
+            with engine.begin() as connection:
+                connection.execute(models.AuditLog.__table__.insert().values(batch))
+        except Exception:
+            logger.exception("Could not write %d audit log entries", len(batch))
+            self._count("failures")
+            return False
+        with self._lock:
+            self.counters["written"] += len(batch)
+            self.counters["batches"] += 1
+        return True
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self.counters[counter] += 1
+
+    def metrics(self) -> t.Dict[str, t.Any]:
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            "sync": self.sync,
+            "running": self._thread is not None,
+            "queued": self._queue.qsize(),
+            "queue_size": self._queue.maxsize,
+            **counters,
+        }
+
+
+audit_sink = AuditSink()
+atexit.register(audit_sink.stop)
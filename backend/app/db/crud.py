@@ -1,12 +1,22 @@
+import hashlib
 import json
+import typing as t
 from fastapi import UploadFile, File, HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 import pandas as pd
 import os
+import uuid
 from typing import List, Optional, Dict, Any
+from datetime import datetime
 
-from . import models, schemas
+from . import models, pagination, schemas
+from .audit import audit_sink
+from app.core import config
 from app.core.security import get_password_hash
+from app.datasets import analysis, charts, ingest, profiles, rowindex, storage
+from app.datasets.query import QueryError, run_query
 
 
 def get_user(db: Session, user_id: int):
@@ -23,7 +33,11 @@ def get_user_by_email(db: Session, email: str) -> schemas.UserBase:
 def get_users(
     db: Session, skip: int = 0, limit: int = 100
 ) -> t.List[schemas.UserOut]:
-    return db.query(models.User).offset(skip).limit(limit).all()
+    return db.query(models.User).order_by(models.User.id).offset(skip).limit(limit).all()
+
+
+def count_users(db: Session) -> int:
+    return db.query(models.User).count()
 
 
 def create_user(db: Session, user: schemas.UserCreate):
@@ -73,66 +87,366 @@ def edit_user(
 
 
 # Dataset CRUD operations
-def create_dataset(db: Session, dataset: schemas.DatasetCreate, file: UploadFile, user_id: int):
-    # Save file to disk
-    file_location = f"data/uploads/{file.filename}"
-    os.makedirs(os.path.dirname(file_location), exist_ok=True)
-
-    with open(file_location, "wb") as f:
-        f.write(file.file.read())
-
-    # Determine file type and load data for preview
+def save_dataset_file(file: UploadFile):
+    """
+    Stream an upload to disk, indexing CSV rows in the same pass. Returns
+    its path, file type, SHA-256 and the sheets to ingest, [None] for files
+    without sheets. Nothing is left on disk when it fails.
+
+    Every upload gets a path of its own, ingest reads the file later and
+    must not see another upload of the same name. The name sent by the
+    client is only kept as the file_name of the dataset
+    """
     file_type = file.filename.split(".")[-1].lower()
 
-    if file_type == "csv":
-        df = pd.read_csv(file_location)
-    elif file_type in ["xlsx", "xls"]:
-        df = pd.read_excel(file_location)
-    else:
+    if file_type not in ingest.SUPPORTED_FILE_TYPES:
         raise HTTPException(status_code=400, detail="Unsupported file type. Please upload CSV or XLSX files.")
 
+    file_location = os.path.join(config.UPLOAD_DIR, f"{uuid.uuid4().hex}.{file_type}")
+    indexer = rowindex.CSVRowIndexer() if file_type == "csv" else None
+    try:
+        _, content_hash = ingest.save_upload(
+            file.file, file_location, on_chunk=indexer.feed if indexer else None
+        )
+        if indexer:
+            indexer.save(file_location)
+        try:
+            sheets = ingest.sheet_names(file_location, file_type) or [None]
+        except Exception:
+            raise HTTPException(status_code=400, detail="The uploaded workbook could not be read.")
+    except BaseException:
+        remove_dataset_file(file_location)
+        raise
+    return file_location, file_type, content_hash, sheets
+
+
+def remove_dataset_file(file_location: str):
+    """Delete an uploaded file and its row index"""
+    for path in (file_location, rowindex.index_path(file_location)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def create_dataset(db: Session, dataset: schemas.DatasetCreate, file_location: str, file_type: str,
+                   content_hash: str, sheets: List[Optional[str]], user_id: int,
+                   file_name: Optional[str] = None):
+    """
+    Record a stored upload, it is parsed later by ingest_dataset. Every
+    sheet of a workbook becomes a dataset of its own, the first one is
+    returned and the others have it as parent
+    """
     # Create dataset in database
-    db_dataset = models.Dataset(
-        name=dataset.name,
-        description=dataset.description,
-        file_path=file_location,
-        file_type=file_type,
-        row_count=len(df),
-        column_count=len(df.columns),
-        is_public=dataset.is_public,
-        owner_id=user_id
-    )
+    parent = None
+    for sheet in sheets:
+        db_dataset = models.Dataset(
+            name=dataset.name if parent is None else f"{dataset.name} ({sheet})",
+            description=dataset.description,
+            file_path=file_location,
+            file_name=file_name,
+            file_type=file_type,
+            is_public=dataset.is_public,
+            owner_id=user_id,
+            status="stored",
+            progress=0.0,
+            job_id=str(uuid.uuid4()),
+            content_hash=content_hash,
+            sheet_name=sheet,
+            parent_id=parent.id if parent else None
+        )
+        db.add(db_dataset)
+        db.flush()
+        parent = parent or db_dataset
 
-    db.add(db_dataset)
     db.commit()
-    db.refresh(db_dataset)
+    db.refresh(parent)
+    return parent
+
+
+def get_dataset_sheets(db: Session, dataset: models.Dataset):
+    """The datasets of every sheet of the workbook a dataset was read from"""
+    root_id = dataset.parent_id or dataset.id
+    return db.query(models.Dataset).filter(
+        (models.Dataset.id == root_id) | (models.Dataset.parent_id == root_id)
+    ).order_by(models.Dataset.id).all()
+
+
+def ingest_dataset(db: Session, dataset_id: int):
+    """Parse and profile a stored upload, recording progress on the dataset"""
+    db_dataset = db.query(models.Dataset).filter(models.Dataset.id == dataset_id).first()
+
+    if not db_dataset:
+        raise HTTPException(status_code=404, detail="Dataset not found")
 
-    # Create dataset columns
-    for column in df.columns:
-        data_type = str(df[column].dtype)
-        db_column = models.DatasetColumn(
-            name=column,
-            data_type=data_type,
-            dataset_id=db_dataset.id
+    def report_progress(progress: float):
+        db_dataset.progress = progress
+        db.commit()
+
+    try:
+        # Profile the file in a chunked pass, then convert it once into the
+        # columnar store used by every read path
+        profile = ingest.profile_file(
+            db_dataset.file_path, db_dataset.file_type,
+            progress=lambda p: report_progress(p / 2), sheet=db_dataset.sheet_name
         )
-        db.add(db_column)
+        store = ingest.convert_file(
+            db_dataset.id, db_dataset.file_path, db_dataset.file_type, profile.optimized,
+            progress=lambda p: report_progress(0.5 + p / 2), version=db_dataset.version,
+            sheet=db_dataset.sheet_name
+        )
+        db_dataset.status = "parsed"
+        db.commit()
+
+        # Replace the columns of a previous attempt, if any
+        db.query(models.DatasetColumn).filter(
+            models.DatasetColumn.dataset_id == db_dataset.id
+        ).delete()
+        column_profiles = profiles.profile_store(store)
+        for column, data_type in profile.optimized.items():
+            db_column = models.DatasetColumn(
+                name=column,
+                data_type=data_type,
+                profile=json.dumps(column_profiles[column]),
+                dataset_id=db_dataset.id
+            )
+            db.add(db_column)
+
+        db_dataset.row_count = profile.row_count
+        db_dataset.column_count = len(profile.dtypes)
+        db_dataset.memory_footprint = json.dumps(profile.memory)
+        record_dataset_version(db, db_dataset)
+        save_dataset_stats(db, db_dataset, analysis.analyze_store(store))
+        db_dataset.status = "profiled"
+        db_dataset.progress = 1.0
+        db_dataset.error = None
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        db_dataset.status = "failed"
+        db_dataset.error = str(e)
+        db.commit()
+        raise
 
-    db.commit()
     db.refresh(db_dataset)
+    return db_dataset
+
+
+def replace_dataset_file(db: Session, dataset_id: int, file: UploadFile, user_id: int):
+    """
+    Store a new upload as the next version of a dataset, it is parsed later
+    by ingest_dataset. Earlier versions stay readable, segments they share
+    with the new one are stored once
+    """
+    db_dataset = db.query(models.Dataset).filter(
+        models.Dataset.id == dataset_id,
+        models.Dataset.owner_id == user_id
+    ).first()
+
+    if not db_dataset:
+        raise HTTPException(status_code=404, detail="Dataset not found or you don't have permission to edit")
+
+    file_location, file_type, content_hash, sheets = save_dataset_file(file)
+    try:
+        # A dataset read from a worksheet is read from the same one again
+        if db_dataset.sheet_name is not None and db_dataset.sheet_name not in sheets:
+            raise HTTPException(
+                status_code=400,
+                detail=f"The uploaded file has no sheet named {db_dataset.sheet_name}."
+            )
+        if db_dataset.status == "profiled":
+            storage.save_version(storage.dataset_dir(db_dataset.id), db_dataset.version)
+        db_dataset.file_path = file_location
+        db_dataset.file_name = file.filename
+        db_dataset.file_type = file_type
+        db_dataset.content_hash = content_hash
+        db_dataset.version += 1
+        db_dataset.status = "stored"
+        db_dataset.progress = 0.0
+        db_dataset.job_id = str(uuid.uuid4())
+        db_dataset.error = None
 
+        db.commit()
+    except BaseException:
+        # Only the new upload is removed, the previous version keeps its file
+        db.rollback()
+        remove_dataset_file(file_location)
+        raise
+    db.refresh(db_dataset)
     return db_dataset
 
 
-def get_datasets(db: Session, skip: int = 0, limit: int = 100, user_id: Optional[int] = None):
-    """Get all datasets accessible by the user (owned or public)"""
-    query = db.query(models.Dataset)
+def record_dataset_version(db: Session, dataset: models.Dataset):
+    """Record the current content of a dataset as a version, once ingested"""
+    db_version = db.query(models.DatasetVersion).filter(
+        models.DatasetVersion.dataset_id == dataset.id,
+        models.DatasetVersion.version == dataset.version
+    ).first()
 
-    if user_id:
-        query = query.filter(
-            (models.Dataset.owner_id == user_id) | (models.Dataset.is_public == True)
-        )
+    if not db_version:
+        db_version = models.DatasetVersion(dataset_id=dataset.id, version=dataset.version)
+        db.add(db_version)
+    db_version.content_hash = dataset.content_hash
+    db_version.row_count = dataset.row_count
+    return db_version
+
+
+def get_dataset_versions(db: Session, dataset_id: int, user_id: Optional[int] = None):
+    dataset = get_dataset(db, dataset_id, user_id)
+    return dataset.versions
+
+
+def get_dataset_version(db: Session, dataset: models.Dataset, version: int):
+    db_version = db.query(models.DatasetVersion).filter(
+        models.DatasetVersion.dataset_id == dataset.id,
+        models.DatasetVersion.version == version
+    ).first()
+
+    if not db_version:
+        raise HTTPException(status_code=404, detail="Dataset version not found")
+
+    return db_version
 
-    return query.offset(skip).limit(limit).all()
+
+def open_dataset_store(dataset: models.Dataset, version: Optional[int] = None):
+    """Columnar store of the current or a given version of a dataset"""
+    if version is not None and version != dataset.version:
+        store = storage.open_store(dataset.id, version)
+        if store is None:
+            raise HTTPException(status_code=409, detail="Dataset version has no stored data")
+        return store
+
+    # Datasets ingested before versions existed only have a current manifest
+    store = storage.open_store(dataset.id)
+    if dataset.status != "profiled" or store is None:
+        raise HTTPException(status_code=409, detail="Dataset has not been ingested yet")
+    return store
+
+
+def _check_version_pin(db: Session, dataset_id: int, version_id: Optional[int]):
+    if version_id is None:
+        return
+    db_version = db.query(models.DatasetVersion).filter(
+        models.DatasetVersion.id == version_id,
+        models.DatasetVersion.dataset_id == dataset_id
+    ).first()
+
+    if not db_version:
+        raise HTTPException(status_code=400, detail="Dataset version not found for this dataset")
+
+
+def get_memory_footprint(db: Session, dataset_id: int, user_id: Optional[int] = None) -> Dict[str, Any]:
+    """Memory of a dataset loaded with the types pandas infers and with the stored ones"""
+    dataset = get_dataset(db, dataset_id, user_id)
+    if dataset.memory_footprint is None:
+        raise HTTPException(status_code=409, detail="Memory footprint is recorded when the dataset is ingested")
+
+    return json.loads(dataset.memory_footprint)
+
+
+def get_dataset_stats(db: Session, dataset: models.Dataset) -> Optional[Dict[str, Any]]:
+    """Cached analyze statistics of the current content of a dataset"""
+    db_stats = db.query(models.DatasetStats).filter(
+        models.DatasetStats.dataset_id == dataset.id,
+        models.DatasetStats.version == dataset.version,
+        models.DatasetStats.content_hash == dataset.content_hash
+    ).first()
+
+    return json.loads(db_stats.stats) if db_stats else None
+
+
+def save_dataset_stats(db: Session, dataset: models.Dataset, stats: Dict[str, Any]):
+    """Cache the analyze statistics of a dataset, dropping stale entries"""
+    db.query(models.DatasetStats).filter(
+        models.DatasetStats.dataset_id == dataset.id
+    ).delete()
+    db.add(models.DatasetStats(
+        dataset_id=dataset.id,
+        version=dataset.version,
+        content_hash=dataset.content_hash,
+        stats=json.dumps(stats)
+    ))
+
+    try:
+        db.commit()
+    except IntegrityError:
+        # Computed concurrently by another request
+        db.rollback()
+
+
+def append_rows(db: Session, dataset_id: int, body: bytes, content_type: str, user_id: int):
+    """
+    Append rows to a dataset as a new segment of its store. Statistics and
+    column profiles are updated by merging the accumulators saved with the
+    existing segments with those of the new one, without rescanning them.
+    Columns whose compact type does not hold the new values are widened
+    """
+    # The row lock serialises appends to the same store
+    db_dataset = db.query(models.Dataset).filter(
+        models.Dataset.id == dataset_id,
+        models.Dataset.owner_id == user_id
+    ).with_for_update().first()
+
+    if not db_dataset:
+        raise HTTPException(status_code=404, detail="Dataset not found or you don't have permission to edit")
+
+    store = storage.open_store(db_dataset.id)
+    if db_dataset.status != "profiled" or store is None:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Dataset has not been ingested yet")
+
+    try:
+        rows, dtypes = ingest.parse_rows(body, content_type, store.dtypes)
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    if rows.empty:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="No rows to append")
+
+    # A new version, whose content is the previous one plus the new rows
+    path = storage.dataset_dir(db_dataset.id)
+    storage.save_version(path, db_dataset.version)
+    db_dataset.version += 1
+    storage.append_segment(path, rows, db_dataset.version, dtypes)
+    store = storage.open_store(db_dataset.id)
+
+    db_dataset.content_hash = hashlib.sha256(
+        (db_dataset.content_hash or "").encode() + body
+    ).hexdigest()
+    db_dataset.row_count = store.row_count
+    record_dataset_version(db, db_dataset)
+
+    column_profiles = profiles.profile_store(store)
+    for db_column in db_dataset.columns:
+        db_column.data_type = dtypes[db_column.name]
+        db_column.profile = json.dumps(column_profiles[db_column.name])
+    db.commit()
+    save_dataset_stats(db, db_dataset, analysis.analyze_store(store))
+
+    db.refresh(db_dataset)
+    return db_dataset
+
+
+def get_column_profile(db: Session, dataset_id: int, column_name: str,
+                       user_id: Optional[int] = None) -> Dict[str, Any]:
+    """Histograms or most frequent values of a dataset column"""
+    dataset = get_dataset(db, dataset_id, user_id)
+    column = next((c for c in dataset.columns if c.name == column_name), None)
+    if not column:
+        raise HTTPException(status_code=404, detail="Column not found")
+
+    if column.profile is None:
+        # Columns ingested before profiles existed
+        store = storage.open_store(dataset.id)
+        if dataset.status != "profiled" or store is None:
+            raise HTTPException(status_code=409, detail="Dataset has not been ingested yet")
+        column_profiles = profiles.profile_store(store)
+        for db_column in dataset.columns:
+            db_column.profile = json.dumps(column_profiles[db_column.name])
+        db.commit()
+
+    return {"name": column.name, "data_type": column.data_type, **json.loads(column.profile)}
 
 
 def get_dataset(db: Session, dataset_id: int, user_id: Optional[int] = None):
@@ -181,35 +495,67 @@ def delete_dataset(db: Session, dataset_id: int, user_id: int):
     if not db_dataset:
         raise HTTPException(status_code=404, detail="Dataset not found or you don't have permission to delete")
 
-    # Delete the file
-    try:
-        os.remove(db_dataset.file_path)
-    except:
-        pass  # Ignore errors if file doesn't exist
+    # Delete the file and its row index, unless another sheet still reads it
+    shared = db.query(models.Dataset).filter(
+        models.Dataset.file_path == db_dataset.file_path,
+        models.Dataset.id != db_dataset.id
+    ).count()
+    if not shared:
+        remove_dataset_file(db_dataset.file_path)
+    storage.delete_store(db_dataset.id)
 
     db.delete(db_dataset)
     db.commit()
     return db_dataset
 
 
-def preview_dataset(db: Session, dataset_id: int, user_id: Optional[int] = None, n_rows: int = 10):
-    """Preview the first n rows of a dataset"""
+def get_preview_source(db: Session, dataset_id: int, user_id: Optional[int] = None,
+                       version: Optional[int] = None):
+    """
+    Where to read the rows of the current or a given version of a dataset
+    from, as arguments of jobs.read_rows
+    """
     dataset = get_dataset(db, dataset_id, user_id)
-
-    if dataset.file_type == "csv":
-        df = pd.read_csv(dataset.file_path, nrows=n_rows)
-    elif dataset.file_type in ["xlsx", "xls"]:
-        df = pd.read_excel(dataset.file_path, nrows=n_rows)
+    if version is not None:
+        get_dataset_version(db, dataset, version)
+        store = open_dataset_store(dataset, version)
     else:
+        store = storage.open_store(dataset.id)
+
+    if store is not None:
+        # open_dataset_store reads the current manifest for the current version
+        pinned = version if version is not None and version != dataset.version else None
+        return {"store_path": store.path, "version": pinned}
+    if dataset.file_type not in ingest.SUPPORTED_FILE_TYPES:
         raise HTTPException(status_code=400, detail="Unsupported file type")
+    # Not ingested yet, or uploaded before the columnar store existed
+    return {"file_path": dataset.file_path, "file_type": dataset.file_type,
+            "sheet_name": dataset.sheet_name}
+
 
-    return df.to_dict(orient="records")
+def query_dataset(db: Session, dataset_id: int, query: schemas.DatasetQuery,
+                  user_id: Optional[int] = None, version: Optional[int] = None):
+    """Filter, group and aggregate the current or a given version of a dataset"""
+    dataset = get_dataset(db, dataset_id, user_id)
+    if version is not None:
+        get_dataset_version(db, dataset, version)
+    store = open_dataset_store(dataset, version)
+
+    if version is None or version == dataset.version:
+        column_types = {column.name: column.data_type for column in dataset.columns}
+    else:
+        column_types = store.dtypes
+    try:
+        return run_query(store, query, column_types)
+    except QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 # Visualization CRUD operations
 def create_visualization(db: Session, viz: schemas.VisualizationCreate, user_id: int):
     # Verify dataset exists and user has access
     dataset = get_dataset(db, viz.dataset_id, user_id)
+    _check_version_pin(db, viz.dataset_id, viz.dataset_version_id)
 
     db_viz = models.Visualization(
         name=viz.name,
@@ -218,7 +564,8 @@ def create_visualization(db: Session, viz: schemas.VisualizationCreate, user_id:
         config=viz.config,
         is_public=viz.is_public,
         creator_id=user_id,
-        dataset_id=viz.dataset_id
+        dataset_id=viz.dataset_id,
+        dataset_version_id=viz.dataset_version_id
     )
 
     db.add(db_viz)
@@ -227,18 +574,6 @@ def create_visualization(db: Session, viz: schemas.VisualizationCreate, user_id:
     return db_viz
 
 
-def get_visualizations(db: Session, skip: int = 0, limit: int = 100, user_id: Optional[int] = None):
-    """Get all visualizations accessible by the user (created by or public)"""
-    query = db.query(models.Visualization)
-
-    if user_id:
-        query = query.filter(
-            (models.Visualization.creator_id == user_id) | (models.Visualization.is_public == True)
-        )
-
-    return query.offset(skip).limit(limit).all()
-
-
 def get_visualization(db: Session, viz_id: int, user_id: Optional[int] = None):
     """Get a specific visualization if accessible by the user"""
     query = db.query(models.Visualization).filter(models.Visualization.id == viz_id)
@@ -266,6 +601,7 @@ def update_visualization(db: Session, viz_id: int, viz: schemas.VisualizationEdi
         raise HTTPException(status_code=404, detail="Visualization not found or you don't have permission to edit")
 
     update_data = viz.dict(exclude_unset=True)
+    _check_version_pin(db, db_viz.dataset_id, update_data.get("dataset_version_id"))
 
     for key, value in update_data.items():
         setattr(db_viz, key, value)
@@ -276,6 +612,75 @@ def update_visualization(db: Session, viz_id: int, viz: schemas.VisualizationEdi
     return db_viz
 
 
+def get_visualization_data(db: Session, viz_id: int, user_id: Optional[int] = None,
+                           points: Optional[int] = None, method: str = "lttb",
+                           version: Optional[int] = None):
+    """
+    Series of a visualization computed from the given version of its
+    dataset, else the pinned or the current one, line and scatter series
+    downsampled to `points` per series. Cached per request parameters and
+    version until the visualization changes, versions never change
+    """
+    viz = get_visualization(db, viz_id, user_id)
+    dataset = viz.dataset
+    if version is None and viz.dataset_version is not None:
+        version = viz.dataset_version.version
+    if version is not None and version != dataset.version:
+        content_hash = get_dataset_version(db, dataset, version).content_hash
+    else:
+        version, content_hash = dataset.version, dataset.content_hash
+
+    params = f"points={points}&method={method}" if points else ""
+    cached = db.query(models.VisualizationData).filter(
+        models.VisualizationData.visualization_id == viz.id,
+        models.VisualizationData.params == params,
+        models.VisualizationData.updated_at == viz.updated_at,
+        models.VisualizationData.dataset_version == version,
+        models.VisualizationData.content_hash == content_hash
+    ).first()
+    if cached:
+        return json.loads(cached.data)
+
+    store = open_dataset_store(dataset, version)
+    if version == dataset.version:
+        column_types = {column.name: column.data_type for column in dataset.columns}
+        column_profiles = {
+            column.name: json.loads(column.profile)
+            for column in dataset.columns if column.profile
+        }
+    else:
+        column_types = store.dtypes
+        column_profiles = profiles.profile_store(store)
+    try:
+        data = charts.chart_data(
+            store, viz.type, viz.config, column_types, points, method, column_profiles
+        )
+    except (charts.ConfigError, QueryError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    data = jsonable_encoder(data)
+
+    # Drop the entries of older definitions of the visualization
+    db.query(models.VisualizationData).filter(
+        models.VisualizationData.visualization_id == viz.id,
+        models.VisualizationData.updated_at != viz.updated_at
+    ).delete(synchronize_session=False)
+    db.add(models.VisualizationData(
+        visualization_id=viz.id,
+        updated_at=viz.updated_at,
+        dataset_version=version,
+        content_hash=content_hash,
+        params=params,
+        data=json.dumps(data)
+    ))
+
+    try:
+        db.commit()
+    except IntegrityError:
+        # Computed concurrently by another request
+        db.rollback()
+    return data
+
+
 def delete_visualization(db: Session, viz_id: int, user_id: int):
     db_viz = db.query(models.Visualization).filter(
         models.Visualization.id == viz_id,
@@ -294,6 +699,7 @@ def delete_visualization(db: Session, viz_id: int, user_id: int):
 def create_report(db: Session, report: schemas.ReportCreate, user_id: int):
     # Verify dataset exists and user has access
     dataset = get_dataset(db, report.dataset_id, user_id)
+    _check_version_pin(db, report.dataset_id, report.dataset_version_id)
 
     db_report = models.Report(
         name=report.name,
@@ -301,7 +707,8 @@ def create_report(db: Session, report: schemas.ReportCreate, user_id: int):
         content=report.content,
         is_public=report.is_public,
         creator_id=user_id,
-        dataset_id=report.dataset_id
+        dataset_id=report.dataset_id,
+        dataset_version_id=report.dataset_version_id
     )
 
     db.add(db_report)
@@ -321,18 +728,6 @@ def create_report(db: Session, report: schemas.ReportCreate, user_id: int):
     return db_report
 
 
-def get_reports(db: Session, skip: int = 0, limit: int = 100, user_id: Optional[int] = None):
-    """Get all reports accessible by the user (created by or public)"""
-    query = db.query(models.Report)
-
-    if user_id:
-        query = query.filter(
-            (models.Report.creator_id == user_id) | (models.Report.is_public == True)
-        )
-
-    return query.offset(skip).limit(limit).all()
-
-
 def get_report(db: Session, report_id: int, user_id: Optional[int] = None):
     """Get a specific report if accessible by the user"""
     query = db.query(models.Report).filter(models.Report.id == report_id)
@@ -360,6 +755,7 @@ def update_report(db: Session, report_id: int, report: schemas.ReportEdit, user_
         raise HTTPException(status_code=404, detail="Report not found or you don't have permission to edit")
 
     update_data = report.dict(exclude={"visualization_ids"}, exclude_unset=True)
+    _check_version_pin(db, db_report.dataset_id, update_data.get("dataset_version_id"))
 
     for key, value in update_data.items():
         setattr(db_report, key, value)
@@ -397,29 +793,32 @@ def delete_report(db: Session, report_id: int, user_id: int):
 # Audit log functions
 def log_action(db: Session, user_id: int, action: str, entity_type: str, entity_id: int, details: Optional[Dict] = None,
                ip_address: Optional[str] = None):
-    """Log user actions for audit trail"""
-    details_json = json.dumps(details) if details else None
-
-    db_log = models.AuditLog(
-        action=action,
-        entity_type=entity_type,
-        entity_id=entity_id,
-        details=details_json,
-        ip_address=ip_address,
-        user_id=user_id
-    )
-
-    db.add(db_log)
-    db.commit()
-    return db_log
+    """Log user actions for audit trail, written in the background by audit_sink"""
+    entry = {
+        "action": action,
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "details": json.dumps(details) if details else None,
+        "ip_address": ip_address,
+        "timestamp": datetime.utcnow(),
+        "user_id": user_id,
+    }
+    audit_sink.log(db, entry)
+    return models.AuditLog(**entry)
 
 
 def get_audit_logs(db: Session, skip: int = 0, limit: int = 100,
                    user_id: Optional[int] = None, entity_type: Optional[str] = None,
-                   entity_id: Optional[int] = None, action: Optional[str] = None):
-    """Get audit logs with optional filtering"""
+                   entity_id: Optional[int] = None, action: Optional[str] = None,
+                   cursor: Optional[str] = None):
+    """Get audit logs with optional filtering, newest first, after cursor if given"""
     query = db.query(models.AuditLog)
 
+    if cursor:
+        query = query.filter(pagination.before(
+            (models.AuditLog.timestamp, models.AuditLog.id), pagination.audit_log_cursor(cursor)
+        ))
+
     if user_id:
         query = query.filter(models.AuditLog.user_id == user_id)
 
@@ -432,4 +831,38 @@ def get_audit_logs(db: Session, skip: int = 0, limit: int = 100,
     if action:
         query = query.filter(models.AuditLog.action == action)
 
-    return query.order_by(models.AuditLog.timestamp.desc()).offset(skip).limit(limit).all()
\ No newline at end of file
+    return query.order_by(
+        models.AuditLog.timestamp.desc(), models.AuditLog.id.desc()
+    ).offset(skip).limit(limit).all()
+
+
+def iter_audit_logs(db: Session, user_id: Optional[int] = None, entity_type: Optional[str] = None,
+                    action: Optional[str] = None, start: Optional[datetime] = None,
+                    end: Optional[datetime] = None) -> t.Iterator[t.Tuple]:
+    """
+    Audit log rows as tuples of their columns, oldest first, logged from
+    start to before end when given. Read from a server-side cursor in
+    batches of EXPORT_BATCH_ROWS, so that any number of rows can be read
+    in constant memory
+    """
+    columns = models.AuditLog.__table__.columns
+    query = db.query(*columns)
+
+    if user_id:
+        query = query.filter(models.AuditLog.user_id == user_id)
+
+    if entity_type:
+        query = query.filter(models.AuditLog.entity_type == entity_type)
+
+    if action:
+        query = query.filter(models.AuditLog.action == action)
+
+    if start:
+        query = query.filter(models.AuditLog.timestamp >= start)
+
+    if end:
+        query = query.filter(models.AuditLog.timestamp < end)
+
+    return iter(query.order_by(
+        models.AuditLog.timestamp, models.AuditLog.id
+    ).yield_per(config.EXPORT_BATCH_ROWS))
\ No newline at end of file
@@ -0,0 +1,258 @@
+"""
+Async versions of the hot read paths of crud, run on an AsyncSession so
+that the event loop serves other requests while they wait for Postgres.
+They apply the same filters and raise the same errors as their sync
+counterparts, and return model instances that are not attached to any
+session: their columns, and DatasetOut.columns for datasets, are loaded,
+other relationships are not.
+"""
+import typing as t
+from collections import defaultdict
+from typing import List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import func, select, union_all
+
+from app.core import config
+from . import models, pagination
+from .session import AsyncSession
+
+M = t.TypeVar("M", bound=models.Base)
+
+
+def _select(model: t.Type[M]):
+    return select([model.__table__])
+
+
+def _instances(model: t.Type[M], rows: t.List[t.Dict[str, t.Any]]) -> t.List[M]:
+    return [model(**row) for row in rows]
+
+
+def _accessible(model: t.Type[M], owner, user_id: Optional[int], *criteria):
+    """Rows of model matching criteria, owned by user_id or public"""
+    query = _select(model)
+    for criterion in criteria:
+        query = query.where(criterion)
+    if user_id:
+        query = query.where((owner == user_id) | (model.is_public == True))
+    return query
+
+
+def _accessible_page(model: t.Type[M], owner, user_id: Optional[int], skip: int,
+                     limit: int, cursor: Optional[str], *criteria):
+    """
+    Page of _accessible rows in id order, after cursor if given. The rows
+    owned by user_id and the public ones are read with one index seek
+    each, where the OR of both would be filtered out of an id scan
+    """
+    if cursor:
+        criteria += (model.id > pagination.id_cursor(cursor),)
+
+    def seek(*where):
+        query = _accessible(model, owner, None, *criteria, *where)
+        return query.order_by(model.id).limit(skip + limit)
+
+    if not user_id:
+        return seek().offset(skip).limit(limit)
+    rows = union_all(
+        seek(owner == user_id),
+        seek(model.is_public == True, owner.is_distinct_from(user_id)),
+    ).alias()
+    return select([rows]).order_by(rows.c.id).offset(skip).limit(limit)
+
+
+async def count_rows(db: AsyncSession, query) -> int:
+    """
+    Rows of query, as estimated by the planner when there are at least
+    COUNT_EXACT_BELOW of them, counted otherwise
+    """
+    estimate = await db.estimate_rows(query)
+    if estimate >= config.COUNT_EXACT_BELOW:
+        return estimate
+    row = await db.fetch_one(select([func.count().label("count")]).select_from(query.alias()))
+    return row["count"]
+
+
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[models.User]:
+    row = await db.fetch_one(_select(models.User).where(models.User.email == email))
+    return models.User(**row) if row else None
+
+
+async def _load_columns(db: AsyncSession, datasets: List[models.Dataset]):
+    """Load the columns of datasets in one query"""
+    if not datasets:
+        return datasets
+    rows = await db.fetch_all(
+        _select(models.DatasetColumn)
+        .where(models.DatasetColumn.dataset_id.in_([d.id for d in datasets]))
+        .order_by(models.DatasetColumn.id)
+    )
+    columns = defaultdict(list)
+    for column in _instances(models.DatasetColumn, rows):
+        columns[column.dataset_id].append(column)
+    for dataset in datasets:
+        dataset.columns = columns[dataset.id]
+    return datasets
+
+
+async def get_datasets(db: AsyncSession, skip: int = 0, limit: int = 100, user_id: Optional[int] = None,
+                       cursor: Optional[str] = None):
+    """Get all datasets accessible by the user (owned or public), in id order after cursor if given"""
+    rows = await db.fetch_all(_accessible_page(
+        models.Dataset, models.Dataset.owner_id, user_id, skip, limit, cursor
+    ))
+    return await _load_columns(db, _instances(models.Dataset, rows))
+
+
+async def count_datasets(db: AsyncSession, user_id: Optional[int] = None) -> int:
+    """Count the datasets accessible by the user, estimated when many"""
+    return await count_rows(db, _accessible(models.Dataset, models.Dataset.owner_id, user_id))
+
+
+async def get_dataset(db: AsyncSession, dataset_id: int, user_id: Optional[int] = None):
+    """Get a specific dataset if accessible by the user"""
+    query = _select(models.Dataset).where(models.Dataset.id == dataset_id)
+
+    if user_id:
+        query = query.where(
+            (models.Dataset.owner_id == user_id) | (models.Dataset.is_public == True)
+        )
+
+    row = await db.fetch_one(query)
+
+    if not row:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+
+    datasets = await _load_columns(db, [models.Dataset(**row)])
+    return datasets[0]
+
+
+async def get_visualizations(db: AsyncSession, skip: int = 0, limit: int = 100, user_id: Optional[int] = None,
+                             cursor: Optional[str] = None):
+    """Get all visualizations accessible by the user (created by or public), in id order after cursor if given"""
+    rows = await db.fetch_all(_accessible_page(
+        models.Visualization, models.Visualization.creator_id, user_id, skip, limit, cursor
+    ))
+    return _instances(models.Visualization, rows)
+
+
+async def count_visualizations(db: AsyncSession, user_id: Optional[int] = None) -> int:
+    """Count the visualizations accessible by the user, estimated when many"""
+    return await count_rows(db, _accessible(models.Visualization, models.Visualization.creator_id, user_id))
+
+
+async def get_visualization(db: AsyncSession, viz_id: int, user_id: Optional[int] = None):
+    """Get a specific visualization if accessible by the user"""
+    query = _select(models.Visualization).where(models.Visualization.id == viz_id)
+
+    if user_id:
+        query = query.where(
+            (models.Visualization.creator_id == user_id) | (models.Visualization.is_public == True)
+        )
+
+    row = await db.fetch_one(query)
+
+    if not row:
+        raise HTTPException(status_code=404, detail="Visualization not found")
+
+    return models.Visualization(**row)
+
+
+async def get_reports(db: AsyncSession, skip: int = 0, limit: int = 100, user_id: Optional[int] = None,
+                      cursor: Optional[str] = None):
+    """Get all reports accessible by the user (created by or public), in id order after cursor if given"""
+    rows = await db.fetch_all(_accessible_page(
+        models.Report, models.Report.creator_id, user_id, skip, limit, cursor
+    ))
+    return _instances(models.Report, rows)
+
+
+async def count_reports(db: AsyncSession, user_id: Optional[int] = None) -> int:
+    """Count the reports accessible by the user, estimated when many"""
+    return await count_rows(db, _accessible(models.Report, models.Report.creator_id, user_id))
+
+
+async def get_report(db: AsyncSession, report_id: int, user_id: Optional[int] = None):
+    """Get a specific report if accessible by the user"""
+    query = _select(models.Report).where(models.Report.id == report_id)
+
+    if user_id:
+        query = query.where(
+            (models.Report.creator_id == user_id) | (models.Report.is_public == True)
+        )
+
+    row = await db.fetch_one(query)
+
+    if not row:
+        raise HTTPException(status_code=404, detail="Report not found")
+
+    return models.Report(**row)
+
+
+async def get_audit_logs(db: AsyncSession, skip: int = 0, limit: int = 100,
+                         user_id: Optional[int] = None, entity_type: Optional[str] = None,
+                         entity_id: Optional[int] = None, action: Optional[str] = None,
+                         cursor: Optional[str] = None):
+    """Get audit logs with optional filtering, newest first, after cursor if given"""
+    query = _select(models.AuditLog)
+
+    if cursor:
+        query = query.where(pagination.before(
+            (models.AuditLog.timestamp, models.AuditLog.id), pagination.audit_log_cursor(cursor)
+        ))
+
+    if user_id:
+        query = query.where(models.AuditLog.user_id == user_id)
+
+    if entity_type:
+        query = query.where(models.AuditLog.entity_type == entity_type)
+
+    if entity_id:
+        query = query.where(models.AuditLog.entity_id == entity_id)
+
+    if action:
+        query = query.where(models.AuditLog.action == action)
+
+    rows = await db.fetch_all(
+        query.order_by(models.AuditLog.timestamp.desc(), models.AuditLog.id.desc())
+        .offset(skip).limit(limit)
+    )
+    return _instances(models.AuditLog, rows)
+
+
+async def get_dataset_visualizations(db: AsyncSession, dataset_id: int, skip: int = 0, limit: int = 100,
+                                     user_id: Optional[int] = None, cursor: Optional[str] = None):
+    """Get the visualizations of a dataset accessible by the user, in id order after cursor if given"""
+    rows = await db.fetch_all(_accessible_page(
+        models.Visualization, models.Visualization.creator_id, user_id, skip, limit, cursor,
+        models.Visualization.dataset_id == dataset_id,
+    ))
+    return _instances(models.Visualization, rows)
+
+
+async def count_dataset_visualizations(db: AsyncSession, dataset_id: int,
+                                       user_id: Optional[int] = None) -> int:
+    """Count the visualizations of a dataset accessible by the user, estimated when many"""
+    return await count_rows(db, _accessible(
+        models.Visualization, models.Visualization.creator_id, user_id,
+        models.Visualization.dataset_id == dataset_id,
+    ))
+
+
+async def get_dataset_reports(db: AsyncSession, dataset_id: int, skip: int = 0, limit: int = 100,
+                              user_id: Optional[int] = None, cursor: Optional[str] = None):
+    """Get the reports of a dataset accessible by the user, in id order after cursor if given"""
+    rows = await db.fetch_all(_accessible_page(
+        models.Report, models.Report.creator_id, user_id, skip, limit, cursor,
+        models.Report.dataset_id == dataset_id,
+    ))
+    return _instances(models.Report, rows)
+
+
+async def count_dataset_reports(db: AsyncSession, dataset_id: int,
+                                user_id: Optional[int] = None) -> int:
+    """Count the reports of a dataset accessible by the user, estimated when many"""
+    return await count_rows(db, _accessible(
+        models.Report, models.Report.creator_id, user_id,
+        models.Report.dataset_id == dataset_id,
+    ))
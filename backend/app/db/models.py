@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey, Text, Float, Table
+from sqlalchemy import Boolean, Column, Integer, String, Date, DateTime, ForeignKey, Text, Float, Table, UniqueConstraint, Index, DDL, event, text
 from sqlalchemy.orm import relationship
 import datetime
 from typing import List
@@ -26,26 +26,44 @@ class User(Base):
 
 class Dataset(Base):
     __tablename__ = "dataset"
+    # Keyset pages of the rows a user owns, and of the public ones
+    __table_args__ = (
+        Index("ix_dataset_owner_id_id", "owner_id", "id"),
+        Index("ix_dataset_public_id", "id", postgresql_where=text("is_public")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     description = Column(String)
     file_path = Column(String, nullable=False)
+    file_name = Column(String)  # Name of the uploaded file, as sent by the client
     file_type = Column(String, nullable=False)  # CSV, XLSX
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
     row_count = Column(Integer)
     column_count = Column(Integer)
     is_public = Column(Boolean, default=False)
+    status = Column(String, nullable=False, default="stored")  # stored, parsed, profiled, failed
+    progress = Column(Float, nullable=False, default=0.0)
+    job_id = Column(String)  # Celery task id of the ingest job
+    error = Column(Text)
+    content_hash = Column(String)  # SHA-256 of the uploaded file
+    version = Column(Integer, nullable=False, default=1)  # Bumped whenever the data changes
+    sheet_name = Column(String)  # Worksheet of a workbook the dataset was read from
+    memory_footprint = Column(Text)  # JSON memory report of the inferred and stored column types
 
     # Foreign keys
     owner_id = Column(Integer, ForeignKey("user.id"))
+    parent_id = Column(Integer, ForeignKey("dataset.id", ondelete="SET NULL"))  # Dataset of the first sheet
 
     # Relations
     owner = relationship("User", back_populates="datasets")
     columns = relationship("DatasetColumn", back_populates="dataset")
     visualizations = relationship("Visualization", back_populates="dataset")
     reports = relationship("Report", back_populates="dataset")
+    stats = relationship("DatasetStats", back_populates="dataset", cascade="all, delete-orphan")
+    versions = relationship("DatasetVersion", back_populates="dataset", cascade="all, delete-orphan",
+                            order_by="DatasetVersion.version")
 
 
 class DatasetColumn(Base):
@@ -53,9 +71,10 @@ class DatasetColumn(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
-    data_type = Column(String, nullable=False)  # string, number, date, boolean
+    data_type = Column(String, nullable=False)  # Stored type, e.g. int8, float32, category, datetime64[ns]
     description = Column(String)
     is_nullable = Column(Boolean, default=True)
+    profile = Column(Text)  # JSON histograms or top values, computed at ingest
 
     # Foreign keys
     dataset_id = Column(Integer, ForeignKey("dataset.id"))
@@ -64,8 +83,52 @@ class DatasetColumn(Base):
     dataset = relationship("Dataset", back_populates="columns")
 
 
+class DatasetStats(Base):
+    __tablename__ = "dataset_stats"
+    __table_args__ = (
+        UniqueConstraint("dataset_id", "version", "content_hash"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    version = Column(Integer, nullable=False)
+    content_hash = Column(String)
+    stats = Column(Text, nullable=False)  # JSON response of /datasets/{id}/analyze
+    computed_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    # Foreign keys
+    dataset_id = Column(Integer, ForeignKey("dataset.id"), nullable=False)
+
+    # Relations
+    dataset = relationship("Dataset", back_populates="stats")
+
+
+class DatasetVersion(Base):
+    __tablename__ = "dataset_version"
+    __table_args__ = (
+        UniqueConstraint("dataset_id", "version"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    version = Column(Integer, nullable=False)  # Dataset.version of this snapshot
+    content_hash = Column(String)
+    row_count = Column(Integer)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    # Foreign keys
+    dataset_id = Column(Integer, ForeignKey("dataset.id"), nullable=False)
+
+    # Relations
+    dataset = relationship("Dataset", back_populates="versions")
+
+
 class Visualization(Base):
     __tablename__ = "visualization"
+    # Keyset pages of the rows a user owns, of the public ones and of a dataset
+    __table_args__ = (
+        Index("ix_visualization_creator_id_id", "creator_id", "id"),
+        Index("ix_visualization_public_id", "id", postgresql_where=text("is_public")),
+        Index("ix_visualization_dataset_id_id", "dataset_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
@@ -79,13 +142,37 @@ class Visualization(Base):
     # Foreign keys
     creator_id = Column(Integer, ForeignKey("user.id"))
     dataset_id = Column(Integer, ForeignKey("dataset.id"))
+    dataset_version_id = Column(Integer, ForeignKey("dataset_version.id"))  # Pinned version, None for the latest
 
     # Relations
     creator = relationship("User", back_populates="visualizations")
     dataset = relationship("Dataset", back_populates="visualizations")
+    dataset_version = relationship("DatasetVersion")
 
     # Many-to-many relationship with Report
     reports = relationship("Report", secondary="report_visualization", back_populates="visualizations")
+    data_cache = relationship("VisualizationData", back_populates="visualization", cascade="all, delete-orphan")
+
+
+class VisualizationData(Base):
+    __tablename__ = "visualization_data"
+    __table_args__ = (
+        UniqueConstraint("visualization_id", "updated_at", "dataset_version", "content_hash", "params"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    updated_at = Column(DateTime, nullable=False)  # Of the visualization the data was computed for
+    dataset_version = Column(Integer, nullable=False)
+    content_hash = Column(String)
+    params = Column(String, nullable=False, default="")  # Request parameters, e.g. downsampling
+    data = Column(Text, nullable=False)  # JSON response of /visualizations/{id}/data
+    computed_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    # Foreign keys
+    visualization_id = Column(Integer, ForeignKey("visualization.id"), nullable=False)
+
+    # Relations
+    visualization = relationship("Visualization", back_populates="data_cache")
 
 
 # Association table for Report-Visualization relationship
@@ -99,6 +186,12 @@ report_visualization = Table(
 
 class Report(Base):
     __tablename__ = "report"
+    # Keyset pages of the rows a user owns, of the public ones and of a dataset
+    __table_args__ = (
+        Index("ix_report_creator_id_id", "creator_id", "id"),
+        Index("ix_report_public_id", "id", postgresql_where=text("is_public")),
+        Index("ix_report_dataset_id_id", "dataset_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
@@ -111,26 +204,59 @@ class Report(Base):
     # Foreign keys
     creator_id = Column(Integer, ForeignKey("user.id"))
     dataset_id = Column(Integer, ForeignKey("dataset.id"))
+    dataset_version_id = Column(Integer, ForeignKey("dataset_version.id"))  # Pinned version, None for the latest
 
     # Relations
     creator = relationship("User", back_populates="reports")
     dataset = relationship("Dataset", back_populates="reports")
+    dataset_version = relationship("DatasetVersion")
     visualizations = relationship("Visualization", secondary="report_visualization", back_populates="reports")
 
 
 class AuditLog(Base):
+    """Partitioned by month of timestamp, see app.db.partitions"""
     __tablename__ = "audit_log"
-
-    id = Column(Integer, primary_key=True, index=True)
+    __table_args__ = (
+        Index("ix_audit_log_timestamp", "timestamp", "id"),
+        Index("ix_audit_log_user_timestamp", "user_id", "timestamp"),
+        Index("ix_audit_log_entity_timestamp", "entity_type", "entity_id", "timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+    # The key of a partitioned table includes its partition key
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     action = Column(String, nullable=False)  # CRUD action
     entity_type = Column(String, nullable=False)  # User, Dataset, Visualization, Report
     entity_id = Column(Integer, nullable=False)
     details = Column(Text)  # Additional details in JSON format
     ip_address = Column(String)
-    timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+    timestamp = Column(DateTime, primary_key=True, default=datetime.datetime.utcnow)
 
     # Foreign keys
     user_id = Column(Integer, ForeignKey("user.id"))
 
     # Relations
-    user = relationship("User", back_populates="audit_logs")
\ No newline at end of file
+    user = relationship("User", back_populates="audit_logs")
+
+
+# Rows outside of the monthly partitions, which the tests only use
+event.listen(
+    AuditLog.__table__,
+    "after_create",
+    DDL("CREATE TABLE audit_log_default PARTITION OF audit_log DEFAULT"),
+)
+
+
+class AuditLogDaily(Base):
+    """Audit log entries per day, kept when their partition is dropped"""
+    __tablename__ = "audit_log_daily"
+    __table_args__ = (
+        UniqueConstraint("day", "user_id", "entity_type", "action"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)
+    user_id = Column(Integer, ForeignKey("user.id"))
+    entity_type = Column(String, nullable=False)
+    action = Column(String, nullable=False)
+    count = Column(Integer, nullable=False)
@@ -0,0 +1,89 @@
+"""
+Keyset pagination.
+
+Listings page through their rows with a cursor, the sort key of the last
+row of the previous page, instead of an offset: audit logs newest first
+on (timestamp, id), datasets, visualizations and reports on id. The
+database seeks to the cursor through the index on the sort key, so a deep
+page costs the same as the first one, where an offset makes it read and
+discard every row before the page.
+
+Cursors are opaque to clients: routes return the cursor of the next page
+in the X-Next-Cursor header, and take it back in their `cursor` parameter.
+Listings also return their total number of rows in X-Total-Count, see
+crud_async.count_rows.
+"""
+import base64
+import binascii
+import datetime
+import json
+import typing as t
+
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+
+
+def _encode_value(value: t.Any) -> t.Any:
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(*values: t.Any) -> str:
+    data = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types: t.Callable[[t.Any], t.Any]) -> t.Tuple:
+    """Values of a cursor, converted by types. Raises a 400 for bad cursors"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError
+        return tuple(convert(value) for convert, value in zip(types, values))
+    except (binascii.Error, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def before(columns: t.Sequence[t.Any], values: t.Sequence[t.Any]):
+    """Rows sorted after values when sorting by columns, all descending"""
+    return tuple_(*columns) < tuple_(*values)
+
+
+def after(columns: t.Sequence[t.Any], values: t.Sequence[t.Any]):
+    """Rows sorted after values when sorting by columns, all ascending"""
+    return tuple_(*columns) > tuple_(*values)
+
+
+def next_cursor(items: t.Sequence[t.Any], limit: int, *keys: str) -> t.Optional[str]:
+    """Cursor of the page after items, None if items was the last page"""
+    if not items or len(items) < limit:
+        return None
+    last = items[-1]
+    return encode_cursor(*(getattr(last, key) for key in keys))
+
+
+def set_page_headers(
+    response: Response,
+    items: t.Sequence[t.Any],
+    limit: int,
+    keys: t.Sequence[str] = ("id",),
+    total: t.Optional[int] = None,
+) -> None:
+    cursor = next_cursor(items, limit, *keys)
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+    if total is not None:
+        response.headers[TOTAL_COUNT_HEADER] = str(total)
+
+
+def audit_log_cursor(cursor: str) -> t.Tuple[datetime.datetime, int]:
+    return decode_cursor(cursor, datetime.datetime.fromisoformat, int)
+
+
+def id_cursor(cursor: str) -> int:
+    return decode_cursor(cursor, int)[0]
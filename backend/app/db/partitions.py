@@ -0,0 +1,152 @@
+"""
+Monthly partitions of audit_log.
+
+audit_log is partitioned by range of timestamp, with one partition per
+month named audit_log_yYYYYmMM, and audit_log_default for the rows no
+partition covers. Queries filtering or sorting on timestamp only read the
+partitions they need, and old entries are removed by dropping their
+partition instead of deleting them row by row.
+
+ensure_audit_partitions creates the partitions of the coming months before
+entries are written to them. drop_audit_partitions rolls the partitions
+older than the retention period up into daily counts in audit_log_daily,
+then drops them. The audit_log_maintenance task runs both every day.
+"""
+import datetime
+import re
+import typing as t
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core import config
+
+PARTITION = re.compile(r"^audit_log_y(\d{4})m(\d{2})$")
+DEFAULT_PARTITION = "audit_log_default"
+
+
+def add_months(month: datetime.date, months: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def month_of(day: datetime.date) -> datetime.date:
+    return datetime.date(day.year, day.month, 1)
+
+
+def partition_name(month: datetime.date) -> str:
+    return f"audit_log_y{month.year:04d}m{month.month:02d}"
+
+
+def audit_partitions(db: Session) -> t.Dict[datetime.date, str]:
+    """Monthly partitions of audit_log, by first day of their month"""
+    rows = db.execute(
+        text(
+            """
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'audit_log'::regclass
+            """
+        )
+    )
+    partitions = {}
+    for (name,) in rows:
+        match = PARTITION.match(name)
+        if match:
+            partitions[datetime.date(int(match[1]), int(match[2]), 1)] = name
+    return partitions
+
+
+def create_audit_partition(db: Session, month: datetime.date) -> str:
+    """Create the partition of a month, moving its rows out of the default one"""
+    name = partition_name(month)
+    bounds = {"start": month, "end": add_months(month, 1)}
+    db.execute(text(f"CREATE TABLE {name} (LIKE audit_log INCLUDING DEFAULTS)"))
+    db.execute(
+        text(
+            f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION}
+                WHERE timestamp >= :start AND timestamp < :end
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+            """
+        ),
+        bounds,
+    )
+    # Also creates the indexes of audit_log on the partition
+    db.execute(
+        text(
+            f"ALTER TABLE audit_log ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+        )
+    )
+    return name
+
+
+def ensure_audit_partitions(
+    db: Session,
+    today: t.Optional[datetime.date] = None,
+    ahead: t.Optional[int] = None,
+) -> t.List[str]:
+    """Create the missing partitions of this month and the next `ahead` ones"""
+    current = month_of(today or datetime.datetime.utcnow().date())
+    ahead = config.AUDIT_PARTITIONS_AHEAD if ahead is None else ahead
+    existing = audit_partitions(db)
+    created = []
+    for i in range(ahead + 1):
+        month = add_months(current, i)
+        if month not in existing:
+            created.append(create_audit_partition(db, month))
+    db.commit()
+    return created
+
+
+def _rollup(db: Session, table: str, before: datetime.date) -> None:
+    db.execute(
+        text(
+            f"""
+            INSERT INTO audit_log_daily (day, user_id, entity_type, action, count)
+            SELECT CAST(timestamp AS date), user_id, entity_type, action, count(*)
+            FROM {table}
+            WHERE timestamp < :before
+            GROUP BY 1, 2, 3, 4
+            ON CONFLICT (day, user_id, entity_type, action)
+            DO UPDATE SET count = audit_log_daily.count + excluded.count
+            """
+        ),
+        {"before": before},
+    )
+
+
+def drop_audit_partitions(
+    db: Session,
+    today: t.Optional[datetime.date] = None,
+    retention_months: t.Optional[int] = None,
+) -> t.List[str]:
+    """
+    Roll up and drop the partitions of the months before the last
+    `retention_months` ones, and remove the rows of those months from the
+    default partition alike. Returns the partitions dropped
+    """
+    retention_months = (
+        config.AUDIT_RETENTION_MONTHS if retention_months is None else retention_months
+    )
+    cutoff = add_months(month_of(today or datetime.datetime.utcnow().date()), -retention_months)
+    dropped = []
+    for month, name in sorted(audit_partitions(db).items()):
+        if add_months(month, 1) > cutoff:
+            continue
+        _rollup(db, name, cutoff)
+        db.execute(text(f"ALTER TABLE audit_log DETACH PARTITION {name}"))
+        db.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+
+    _rollup(db, DEFAULT_PARTITION, cutoff)
+    db.execute(
+        text(f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp < :before"),
+        {"before": cutoff},
+    )
+    db.commit()
+    return dropped
@@ -0,0 +1,87 @@
+"""
+Connection pool of the sync engine, instrumented to size it against the
+number of workers and threads using it.
+
+InstrumentedQueuePool times every checkout, including the wait for a
+connection to be returned when all are in use, and counts the checkouts
+that timed out. metrics() reports those with the connections in use and
+the overflow ones currently open.
+"""
+import collections
+import threading
+import time
+import typing as t
+
+import numpy as np
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+# Checkout waits kept for percentiles
+WAIT_WINDOW = 1000
+
+
+class PoolStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.waits: t.Deque[float] = collections.deque(maxlen=WAIT_WINDOW)
+
+    def record(self, wait: float, timed_out: bool) -> None:
+        with self.lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+            self.waits.append(wait)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool recording how long checkouts wait for a connection"""
+
+    def __init__(self, *args: t.Any, **kwargs: t.Any):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.stats.record(time.perf_counter() - start, timed_out)
+
+    def recreate(self):
+        # Engine.dispose() replaces the pool, the counters carry over
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def metrics(self) -> t.Dict[str, t.Any]:
+        stats = self.stats
+        with stats.lock:
+            waits = np.asarray(stats.waits)
+            checkouts, timeouts = stats.checkouts, stats.timeouts
+            wait_seconds, max_wait = stats.wait_seconds, stats.max_wait_seconds
+        p50, p99 = np.percentile(waits, [50, 99]) if len(waits) else (None, None)
+        return {
+            "size": self.size(),
+            "max_overflow": self._max_overflow,
+            "timeout": self._timeout,
+            "in_use": self.checkedout(),
+            "idle": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "checkouts": checkouts,
+            "timeouts": timeouts,
+            "wait_seconds": {
+                "mean": wait_seconds / checkouts if checkouts else None,
+                "p50": p50 if p50 is None else float(p50),
+                "p99": p99 if p99 is None else float(p99),
+                "max": max_wait,
+            },
+        }
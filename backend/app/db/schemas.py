@@ -86,18 +86,91 @@ class DatasetEdit(DatasetBase):
 
 class DatasetOut(DatasetBase):
     id: int
+    file_name: t.Optional[str] = None
     file_type: str
     created_at: datetime
     updated_at: datetime
     row_count: t.Optional[int]
     column_count: t.Optional[int]
     owner_id: int
+    status: str
+    version: int
+    sheet_name: t.Optional[str] = None
+    parent_id: t.Optional[int] = None
     columns: t.List[DatasetColumn] = []
 
     class Config:
         orm_mode = True
 
 
+class DatasetVersion(BaseModel):
+    id: int
+    version: int
+    content_hash: t.Optional[str]
+    row_count: t.Optional[int]
+    created_at: datetime
+
+    class Config:
+        orm_mode = True
+
+
+class DatasetStatus(BaseModel):
+    id: int
+    sheet_name: t.Optional[str] = None
+    job_id: t.Optional[str] = None
+    status: str  # stored, parsed, profiled, failed
+    progress: float
+    error: t.Optional[str] = None
+    row_count: t.Optional[int]
+    column_count: t.Optional[int]
+
+    class Config:
+        orm_mode = True
+
+
+# Schemas for dataset queries
+class QueryFilter(BaseModel):
+    column: str
+    op: str  # eq, ne, lt, le, gt, ge, in, not_in, contains, is_null, not_null
+    value: t.Any = None
+
+
+class QueryAggregate(BaseModel):
+    func: str  # count, sum, mean, min, max
+    column: t.Optional[str] = None  # count(*) when omitted
+    alias: t.Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return self.alias or f"{self.func}_{self.column or 'rows'}"
+
+
+class QueryOrder(BaseModel):
+    column: str
+    desc: bool = False
+
+
+class DatasetQuery(BaseModel):
+    select: t.List[str] = []
+    filters: t.List[QueryFilter] = []
+    group_by: t.List[str] = []
+    aggregates: t.List[QueryAggregate] = []
+    order_by: t.List[QueryOrder] = []
+    limit: int = 1000
+
+    @validator("limit")
+    def limit_in_range(cls, v):
+        if not 1 <= v <= 10000:
+            raise ValueError("limit must be between 1 and 10000")
+        return v
+
+
+class QueryResult(BaseModel):
+    columns: t.List[str]
+    rows: t.List[t.Dict[str, t.Any]]
+    row_count: int
+
+
 # Schemas for Visualization
 class VisualizationBase(BaseModel):
     name: str
@@ -105,6 +178,7 @@ class VisualizationBase(BaseModel):
     type: str  # bar, line, pie, scatter, table, etc.
     config: str  # JSON configuration
     is_public: bool = False
+    dataset_version_id: t.Optional[int] = None  # Pinned version, None for the latest
 
 
 class VisualizationCreate(VisualizationBase):
@@ -132,6 +206,7 @@ class ReportBase(BaseModel):
     description: t.Optional[str] = None
     content: t.Optional[str] = None
     is_public: bool = False
+    dataset_version_id: t.Optional[int] = None  # Pinned version, None for the latest
 
 
 class ReportCreate(ReportBase):
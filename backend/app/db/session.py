@@ -1,21 +1,200 @@
+import asyncio
+import contextlib
+import json
+import typing as t
+
+import asyncpg
+from fastapi import HTTPException
 from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine.url import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql import ClauseElement
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
 
 from app.core import config
+from app.db.pool import InstrumentedQueuePool
 
 engine = create_engine(
     config.SQLALCHEMY_DATABASE_URI,
+    poolclass=InstrumentedQueuePool,
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+    pool_timeout=config.DB_POOL_TIMEOUT,
+    pool_pre_ping=config.DB_POOL_PRE_PING,
+    pool_recycle=config.DB_POOL_RECYCLE,
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Threads running the blocking work of requests: sync routes and
+# dependencies, and run_in_threadpool. Nearly all of it holds a database
+# connection, so there is one thread per connection the pool can open;
+# more would only wait for a connection, fewer would leave some unused.
+#
+# Concurrency is bounded by the pool alone, not per request: a session takes
+# a connection at its first query and gives it back when its transaction
+# ends or it is closed. A session that finds every connection taken waits
+# DB_POOL_TIMEOUT seconds at most, then its request fails with a 503 rather
+# than holding a thread the requests with a connection need.
+DB_THREADS = config.DB_POOL_SIZE + config.DB_MAX_OVERFLOW
+
 Base = declarative_base()
 
 
+class AsyncEngine:
+    """
+    asyncpg connection pool of the API, opened on first use in the event
+    loop it serves. Sync code, the Celery worker and alembic keep using
+    engine.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        min_size: int,
+        max_size: int,
+        acquire_timeout: t.Optional[float] = None,
+    ):
+        url = make_url(url)
+        url.drivername = "postgresql"
+        self.dsn = str(url)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout or config.ASYNC_DB_ACQUIRE_TIMEOUT
+        self.timeouts = 0
+        self._pool: t.Optional[asyncpg.pool.Pool] = None
+        # Created in the loop it serves: on Python 3.8, asyncio primitives
+        # bind to the loop current when they are created
+        self._lock: t.Optional[asyncio.Lock] = None
+
+    async def pool(self) -> asyncpg.pool.Pool:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._pool is None:
+                self._pool = await asyncpg.create_pool(
+                    self.dsn, min_size=self.min_size, max_size=self.max_size
+                )
+        return self._pool
+
+    @contextlib.asynccontextmanager
+    async def connection(self) -> t.AsyncIterator[asyncpg.Connection]:
+        """
+        A connection of the pool, for one statement. Raises a 503 when none
+        frees up within acquire_timeout seconds
+        """
+        pool = await self.pool()
+        try:
+            connection = await pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise HTTPException(
+                status_code=503, detail="No database connection available"
+            )
+        try:
+            yield connection
+        finally:
+            await pool.release(connection)
+
+    def metrics(self) -> t.Dict[str, t.Any]:
+        pool = self._pool
+        return {
+            "max_size": self.max_size,
+            "size": pool.get_size() if pool else 0,
+            "idle": pool.get_idle_size() if pool else 0,
+            "acquire_timeout": self.acquire_timeout,
+            "timeouts": self.timeouts,
+        }
+
+    async def dispose(self) -> None:
+        pool, self._pool, self._lock = self._pool, None, None
+        if pool is not None:
+            await pool.close()
+
+
+class AsyncSession:
+    """
+    Runs SQLAlchemy Core statements on connections of an AsyncEngine.
+    SQLAlchemy 1.3 has no asyncio support: statements are compiled for
+    PostgreSQL and their parameters numbered the way asyncpg expects.
+
+    Each statement takes a connection from the pool and gives it back once
+    its rows are read, so a request only holds one while a statement runs,
+    not while it streams a response or waits for the process pool.
+    """
+
+    dialect = postgresql.dialect()
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+
+    def compile(self, statement: ClauseElement) -> t.Tuple[str, t.List[t.Any]]:
+        compiled = statement.compile(dialect=self.dialect)
+        params = compiled.construct_params()
+        processors = compiled._bind_processors
+        names = list(params)
+        query = compiled.string % {
+            name: f"${i}" for i, name in enumerate(names, start=1)
+        }
+        args = [
+            processors[name](params[name]) if name in processors else params[name]
+            for name in names
+        ]
+        return query, args
+
+    async def fetch_all(self, statement: ClauseElement) -> t.List[t.Dict[str, t.Any]]:
+        query, args = self.compile(statement)
+        async with self.engine.connection() as connection:
+            rows = await connection.fetch(query, *args)
+        return [dict(row) for row in rows]
+
+    async def fetch_one(
+        self, statement: ClauseElement
+    ) -> t.Optional[t.Dict[str, t.Any]]:
+        rows = await self.fetch_all(statement.limit(1))
+        return rows[0] if rows else None
+
+    async def estimate_rows(self, statement: ClauseElement) -> int:
+        """Rows of statement as estimated by the planner, without running it"""
+        query, args = self.compile(statement)
+        async with self.engine.connection() as connection:
+            plan = await connection.fetchval(f"EXPLAIN (FORMAT JSON) {query}", *args)
+        return int(json.loads(plan)[0]["Plan"]["Plan Rows"])
+
+    async def close(self) -> None:
+        """Nothing to release, connections go back to the pool per statement"""
+
+
+async_engine = AsyncEngine(
+    config.SQLALCHEMY_DATABASE_URI,
+    min_size=1,
+    max_size=config.ASYNC_DB_POOL_SIZE,
+)
+
+
+def AsyncSessionLocal() -> AsyncSession:
+    return AsyncSession(async_engine)
+
+
 # Dependency
-def get_db():
+async def get_db(request: Request):
+    """
+    The session of a request, shared by every dependency and the route, and
+    reachable from the request as request.state.db
+    """
     db = SessionLocal()
+    request.state.db = db
+    try:
+        yield db
+    finally:
+        await run_in_threadpool(db.close)
+
+
+async def get_async_db():
+    db = AsyncSessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
@@ -0,0 +1,66 @@
+"""
+Encoding of streamed exports. Rows are encoded as they are read and sent
+in chunks of about EXPORT_CHUNK_BYTES, so an export holds one chunk in
+memory whatever its number of rows.
+"""
+import csv
+import datetime
+import io
+import itertools
+import json
+import typing as t
+import zlib
+
+from app.core import config
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _value(value: t.Any) -> t.Any:
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def _ndjson(columns: t.Sequence[str], rows: t.Iterable[t.Sequence]) -> t.Iterator[str]:
+    for row in rows:
+        yield json.dumps(dict(zip(columns, map(_value, row)))) + "\n"
+
+
+def _csv(columns: t.Sequence[str], rows: t.Iterable[t.Sequence]) -> t.Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in itertools.chain([columns], (map(_value, row) for row in rows)):
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def encode(
+    columns: t.Sequence[str], rows: t.Iterable[t.Sequence], format: str
+) -> t.Iterator[bytes]:
+    """Rows with the given columns, encoded in chunks as ndjson or csv"""
+    lines = _ndjson(columns, rows) if format == "ndjson" else _csv(columns, rows)
+    chunk, size = [], 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= config.EXPORT_CHUNK_BYTES:
+            yield "".join(chunk).encode()
+            chunk, size = [], 0
+    if chunk:
+        yield "".join(chunk).encode()
+
+
+def gzip(chunks: t.Iterable[bytes]) -> t.Iterator[bytes]:
+    """Chunks compressed as one gzip file"""
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
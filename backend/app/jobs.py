@@ -0,0 +1,106 @@
+"""
+CPU-bound work of route handlers, run in the process pool of
+app.core.executor. Jobs take paths and plain values and return plain
+values, so both pickle cheaply; they never touch the database.
+"""
+import io
+import typing as t
+
+import pandas as pd
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from app.datasets import analysis, ingest, rowindex, storage
+
+
+def analyze(
+    store_path: t.Optional[str],
+    file_path: str,
+    file_type: str,
+    sample: t.Optional[int] = None,
+    confidence: float = 0.95,
+) -> t.Dict[str, t.Any]:
+    """
+    Statistics of a dataset, read from its columnar store when it has one
+    and from the uploaded file otherwise. Estimated from a random sample of
+    `sample` rows when given
+    """
+    store = storage.open_store_path(store_path) if store_path else None
+    if sample is None:
+        if store is not None:
+            return analysis.analyze_store(store)
+        return analysis.analyze_file(file_path, file_type)
+    if store is not None:
+        return analysis.analyze_store_sample(store, sample, confidence)
+    return analysis.analyze_file_sample(file_path, file_type, sample, confidence)
+
+
+def read_rows(
+    offset: int,
+    n_rows: int,
+    store_path: t.Optional[str] = None,
+    version: t.Optional[int] = None,
+    file_path: t.Optional[str] = None,
+    file_type: t.Optional[str] = None,
+    sheet_name: t.Optional[str] = None,
+) -> t.List[t.Dict[str, t.Any]]:
+    """
+    n_rows rows of a dataset from row offset, as JSON records. Read from a
+    version of its columnar store when it has one, and from the uploaded
+    file otherwise
+    """
+    if store_path is not None:
+        store = storage.open_store_path(store_path, version)
+        if store is None:
+            raise ValueError("Dataset version has no stored data")
+        df = store.read(start=offset, stop=offset + n_rows)
+    elif file_type == "csv":
+        # Not ingested yet, or uploaded before the columnar store existed
+        df = rowindex.read_csv_rows(file_path, offset, n_rows)
+    elif file_type == "xlsx":
+        df = pd.concat(list(ingest.iter_xlsx_chunks(
+            file_path, sheet_name, n_rows, start=offset, stop=offset + n_rows
+        )))
+    elif file_type == "xls":
+        df = pd.read_excel(file_path, sheet_name=sheet_name or 0,
+                           skiprows=range(1, offset + 1), nrows=n_rows)
+    else:
+        raise ValueError("Unsupported file type")
+
+    # Missing values are not valid JSON floats
+    df = df.astype(object).where(pd.notnull(df), None)
+    return df.to_dict(orient="records")
+
+
+def render_report_pdf(
+    name: str, description: t.Optional[str], content: t.Optional[str]
+) -> bytes:
+    """Render a report as a PDF document"""
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    width, height = letter
+
+    # Add title
+    c.setFont("Helvetica-Bold", 18)
+    c.drawString(50, height - 50, name)
+
+    # Add description if available
+    if description:
+        c.setFont("Helvetica", 12)
+        c.drawString(50, height - 80, description)
+
+    # Add content if available (simplified, actual implementation would need HTML->PDF conversion)
+    if content:
+        c.setFont("Helvetica", 10)
+        # Very simple text rendering, in a real implementation you'd use a HTML->PDF converter
+        y_position = height - 120
+        for line in content.split('\n'):
+            c.drawString(50, y_position, line[:80])  # Truncate long lines
+            y_position -= 15
+            if y_position < 50:  # Start a new page if we run out of space
+                c.showPage()
+                y_position = height - 50
+
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
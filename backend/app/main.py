@@ -1,7 +1,12 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
 from fastapi import FastAPI, Depends
-from starlette.requests import Request
 import uvicorn
+from sqlalchemy import exc
 from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
 
 from app.api.api_v1.routers.users import users_router
 from app.api.api_v1.routers.auth import auth_router
@@ -9,8 +14,12 @@ from app.api.api_v1.routers.datasets import datasets_router
 from app.api.api_v1.routers.visualizations import visualizations_router
 from app.api.api_v1.routers.reports import reports_router
 from app.api.api_v1.routers.audit import audit_router
+from app.api.api_v1.routers.metrics import metrics_router
 from app.core import config
-from app.db.session import SessionLocal
+from app.core.executor import process_pool
+from app.db.audit import audit_sink
+from app.db.pagination import NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER
+from app.db.session import DB_THREADS, async_engine
 from app.core.auth import get_current_active_user
 from app.core.celery_app import celery_app
 from app import tasks
@@ -27,15 +36,50 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Content-Range", NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER],
 )
 
 
-@app.middleware("http")
-async def db_session_middleware(request: Request, call_next):
-    request.state.db = SessionLocal()
-    response = await call_next(request)
-    request.state.db.close()
-    return response
+@app.exception_handler(exc.TimeoutError)
+async def pool_timeout(request: Request, e: exc.TimeoutError):
+    # No connection of the pool freed up within DB_POOL_TIMEOUT seconds
+    return JSONResponse(
+        status_code=503, content={"detail": "No database connection available"}
+    )
+
+
+@app.on_event("startup")
+async def start_db_threads():
+    # Sync routes and run_in_threadpool use the default executor of the loop
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(DB_THREADS, thread_name_prefix="db")
+    )
+
+
+@app.on_event("startup")
+def start_process_pool():
+    process_pool.start()
+
+
+@app.on_event("shutdown")
+def stop_process_pool():
+    process_pool.shutdown()
+
+
+@app.on_event("startup")
+def start_audit_sink():
+    audit_sink.start()
+
+
+@app.on_event("shutdown")
+def stop_audit_sink():
+    # Write the audit entries still queued
+    audit_sink.stop()
+
+
+@app.on_event("shutdown")
+async def close_async_engine():
+    await async_engine.dispose()
 
 
 @app.get("/api/v1")
@@ -83,6 +127,12 @@ app.include_router(
     tags=["audit"],
     dependencies=[Depends(get_current_active_user)],
 )
+app.include_router(
+    metrics_router,
+    prefix="/api/v1",
+    tags=["metrics"],
+    dependencies=[Depends(get_current_active_user)],
+)
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", reload=True, port=8888)
\ No newline at end of file
@@ -1,6 +1,29 @@
 from app.core.celery_app import celery_app
+from app.db import crud, partitions
+from app.db.session import SessionLocal
 
 
 @celery_app.task(acks_late=True)
 def example_task(word: str) -> str:
     return f"test task returns {word}"
+
+
+@celery_app.task(acks_late=True)
+def ingest_dataset(dataset_id: int) -> int:
+    db = SessionLocal()
+    try:
+        crud.ingest_dataset(db, dataset_id)
+    finally:
+        db.close()
+    return dataset_id
+
+
+@celery_app.task(acks_late=True)
+def audit_log_maintenance() -> dict:
+    db = SessionLocal()
+    try:
+        created = partitions.ensure_audit_partitions(db)
+        dropped = partitions.drop_audit_partitions(db)
+    finally:
+        db.close()
+    return {"created": created, "dropped": dropped}
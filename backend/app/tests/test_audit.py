@@ -0,0 +1,126 @@
+import datetime
+
+import pytest
+from sqlalchemy import create_engine
+
+from app.core import config
+from app.db import audit, models
+from app.db.audit import AuditSink
+
+
+def entry(entity_id: int) -> dict:
+    return {
+        "action": "CREATE",
+        "entity_type": "AuditSinkTest",
+        "entity_id": entity_id,
+        "details": None,
+        "ip_address": "testclient",
+        "timestamp": datetime.datetime.utcnow(),
+        "user_id": None,
+    }
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = create_engine(f"{config.SQLALCHEMY_DATABASE_URI}_test")
+    monkeypatch.setattr(audit, "engine", engine)
+    yield engine
+    table = models.AuditLog.__table__
+    engine.execute(table.delete().where(table.c.entity_type == "AuditSinkTest"))
+    engine.dispose()
+
+
+def written(engine) -> list:
+    table = models.AuditLog.__table__
+    rows = engine.execute(
+        table.select().where(table.c.entity_type == "AuditSinkTest")
+    )
+    return sorted(row.entity_id for row in rows)
+
+
+def test_batches(engine):
+    sink = AuditSink(batch_size=2, flush_interval=0.05, sync=False)
+    for i in range(5):
+        sink.log(None, entry(i))
+    sink.stop()
+
+    assert written(engine) == [0, 1, 2, 3, 4]
+    metrics = sink.metrics()
+    assert metrics["written"] == 5
+    assert metrics["batches"] >= 3
+    assert metrics["queued"] == 0
+    assert not metrics["running"]
+
+
+def test_full_queue_writes_directly(engine, monkeypatch):
+    sink = AuditSink(queue_size=1, enqueue_timeout=0.01, sync=False)
+    # Keep the writer from draining the queue
+    monkeypatch.setattr(sink, "start", lambda: None)
+    sink.log(None, entry(1))
+    sink.log(None, entry(2))
+
+    assert written(engine) == [2]
+    assert sink.metrics()["overflowed"] == 1
+    sink.stop()
+    assert written(engine) == [1, 2]
+
+
+def test_sync(test_db):
+    sink = AuditSink(sync=True)
+    sink.log(test_db, entry(1))
+
+    logs = test_db.query(models.AuditLog).filter(
+        models.AuditLog.entity_type == "AuditSinkTest"
+    ).all()
+    assert [log.entity_id for log in logs] == [1]
+    assert sink.metrics()["queued"] == 0
+
+
+def test_failed_batches_are_retried(engine, monkeypatch):
+    sink = AuditSink(flush_interval=0.01, sync=False, write_retries=3)
+    write, calls = sink._write, []
+
+    def flaky_write(batch):
+        # The database is back after two failed attempts
+        calls.append(len(batch))
+        return len(calls) > 2 and write(batch)
+
+    monkeypatch.setattr(sink, "_write", flaky_write)
+    sink._deliver([entry(1), entry(2)], sink.write_retries)
+
+    assert written(engine) == [1, 2]
+    assert calls == [2, 2, 2]
+    metrics = sink.metrics()
+    assert metrics["retries"] == 2
+    assert metrics["dropped"] == 0
+
+
+def test_bad_entries_are_dead_lettered(engine, caplog):
+    sink = AuditSink(batch_size=3, flush_interval=0.01, sync=False, write_retries=2)
+    bad = dict(entry(2), action=None)
+    for e in [entry(1), bad, entry(3)]:
+        sink.log(None, e)
+    sink.stop()
+
+    # The batch fails on the bad entry, the others are written one by one
+    assert written(engine) == [1, 3]
+    metrics = sink.metrics()
+    assert metrics["dropped"] == 1
+    assert metrics["written"] == 2
+    dead = [r for r in caplog.records if r.name == "app.db.audit.dead_letter"]
+    assert len(dead) == 1 and '"entity_id": 2' in dead[0].getMessage()
+
+
+def test_failed_direct_writes_are_counted(engine, monkeypatch):
+    sink = AuditSink(queue_size=1, enqueue_timeout=0.01, sync=False, write_retries=5)
+    monkeypatch.setattr(sink, "start", lambda: None)
+    sink.log(None, entry(1))
+    sink.log(None, dict(entry(2), action=None))
+
+    assert written(engine) == []
+    metrics = sink.metrics()
+    assert metrics["overflowed"] == 1
+    assert metrics["dropped"] == 1
+    assert metrics["retries"] == 0
+    sink.stop()
+    assert written(engine) == [1]
@@ -0,0 +1,88 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.datasets import charts
+from app.tests.test_storage import write_store
+
+DF = pd.DataFrame(
+    {
+        "region": ["north", "south", "north", "east", "south"],
+        "year": [2020, 2020, 2021, 2021, 2021],
+        "amount": [1.0, 2.0, np.nan, 4.0, 10.0],
+    }
+)
+TYPES = {"region": "object", "year": "int64", "amount": "float64"}
+
+
+def draw(store, type, **config):
+    return charts.chart_data(store, type, json.dumps(config), TYPES)
+
+
+def test_grouped_chart_with_color(tmp_path):
+    store = write_store(tmp_path / "store", DF)
+
+    data = draw(
+        store, "line", xAxis="year", yAxis="amount",
+        colorBy="region", aggregation="average",
+    )
+
+    assert data["labels"] == [2020, 2021]
+    assert data["datasets"] == [
+        {"label": "north", "data": [1.0, None]},
+        {"label": "south", "data": [2.0, 10.0]},
+        {"label": "east", "data": [None, 4.0]},
+    ]
+
+
+def test_histogram(tmp_path):
+    store = write_store(tmp_path / "store", DF)
+
+    data = draw(store, "histogram", xAxis="amount", bins=3)
+
+    assert data["bins"] == [1.0, 4.0, 7.0, 10.0]
+    assert data["datasets"][0]["data"] == [2, 1, 1]
+
+
+def test_scatter_skips_missing_points(tmp_path):
+    store = write_store(tmp_path / "store", DF)
+
+    data = draw(store, "scatter", xAxis="year", yAxis="amount")
+
+    assert len(data["datasets"][0]["data"]) == 4
+
+
+@pytest.mark.parametrize(
+    "type, config",
+    [
+        ("bar", {"yAxis": "amount"}),
+        ("donut", {"xAxis": "region"}),
+        ("bar", {"xAxis": "region", "yAxis": "amount", "aggregation": "median"}),
+        ("histogram", {"xAxis": "region", "bins": 0}),
+    ],
+)
+def test_invalid_configs(tmp_path, type, config):
+    store = write_store(tmp_path / "store", DF)
+
+    with pytest.raises(charts.ConfigError):
+        draw(store, type, **config)
+
+
+def test_histogram_from_profile(tmp_path):
+    store = write_store(tmp_path / "store", DF)
+    profile = {
+        "kind": "number",
+        "equi_width": {"edges": [0.0, 5.0, 10.0], "counts": [7, 8]},
+    }
+
+    data = charts.chart_data(
+        store, "histogram", json.dumps({"xAxis": "amount", "bins": 2}),
+        TYPES, profiles={"amount": profile},
+    )
+
+    assert data["datasets"][0]["data"] == [7, 8]
+    assert draw(store, "histogram", xAxis="amount", bins=3)["bins"] == [
+        1.0, 4.0, 7.0, 10.0
+    ]
@@ -0,0 +1,203 @@
+import asyncio
+import datetime
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core import config, security
+from app.db import crud_async, models, pagination
+from app.db.session import AsyncEngine, AsyncSession, get_async_db
+from app.main import app
+
+
+@pytest.fixture
+def committed():
+    """Rows committed to the test database, seen by asyncpg connections"""
+    engine = create_engine(f"{config.SQLALCHEMY_DATABASE_URI}_test")
+    db = sessionmaker(bind=engine)()
+    user = models.User(email="async@email.com", hashed_password="x", is_active=True)
+    db.add(user)
+    db.commit()
+    dataset = models.Dataset(
+        name="sales", file_path="sales.csv", file_type="csv", owner_id=user.id
+    )
+    dataset.columns = [
+        models.DatasetColumn(name="region", data_type="category"),
+        models.DatasetColumn(name="amount", data_type="float32"),
+    ]
+    db.add(dataset)
+    db.commit()
+    yield user, dataset
+
+    db.query(models.DatasetColumn).filter(
+        models.DatasetColumn.dataset_id == dataset.id
+    ).delete()
+    db.delete(dataset)
+    db.delete(user)
+    db.commit()
+    db.close()
+    engine.dispose()
+
+
+def run(coroutine_function):
+    async def main():
+        engine = AsyncEngine(f"{config.SQLALCHEMY_DATABASE_URI}_test", 1, 2)
+        db = AsyncSession(engine)
+        try:
+            return await coroutine_function(db)
+        finally:
+            await db.close()
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+def test_compile():
+    db = AsyncSession(None)
+    query, args = db.compile(
+        crud_async._select(models.Dataset)
+        .where(models.Dataset.id.in_([3, 4]))
+        .where(models.Dataset.name.like("50%"))
+        .limit(5)
+    )
+    assert "$1" in query and "$4" in query and "%(" not in query
+    assert args == [3, 4, "50%", 5]
+
+
+def test_read_paths(committed):
+    user, dataset = committed
+
+    async def read(db):
+        found = await crud_async.get_user_by_email(db, "async@email.com")
+        missing = await crud_async.get_user_by_email(db, "nobody@email.com")
+        datasets = await crud_async.get_datasets(db, user_id=user.id)
+        single = await crud_async.get_dataset(db, dataset.id, user.id)
+        with pytest.raises(HTTPException) as e:
+            await crud_async.get_dataset(db, dataset.id, user.id + 1)
+        return found, missing, datasets, single, e.value.status_code
+
+    found, missing, datasets, single, status = run(read)
+    assert found.id == user.id and found.is_active
+    assert missing is None
+    assert [d.id for d in datasets] == [dataset.id]
+    assert [c.name for c in single.columns] == ["region", "amount"]
+    assert status == 404
+
+
+def test_audit_log_cursor(committed):
+    user, _ = committed
+    engine = create_engine(f"{config.SQLALCHEMY_DATABASE_URI}_test")
+    table = models.AuditLog.__table__
+    engine.execute(table.insert().values([
+        {"action": "UPDATE", "entity_type": "Dataset", "entity_id": i,
+         "timestamp": datetime.datetime(2026, 10, 1 + i // 2), "user_id": user.id}
+        for i in range(5)
+    ]))
+
+    async def read(db):
+        pages, cursor = [], None
+        while True:
+            logs = await crud_async.get_audit_logs(db, limit=2, user_id=user.id, cursor=cursor)
+            pages.append([log.entity_id for log in logs])
+            cursor = pagination.next_cursor(logs, 2, "timestamp", "id")
+            if not cursor:
+                return pages
+
+    try:
+        assert run(read) == [[4, 3], [2, 1], [0]]
+    finally:
+        engine.execute(table.delete().where(table.c.user_id == user.id))
+        engine.dispose()
+
+
+def test_list_pages(committed):
+    user, dataset = committed
+    cursor = pagination.encode_cursor(dataset.id - 1)
+
+    async def read(db):
+        page = await crud_async.get_datasets(db, limit=1, user_id=user.id, cursor=cursor)
+        after = await crud_async.get_datasets(
+            db, user_id=user.id, cursor=pagination.next_cursor(page, 1, "id")
+        )
+        total = await crud_async.count_datasets(db, user.id)
+        estimate = await db.estimate_rows(crud_async._select(models.Dataset))
+        return page, after, total, estimate
+
+    page, after, total, estimate = run(read)
+    assert [d.id for d in page] == [dataset.id]
+    assert after == []
+    assert total == 1
+    assert estimate >= 0
+
+
+def test_connections_are_held_per_statement(committed):
+    user, _ = committed
+
+    async def read(db):
+        await crud_async.get_user_by_email(db, user.email)
+        pool = await db.engine.pool()
+        idle = pool.get_idle_size() == pool.get_size()
+
+        # With the only connection taken, statements give up with a 503
+        db.engine.acquire_timeout = 0.1
+        async with db.engine.connection():
+            with pytest.raises(HTTPException) as e:
+                await crud_async.get_user_by_email(db, user.email)
+        return idle, e.value.status_code, db.engine.metrics()
+
+    async def main():
+        engine = AsyncEngine(f"{config.SQLALCHEMY_DATABASE_URI}_test", 1, 1)
+        try:
+            return await read(AsyncSession(engine))
+        finally:
+            await engine.dispose()
+
+    idle, status, metrics = asyncio.run(main())
+    assert idle
+    assert status == 503
+    assert metrics["timeouts"] == 1
+
+
+@pytest.fixture
+def async_client(committed):
+    """Client whose routes read through a real AsyncSession on the test database"""
+    user, _ = committed
+    engine = AsyncEngine(f"{config.SQLALCHEMY_DATABASE_URI}_test", 1, 2)
+
+    async def get_test_async_db():
+        yield AsyncSession(engine)
+
+    app.dependency_overrides[get_async_db] = get_test_async_db
+    token = security.create_access_token(data={"sub": user.email, "permissions": "user"})
+    if isinstance(token, bytes):
+        token = token.decode()
+    client = TestClient(app)
+    client.headers["Authorization"] = f"Bearer {token}"
+    yield client
+
+    del app.dependency_overrides[get_async_db]
+    asyncio.get_event_loop().run_until_complete(engine.dispose())
+
+
+def test_routes_read_through_asyncpg(committed, async_client):
+    user, dataset = committed
+
+    response = async_client.get("/api/v1/users/me")
+    assert response.status_code == 200
+    assert response.json()["email"] == user.email
+
+    response = async_client.get("/api/v1/datasets", params={"limit": 1})
+    assert [d["id"] for d in response.json()] == [dataset.id]
+    assert [c["name"] for c in response.json()[0]["columns"]] == ["region", "amount"]
+    assert response.headers["X-Total-Count"] == "1"
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = async_client.get("/api/v1/datasets", params={"limit": 1, "cursor": cursor})
+    assert response.json() == []
+    assert "X-Next-Cursor" not in response.headers
+
+    response = async_client.get(f"/api/v1/datasets/{dataset.id}")
+    assert response.json()["name"] == "sales"
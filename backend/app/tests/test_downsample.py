@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+from app.datasets import charts, downsample
+from app.tests.test_storage import write_store
+
+
+def test_lttb_keeps_peaks_and_endpoints():
+    x = np.arange(1000, dtype=float)
+    y = np.sin(x / 50)
+    y[500] = 10.0
+
+    kept = downsample.lttb(x, y, 50)
+
+    assert len(kept) == 50
+    assert kept[0] == 0 and kept[-1] == 999
+    assert np.all(np.diff(kept) > 0)
+    assert 500 in kept
+
+
+def test_lttb_short_series_is_unchanged():
+    assert downsample.lttb(np.arange(5), np.arange(5), 10).tolist() == [
+        0, 1, 2, 3, 4
+    ]
+
+
+def test_minmax_keeps_extremes_per_bucket():
+    x = np.arange(100, dtype=float)
+    y = np.zeros(100)
+    y[[10, 60]] = [5.0, -5.0]
+
+    kept = downsample.minmax(x, y, 4)
+
+    assert len(kept) <= 4
+    assert 10 in kept and 60 in kept
+
+
+def test_dates_are_numeric():
+    values = np.array(["2021-01-01", "2021-01-02"], dtype="datetime64[ns]")
+    assert np.diff(downsample.as_numeric(values))[0] == 86400e9
+
+
+def test_line_chart_is_downsampled_per_series(tmp_path):
+    n = 500
+    df = pd.DataFrame({
+        "t": np.arange(n),
+        "v": np.random.default_rng(0).normal(size=n),
+        "g": np.where(np.arange(n) % 2, "odd", "even"),
+    })
+    store = write_store(tmp_path / "store", df, segment_rows=100, chunk_rows=100)
+    types = {"t": "int64", "v": "float64", "g": "object"}
+
+    data = charts.chart_data(
+        store, "line", '{"xAxis": "t", "yAxis": "v", "colorBy": "g"}',
+        types, points=20,
+    )
+
+    assert len(data["labels"]) == 40
+    for series in data["datasets"]:
+        assert sum(v is not None for v in series["data"]) == 20
+
+    data = charts.chart_data(
+        store, "scatter", '{"xAxis": "t", "yAxis": "v"}',
+        types, points=30, method="minmax",
+    )
+    assert len(data["datasets"][0]["data"]) <= 30
+
+
+def test_scatter_is_downsampled_over_every_segment(tmp_path):
+    n = 1000
+    y = np.zeros(n)
+    y[[150, 940]] = [8.0, -8.0]
+    df = pd.DataFrame({"t": np.arange(n), "v": y})
+    store = write_store(tmp_path / "store", df, segment_rows=100, chunk_rows=100)
+    types = {"t": "int64", "v": "float64"}
+
+    for method in ("minmax", "lttb"):
+        data = charts.chart_data(
+            store, "scatter", '{"xAxis": "t", "yAxis": "v"}',
+            types, points=20, method=method,
+        )
+        points = data["datasets"][0]["data"]
+        assert len(points) <= 20
+        assert {"x": 150, "y": 8.0} in points
+        assert {"x": 940, "y": -8.0} in points
+        assert data["total"] == n and not data["truncated"]
+
+
+def test_series_over_the_caps_are_flagged(tmp_path, monkeypatch):
+    monkeypatch.setattr(charts, "MAX_POINTS", 100)
+    monkeypatch.setattr(charts, "MAX_GROUPS", 50)
+    n = 500
+    df = pd.DataFrame({"t": np.arange(n), "v": np.ones(n), "g": ["a"] * n})
+    store = write_store(tmp_path / "store", df, segment_rows=100, chunk_rows=100)
+    types = {"t": "int64", "v": "float64", "g": "object"}
+
+    data = charts.chart_data(store, "scatter", '{"xAxis": "g", "yAxis": "v"}', types)
+    assert len(data["datasets"][0]["data"]) == 100
+    assert data["truncated"] and data["total"] == n
+
+    data = charts.chart_data(store, "bar", '{"xAxis": "t", "yAxis": "v"}', types)
+    assert data["labels"] == list(range(50))
+    assert data["truncated"] and data["total"] == n
+
+    data = charts.chart_data(
+        store, "line", '{"xAxis": "t", "yAxis": "v"}', types, points=20
+    )
+    assert data["labels"][-1] == n - 1
+    assert not data["truncated"] and data["total"] == n
@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app import jobs
+from app.core.executor import ProcessPool
+
+
+class DisconnectedRequest:
+    async def is_disconnected(self):
+        return True
+
+
+@pytest.fixture
+def pool():
+    pool = ProcessPool(workers=1, timeout=30)
+    yield pool
+    pool.shutdown()
+
+
+def test_run(pool):
+    assert asyncio.run(pool.run(pow, 2, 10)) == 1024
+    pdf = asyncio.run(pool.run(jobs.render_report_pdf, "Sales", None, "a\nb"))
+    assert pdf.startswith(b"%PDF")
+
+    metrics = pool.metrics()
+    assert metrics["started"]
+    assert metrics["submitted"] == 2
+    assert metrics["completed"] == 2
+    assert metrics["running"] == metrics["queue_depth"] == 0
+
+
+def test_run_failure(pool):
+    with pytest.raises(ValueError):
+        asyncio.run(pool.run(jobs.read_rows, 0, 10, file_path="x.json", file_type="json"))
+    assert pool.metrics()["failed"] == 1
+
+
+def test_run_timeout(pool):
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(pool.run(time.sleep, 2, timeout=0.2))
+    assert e.value.status_code == 504
+
+    assert pool.metrics()["timed_out"] == 1
+
+
+def test_queue_depth(pool):
+    # Keep the worker, and the call queue feeding it, busy
+    busy = [pool.submit(time.sleep, 1) for _ in range(2)]
+    with pytest.raises(HTTPException):
+        asyncio.run(pool.run(pow, 2, 10, timeout=0.2))
+    queued = pool.submit(pow, 2, 10)
+    assert pool.metrics()["queue_depth"] >= 1
+    assert queued.result() == 1024
+    assert all(future.result() is None for future in busy)
+
+    # The task given up on was cancelled before it ran
+    metrics = pool.metrics()
+    assert metrics["cancelled"] == 1
+    assert metrics["completed"] == 3
+
+
+def test_run_disconnected(pool):
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(pool.run(time.sleep, 2, request=DisconnectedRequest()))
+    assert e.value.status_code == 499
+    assert pool.metrics()["disconnected"] == 1
+
+
+def test_shutdown_cancels_queued_tasks(pool):
+    busy = pool.submit(time.sleep, 0.5)
+    while not busy.running():
+        time.sleep(0.01)
+    # The call queue feeding the worker holds one task, the others wait
+    queued = [pool.submit(pow, 2, 10) for _ in range(3)]
+
+    pool.shutdown()
+
+    assert busy.result() is None
+    assert queued[-1].cancelled()
+    assert pool.metrics()["cancelled"] >= 2
+    assert not pool.started
+    # A new pool is started on next use
+    assert asyncio.run(pool.run(pow, 2, 10)) == 1024
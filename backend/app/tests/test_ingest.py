@@ -0,0 +1,192 @@
+import datetime
+import hashlib
+import io
+
+import openpyxl
+import pytest
+
+from app.datasets import ingest
+
+
+def test_save_upload_copies_in_chunks(tmp_path):
+    payload = b"a,b\n" + b"1,2\n" * 1000
+    destination = tmp_path / "uploads" / "data.csv"
+
+    size, content_hash = ingest.save_upload(
+        io.BytesIO(payload), str(destination), 64
+    )
+
+    assert size == len(payload)
+    assert content_hash == hashlib.sha256(payload).hexdigest()
+    assert destination.read_bytes() == payload
+
+
+def test_profile_file_merges_chunk_dtypes(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("a,b,c\n1,x,1\n2,y,2\n3,z,3.5\n4,,x\n")
+
+    profile = ingest.profile_file(str(path), "csv", chunk_rows=2)
+
+    assert profile.row_count == 4
+    assert profile.dtypes == {"a": "int64", "b": "object", "c": "object"}
+
+
+def test_profile_file_promotes_ints_to_floats(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("a,b\n1,x\n,y\n4,z\n")
+
+    profile = ingest.profile_file(str(path), "csv", chunk_rows=1)
+
+    assert profile.row_count == 3
+    assert profile.dtypes == {"a": "float64", "b": "object"}
+
+
+def test_parse_rows_csv_and_json():
+    dtypes = {"a": "int64", "b": "object", "c": "float64"}
+
+    rows, fitted = ingest.parse_rows(b"b,a,c\nx,1,\n", "text/csv", dtypes)
+    assert list(rows.columns) == ["a", "b", "c"]
+    assert rows.dtypes.astype(str).to_dict() == dtypes
+    assert fitted == dtypes
+
+    rows, _ = ingest.parse_rows(
+        b'[{"a": 2, "b": "y", "c": 1}]', "application/json", dtypes
+    )
+    assert rows.to_dict(orient="records") == [{"a": 2, "b": "y", "c": 1.0}]
+
+
+def test_parse_rows_rejects_mismatches():
+    dtypes = {"a": "int64"}
+
+    for body, content_type in [
+        (b'[{"a": null}]', "application/json"),
+        (b'[{"a": 1, "z": 2}]', "application/json"),
+        (b'{"a": 1}', "application/json"),
+        (b"a\nx\n", "text/csv"),
+        (b"a\n1\n", "text/plain"),
+        # Out of the range of every integer type
+        (b"a\n99999999999999999999\n", "text/csv"),
+        (b'[{"a": 99999999999999999999}]', "application/json"),
+        # Values of the wrong type
+        (b"a\n1.5\n", "text/csv"),
+        (b'[{"a": "1"}]', "application/json"),
+        (b'[{"a": true}]', "application/json"),
+    ]:
+        with pytest.raises(ValueError):
+            ingest.parse_rows(body, content_type, dtypes)
+
+
+def write_workbook(path, sheets):
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for title, rows in sheets.items():
+        worksheet = workbook.create_sheet(title)
+        for row in rows:
+            worksheet.append(row)
+    workbook.save(path)
+    return str(path)
+
+
+def test_iter_xlsx_chunks_streams_sheets(tmp_path):
+    path = write_workbook(
+        tmp_path / "data.xlsx",
+        {
+            "sales": [
+                ["a", "b", None, "a"],
+                [1, "x", None, 2.5],
+                [None, "y", 3, 1],
+                [4, None, None, None],
+            ],
+            "dates": [["d"], [datetime.datetime(2024, 1, 2)]],
+        },
+    )
+
+    assert ingest.sheet_names(path, "xlsx") == ["sales", "dates"]
+
+    profile = ingest.profile_file(path, "xlsx", chunk_rows=2)
+    assert profile.row_count == 3
+    assert profile.dtypes == {
+        "a": "float64", "b": "object", "Unnamed: 2": "float64", "a.1": "float64"
+    }
+    chunks = list(ingest.iter_chunks(path, "xlsx", 2, profile.dtypes))
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    assert all(
+        chunk.dtypes.astype(str).to_dict() == profile.dtypes for chunk in chunks
+    )
+
+    profile = ingest.profile_file(path, "xlsx", sheet="dates")
+    assert profile.dtypes == {"d": "datetime64[ns]"}
+
+    rows = list(ingest.iter_xlsx_chunks(path, start=1, stop=2))
+    assert [chunk["b"].tolist() for chunk in rows] == [["y"]]
+
+
+def test_profile_file_optimizes_dtypes(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text(
+        "small,big,ratio,color,day,label\n"
+        + "".join(
+            f"{i},{i * 100000},{i / 4},{'red' if i % 2 else 'blue'},"
+            f"2024-02-{i + 1:02d},row {i}\n"
+            for i in range(8)
+        )
+    )
+
+    profile = ingest.profile_file(str(path), "csv", chunk_rows=3)
+
+    assert profile.optimized == {
+        "small": "int8",
+        "big": "int32",
+        "ratio": "float32",
+        "color": "category",
+        "day": "datetime64[ns]",
+        "label": "object",
+    }
+    chunk = next(ingest.iter_chunks(str(path), "csv", dtypes=profile.optimized))
+    assert chunk.dtypes.astype(str).to_dict() == profile.optimized
+    assert profile.memory["bytes_after"] < profile.memory["bytes_before"]
+
+
+def test_parse_rows_widens_downcast_types():
+    dtypes = {"small": "int8", "ratio": "float32"}
+
+    for body, content_type in [
+        (b"small,ratio\n300,0.1\n-200,1\n", "text/csv"),
+        (b'[{"small": 300, "ratio": 0.1}, {"small": -200, "ratio": 1}]', "application/json"),
+    ]:
+        rows, fitted = ingest.parse_rows(body, content_type, dtypes)
+        assert fitted == {"small": "int16", "ratio": "float64"}
+        assert rows["small"].tolist() == [300, -200]
+        assert rows["ratio"].tolist() == [0.1, 1.0]
+
+    rows, fitted = ingest.parse_rows(b"small,ratio\n12,0.5\n", "text/csv", dtypes)
+    assert fitted == dtypes
+    assert rows.dtypes.astype(str).to_dict() == dtypes
+
+
+def test_dates_need_an_explicit_format(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text(
+        "iso,french,stamp,relative,dotted\n"
+        "2024-01-31,31/01/2024,2024-01-31T10:30:00,now,1.2.3\n"
+        "2024-02-01,01/02/2024,2024-02-01 08:00,today,4.5.6\n"
+    )
+
+    profile = ingest.profile_file(str(path), "csv")
+
+    assert profile.optimized == {
+        "iso": "datetime64[ns]",
+        "french": "datetime64[ns]",
+        "stamp": "datetime64[ns]",
+        "relative": "object",
+        "dotted": "object",
+    }
+    chunk = next(ingest.iter_chunks(str(path), "csv", dtypes=profile.optimized))
+    assert chunk["french"].tolist() == chunk["iso"].tolist()
+
+    dtypes = {"day": "datetime64[ns]"}
+    rows, _ = ingest.parse_rows(b"day\n2024-03-01\n", "text/csv", dtypes)
+    assert rows["day"].tolist() == [datetime.datetime(2024, 3, 1)]
+    for day in (b"now", b"1.2.3", b"2024-13-01"):
+        with pytest.raises(ValueError):
+            ingest.parse_rows(b"day\n" + day + b"\n", "text/csv", dtypes)
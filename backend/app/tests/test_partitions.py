@@ -0,0 +1,60 @@
+import datetime
+
+from app.db import models, partitions
+
+
+def log(db, timestamp: datetime.datetime, action: str = "CREATE"):
+    db.add(models.AuditLog(
+        action=action,
+        entity_type="Dataset",
+        entity_id=1,
+        timestamp=timestamp,
+    ))
+    db.commit()
+
+
+def partition_of(db, timestamp: datetime.datetime) -> str:
+    return db.execute(
+        "SELECT tableoid::regclass::text FROM audit_log WHERE timestamp = :timestamp",
+        {"timestamp": timestamp},
+    ).scalar()
+
+
+def test_add_months():
+    assert partitions.add_months(datetime.date(2026, 11, 1), 2) == datetime.date(2027, 1, 1)
+    assert partitions.add_months(datetime.date(2026, 1, 1), -13) == datetime.date(2024, 12, 1)
+
+
+def test_ensure_partitions(test_db):
+    early = datetime.datetime(2030, 2, 10)
+    log(test_db, early)
+    assert partition_of(test_db, early) == "audit_log_default"
+
+    created = partitions.ensure_audit_partitions(test_db, datetime.date(2030, 1, 20), ahead=1)
+    assert created == ["audit_log_y2030m01", "audit_log_y2030m02"]
+    # Rows written before their partition existed are moved to it
+    assert partition_of(test_db, early) == "audit_log_y2030m02"
+    assert partitions.ensure_audit_partitions(test_db, datetime.date(2030, 1, 20), ahead=1) == []
+
+
+def test_drop_partitions(test_db):
+    partitions.ensure_audit_partitions(test_db, datetime.date(2020, 1, 1), ahead=2)
+    for day, action in ((1, "CREATE"), (1, "CREATE"), (2, "DELETE")):
+        log(test_db, datetime.datetime(2020, 1, day, 12), action)
+    log(test_db, datetime.datetime(2020, 3, 1))
+    log(test_db, datetime.datetime(2019, 6, 1))
+
+    dropped = partitions.drop_audit_partitions(test_db, datetime.date(2021, 3, 15), retention_months=12)
+
+    assert dropped == ["audit_log_y2020m01", "audit_log_y2020m02"]
+    assert "audit_log_y2020m03" in partitions.audit_partitions(test_db).values()
+    daily = test_db.query(models.AuditLogDaily).order_by(models.AuditLogDaily.day).all()
+    assert [(d.day.isoformat(), d.action, d.count) for d in daily] == [
+        ("2019-06-01", "CREATE", 1),
+        ("2020-01-01", "CREATE", 2),
+        ("2020-01-02", "DELETE", 1),
+    ]
+    remaining = test_db.query(models.AuditLog).filter(
+        models.AuditLog.timestamp < datetime.datetime(2020, 3, 1)
+    ).count()
+    assert remaining == 0
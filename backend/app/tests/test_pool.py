@@ -0,0 +1,59 @@
+import pytest
+from sqlalchemy import create_engine, exc
+
+from app.core import config
+from app.db.pool import InstrumentedQueuePool
+from app.db.session import get_db
+from app.main import app
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine(
+        f"{config.SQLALCHEMY_DATABASE_URI}_test",
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=1,
+        pool_timeout=0.1,
+    )
+    yield engine
+    engine.dispose()
+
+
+def test_pool_metrics(engine):
+    first = engine.connect()
+    second = engine.connect()
+    metrics = engine.pool.metrics()
+    assert metrics["in_use"] == 2
+    assert metrics["overflow"] == 1
+
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    metrics = engine.pool.metrics()
+    assert metrics["checkouts"] == 3
+    assert metrics["timeouts"] == 1
+    assert metrics["wait_seconds"]["max"] >= 0.1
+
+    first.close()
+    second.close()
+    metrics = engine.pool.metrics()
+    assert metrics["in_use"] == metrics["overflow"] == 0
+    assert metrics["idle"] == 1
+
+
+def test_pool_metrics_survive_dispose(engine):
+    engine.connect().close()
+    engine.dispose()
+    assert engine.pool.metrics()["checkouts"] == 1
+
+
+def test_pool_timeouts_are_503(client, user_token_headers, monkeypatch):
+    def get_exhausted_db():
+        raise exc.TimeoutError("QueuePool limit reached")
+        yield
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, get_exhausted_db)
+    response = client.get("/api/v1/datasets/1/sheets", headers=user_token_headers)
+
+    assert response.status_code == 503
+    assert response.json() == {"detail": "No database connection available"}
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+from app.datasets import profiles, storage
+from app.tests.test_storage import write_store
+
+
+def test_numeric_histograms(tmp_path):
+    df = pd.DataFrame({"x": [1.0, 2.0, 2.0, 2.0, 3.0, 9.0, np.nan]})
+    store = write_store(tmp_path / "store", df)
+
+    profile = profiles.profile_store(store, bins=4)["x"]
+
+    assert profile["kind"] == "number"
+    assert (profile["count"], profile["nulls"]) == (6, 1)
+    assert profile["equi_width"] == {
+        "edges": [1.0, 3.0, 5.0, 7.0, 9.0],
+        "counts": [4, 1, 0, 1],
+    }
+    depth = profile["equi_depth"]
+    assert depth["edges"][0] == 1.0 and depth["edges"][-1] == 9.0
+    assert sum(depth["counts"]) == 6
+
+
+def test_constant_and_empty_columns(tmp_path):
+    df = pd.DataFrame({"c": [5, 5, 5], "e": [np.nan] * 3})
+    store = write_store(tmp_path / "store", df)
+
+    result = profiles.profile_store(store, bins=3)
+
+    assert result["c"]["equi_depth"] == {"edges": [5.0, 5.0], "counts": [3]}
+    assert sum(result["c"]["equi_width"]["counts"]) == 3
+    assert result["e"]["equi_width"] == {"edges": [], "counts": []}
+
+
+def test_dates(tmp_path):
+    df = pd.DataFrame({"d": pd.to_datetime(["2021-01-01", "2021-01-03", None])})
+    store = write_store(tmp_path / "store", df)
+
+    profile = profiles.profile_store(store, bins=2)["d"]
+
+    assert profile["kind"] == "date"
+    assert profile["min"] == "2021-01-01T00:00:00"
+    assert profile["equi_width"]["edges"][1] == "2021-01-02T00:00:00"
+    assert profile["equi_width"]["counts"] == [1, 1]
+
+
+def test_top_values(tmp_path, monkeypatch):
+    df = pd.DataFrame({
+        "s": ["a", "b", "a", None, "c", "a", "b"],
+        "f": [True, False, True, True, True, False, True],
+    })
+    store = write_store(tmp_path / "store", df)
+
+    result = profiles.profile_store(store, top_k=2)
+
+    assert result["s"]["top_k"] == [
+        {"value": "a", "count": 3}, {"value": "b", "count": 2}
+    ]
+    assert (result["s"]["distinct"], result["s"]["nulls"]) == (3, 1)
+    assert result["f"]["top_k"][0] == {"value": True, "count": 5}
+
+    monkeypatch.setattr(profiles, "TOP_K_CAPACITY", 1)
+    result = profiles.profile_store(store, top_k=1)
+    assert result["s"]["approximate"]
+    assert result["s"]["top_k"][0]["value"] == "a"
+
+
+def test_profiles_merge_saved_segments(tmp_path, monkeypatch):
+    df = pd.DataFrame({"x": np.arange(10.0), "s": list("aabbbcccc") + [None]})
+    store = write_store(tmp_path / "store", df.iloc[:6], segment_rows=10)
+    profiles.profile_store(store, bins=5)
+
+    storage.append_segment(store.path, df.iloc[6:].reset_index(drop=True))
+    store = storage.DatasetStore(store.path)
+
+    scanned = []
+    original = store.segment_column
+
+    def spy(segment, name):
+        scanned.append(segment.path)
+        return original(segment, name)
+
+    monkeypatch.setattr(store, "segment_column", spy)
+    merged = profiles.profile_store(store, bins=5)
+
+    # Only the appended segment is read, the result matches a full profile
+    assert set(scanned) == {store.segments[1].path}
+    full = profiles.profile_store(write_store(tmp_path / "full", df), bins=5)
+    assert merged == full
@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.datasets import query
+from app.db import schemas
+from app.tests.test_storage import write_store
+
+DF = pd.DataFrame(
+    {
+        "city": ["paris", "lyon", "paris", None, "nice", "lyon", "paris"],
+        "price": [1.0, 2.0, np.nan, 4.0, 5.0, 6.0, 7.0],
+        "units": [1, 2, 3, 4, 5, 6, 7],
+    }
+)
+TYPES = {"city": "object", "price": "float64", "units": "int64"}
+
+
+def run(store, **spec):
+    return query.run_query(store, schemas.DatasetQuery(**spec), TYPES)
+
+
+def test_group_by_aggregates(tmp_path):
+    store = write_store(tmp_path / "store", DF)
+
+    result = run(
+        store,
+        group_by=["city"],
+        aggregates=[
+            {"func": "count"},
+            {"func": "sum", "column": "units"},
+            {"func": "mean", "column": "price", "alias": "avg_price"},
+            {"func": "max", "column": "price"},
+        ],
+        order_by=[{"column": "city"}],
+    )
+
+    assert result["columns"] == [
+        "city", "count_rows", "sum_units", "avg_price", "max_price"
+    ]
+    assert result["rows"] == [
+        {"city": "lyon", "count_rows": 2, "sum_units": 8,
+         "avg_price": 4.0, "max_price": 6.0},
+        {"city": "nice", "count_rows": 1, "sum_units": 5,
+         "avg_price": 5.0, "max_price": 5.0},
+        {"city": "paris", "count_rows": 3, "sum_units": 11,
+         "avg_price": 4.0, "max_price": 7.0},
+        {"city": None, "count_rows": 1, "sum_units": 4,
+         "avg_price": 4.0, "max_price": 4.0},
+    ]
+
+
+def test_filters_and_projection(tmp_path):
+    store = write_store(tmp_path / "store", DF)
+
+    result = run(
+        store,
+        select=["units", "city"],
+        filters=[
+            {"column": "city", "op": "in", "value": ["paris", "lyon"]},
+            {"column": "price", "op": "ge", "value": 2},
+        ],
+        order_by=[{"column": "units", "desc": True}],
+        limit=2,
+    )
+
+    assert result["rows"] == [
+        {"units": 7, "city": "paris"},
+        {"units": 6, "city": "lyon"},
+    ]
+    assert run(store, filters=[{"column": "city", "op": "is_null"}])[
+        "rows"
+    ] == [{"city": None, "price": 4.0, "units": 4}]
+    assert run(
+        store, filters=[{"column": "city", "op": "contains", "value": "ic"}]
+    )["row_count"] == 1
+
+
+def test_zone_maps_skip_segments(tmp_path, monkeypatch):
+    store = write_store(tmp_path / "store", DF, chunk_rows=2)
+    materialized = []
+    original = query._materialize
+
+    def spy(store, segment, name, rows):
+        materialized.append(segment.offset)
+        return original(store, segment, name, rows)
+
+    monkeypatch.setattr(query, "_materialize", spy)
+    result = run(
+        store,
+        filters=[{"column": "units", "op": "gt", "value": 5}],
+        aggregates=[{"func": "count", "column": "city"}],
+    )
+
+    assert result["rows"] == [{"count_city": 2}]
+    # Only the segments holding units 5-6 and 7 could match
+    assert store.segments[0].zone_maps == {1: [1.0, 2.0], 2: [1, 2]}
+    assert sorted(set(materialized)) == [4, 6]
+
+
+def test_aggregate_over_no_rows(tmp_path):
+    store = write_store(tmp_path / "store", DF)
+
+    result = run(
+        store,
+        filters=[{"column": "units", "op": "lt", "value": 0}],
+        aggregates=[{"func": "count"}, {"func": "min", "column": "price"}],
+    )
+
+    assert result["rows"] == [{"count_rows": 0, "min_price": None}]
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        {"select": ["missing"]},
+        {"filters": [{"column": "units", "op": "gt", "value": "a"}]},
+        {"filters": [{"column": "city", "op": "like", "value": "a"}]},
+        {"aggregates": [{"func": "sum", "column": "city"}]},
+        {"group_by": ["city"]},
+        {"select": ["city"], "order_by": [{"column": "units"}]},
+    ],
+)
+def test_invalid_queries(tmp_path, spec):
+    store = write_store(tmp_path / "store", DF)
+
+    with pytest.raises(query.QueryError):
+        run(store, **spec)
@@ -0,0 +1,32 @@
+from app.datasets import rowindex
+
+
+def write_csv(path, rows):
+    lines = ["id,text"] + [f'{i},"line {i}\nwith ""quotes"""' for i in range(rows)]
+    path.write_text("\n".join(lines) + "\n")
+
+
+def test_indexer_skips_quoted_newlines(tmp_path):
+    path = tmp_path / "data.csv"
+    write_csv(path, 25)
+    content = path.read_bytes()
+
+    indexer = rowindex.CSVRowIndexer(every=10)
+    for start in range(0, len(content), 7):
+        indexer.feed(content[start:start + 7])
+
+    assert len(indexer.offsets) == 3
+    for row, offset in zip([0, 10, 20], indexer.offsets):
+        assert content[offset:].startswith(f'{row},"line {row}'.encode())
+
+
+def test_read_csv_rows_from_offset(tmp_path, monkeypatch):
+    monkeypatch.setattr(rowindex.config, "ROW_INDEX_EVERY", 10)
+    path = tmp_path / "data.csv"
+    write_csv(path, 25)
+
+    df = rowindex.read_csv_rows(str(path), 17, 5)
+
+    assert df["id"].tolist() == [17, 18, 19, 20, 21]
+    assert df["text"][0] == 'line 17\nwith "quotes"'
+    assert rowindex.read_csv_rows(str(path), 40, 5).empty
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from app.datasets import sampling
+
+
+def test_sample_rows_without_replacement():
+    rng = np.random.default_rng(0)
+
+    rows = sampling.sample_rows(1000, 100, rng)
+
+    assert len(np.unique(rows)) == 100
+    assert (np.diff(rows) > 0).all()
+    assert sampling.sample_rows(10, 100, rng).tolist() == list(range(10))
+
+
+def test_reservoir_sample_is_bounded():
+    rng = np.random.default_rng(0)
+    chunks = (
+        pd.DataFrame({"x": np.arange(i, i + 100)}) for i in range(0, 1000, 100)
+    )
+
+    sample, row_count = sampling.reservoir_sample(chunks, 50, rng)
+
+    assert row_count == 1000
+    assert len(np.unique(sample["x"])) == 50
+
+
+def test_estimate_covers_true_values():
+    rng = np.random.default_rng(1)
+    values = rng.exponential(10, 200000)
+    values[rng.random(len(values)) < 0.1] = np.nan
+    labels = np.where(np.isnan(values), None, "a").astype(object)
+    rows = sampling.sample_rows(len(values), 20000, rng)
+
+    stats = sampling.estimate(
+        {"x": values[rows], "label": labels[rows]},
+        {"x": "float64", "label": "object"},
+        len(values),
+    )
+
+    assert stats["mode"] == "approx"
+    assert stats["sample_size"] == 20000
+    intervals = stats["confidence_intervals"]
+    low, high = intervals["summary"]["x"]["mean"]
+    assert low <= np.nanmean(values) <= high
+    low, high = intervals["summary"]["x"]["50%"]
+    assert low <= np.nanmedian(values) <= high
+    low, high = intervals["missing_values"]["label"]
+    assert low <= np.isnan(values).sum() <= high
+    assert list(stats["summary"]) == ["x"]
+
+
+def test_full_sample_has_exact_intervals():
+    values = np.arange(100, dtype=float)
+
+    stats = sampling.estimate({"x": values}, {"x": "float64"}, 100)
+
+    low, high = stats["confidence_intervals"]["summary"]["x"]["mean"]
+    assert low == high == values.mean()
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+from app.datasets import stats
+
+
+def test_column_stats_match_describe():
+    values = np.array([4.0, np.nan, 1.0, 7.5, 3.0, np.nan, 10.0])
+
+    column = stats.ColumnStats("float64")
+    column.update(values)
+
+    expected = pd.Series(values).describe().to_dict()
+    summary = column.summary()
+    assert column.nulls == 2
+    for key, value in expected.items():
+        assert np.isclose(summary[key], value), key
+
+
+def test_merged_chunks_match_single_pass():
+    rng = np.random.default_rng(0)
+    values = rng.normal(50, 10, 100000)
+
+    chunks = []
+    for part in np.array_split(values, 7):
+        column = stats.ColumnStats("float64")
+        column.update(part)
+        chunks.append({"x": column})
+    merged = stats.merge_all(chunks)["x"]
+
+    assert merged.count == len(values)
+    assert np.isclose(merged.mean, values.mean())
+    assert np.isclose(merged.std, values.std(ddof=1))
+    assert merged.min == values.min() and merged.max == values.max()
+    # KLL rank error stays around 1%
+    estimates = merged.quantiles.quantiles(stats.QUANTILES)
+    for q, estimate in zip(stats.QUANTILES, estimates):
+        rank = np.mean(values <= estimate)
+        assert abs(rank - q) < 0.02
+
+
+def test_hyperloglog_estimate():
+    sketch = stats.HyperLogLog()
+    sketch.update(np.arange(50000) % 20000)
+
+    other = stats.HyperLogLog()
+    other.update(np.arange(10000, 30000))
+    sketch.merge(other)
+
+    assert abs(sketch.estimate() - 30000) / 30000 < 0.05
+
+
+def test_column_stats_roundtrip():
+    column = stats.ColumnStats("int64")
+    column.update(np.arange(1000))
+
+    restored = stats.ColumnStats.from_dict(column.to_dict())
+
+    assert restored.summary() == column.summary()
+    assert restored.distinct.estimate() == column.distinct.estimate()
+
+
+def test_report_shape():
+    numbers = stats.ColumnStats("int64")
+    numbers.update(np.array([1, 2, 3]))
+    labels = stats.ColumnStats("object")
+    labels.update(np.array(["a", None, "a"], dtype=object))
+
+    report = stats.report({"n": numbers, "label": labels})
+
+    assert list(report["summary"]) == ["n"]
+    assert report["missing_values"] == {"label": 1}
+    assert report["data_types"] == {"n": "int64", "label": "object"}
+    assert report["distinct_values"] == {"n": 3, "label": 1}
@@ -0,0 +1,150 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from app.datasets import storage
+
+
+def write_store(path, df, segment_rows=2, chunk_rows=3):
+    dtypes = {column: str(dtype) for column, dtype in df.dtypes.items()}
+    writer = storage.DatasetWriter(str(path), dtypes, segment_rows)
+    for start in range(0, len(df), chunk_rows):
+        writer.write(df.iloc[start:start + chunk_rows].copy())
+    writer.close()
+    return storage.DatasetStore(str(path))
+
+
+def test_store_roundtrip(tmp_path):
+    df = pd.DataFrame(
+        {
+            "id": np.arange(7),
+            "price": [1.5, np.nan, 3.0, 4.0, 5.5, 6.0, 7.0],
+            "city": ["paris", "lyon", None, "paris", "nice", "lyon", "x"],
+            "flag": [True, False, True, True, False, False, True],
+        }
+    )
+
+    store = write_store(tmp_path / "store", df)
+
+    assert store.row_count == 7
+    assert len(store.segments) == 3
+    assert store.dtypes == {
+        "id": "int64",
+        "price": "float64",
+        "city": "object",
+        "flag": "bool",
+    }
+    pd.testing.assert_frame_equal(store.read(), df)
+
+
+def test_store_reads_column_and_row_ranges(tmp_path):
+    df = pd.DataFrame({"a": np.arange(10), "b": [str(i) for i in range(10)]})
+
+    store = write_store(tmp_path / "store", df, segment_rows=4)
+
+    assert store.read_column("a", 3, 9).tolist() == [3, 4, 5, 6, 7, 8]
+    assert store.read(["b"], 8).to_dict(orient="list") == {"b": ["8", "9"]}
+    assert store.read(["a"], 20).empty
+
+
+def test_open_store_missing(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage.config, "DATASET_STORE_DIR", str(tmp_path))
+
+    assert storage.open_store(1) is None
+
+
+def test_store_columns_are_memory_mapped(tmp_path):
+    df = pd.DataFrame({"a": [1.0, np.nan, 3.0], "b": ["x", None, None]})
+
+    store = write_store(tmp_path / "store", df, segment_rows=10)
+
+    assert isinstance(store.read_column("a", 1), np.memmap)
+    assert store.null_count("a") == 1
+    assert store.null_count("b") == 2
+
+
+def test_append_segment(tmp_path):
+    df = pd.DataFrame({"a": [1, 2, 3], "b": ["x", "y", None]})
+    store = write_store(tmp_path / "store", df, segment_rows=10)
+    first = store.segments[0].path
+
+    storage.append_segment(store.path, pd.DataFrame({"a": [4], "b": ["x"]}))
+    store = storage.DatasetStore(store.path)
+
+    assert store.row_count == 4
+    assert [s.path for s in store.segments][0] == first
+    assert store.read().to_dict(orient="list") == {
+        "a": [1, 2, 3, 4], "b": ["x", "y", None, "x"]
+    }
+
+
+def test_versions_share_unchanged_segments(tmp_path):
+    df = pd.DataFrame({"a": np.arange(6), "b": list("xyzxyz")})
+    dtypes = {"a": "int64", "b": "object"}
+    path = str(tmp_path / "store")
+
+    changed = df.copy()
+    changed.loc[5, "a"] = 50
+    for version, content in [(1, df), (2, changed)]:
+        writer = storage.DatasetWriter(path, dtypes, 2, version)
+        for start in range(0, 6, 2):
+            writer.write(content.iloc[start:start + 2].copy())
+        writer.close()
+
+    first, second = storage.DatasetStore(path, 1), storage.DatasetStore(path, 2)
+    assert storage.DatasetStore(path).version == 2
+    assert first.read_column("a").tolist() == [0, 1, 2, 3, 4, 5]
+    assert second.read_column("a").tolist() == [0, 1, 2, 3, 4, 50]
+    # Only the last segment changed and is stored twice
+    assert [s.path for s in first.segments[:2]] == [
+        s.path for s in second.segments[:2]
+    ]
+    assert len(os.listdir(os.path.join(path, "segments"))) == 4
+    assert writer.created == [os.path.basename(second.segments[2].path)]
+
+
+def test_append_segment_version(tmp_path):
+    df = pd.DataFrame({"a": [1, 2]})
+    store = write_store(tmp_path / "store", df, segment_rows=10)
+
+    # Stores written before versions existed keep their content as a version
+    storage.save_version(store.path, 1)
+    storage.append_segment(store.path, pd.DataFrame({"a": [3]}), version=2)
+
+    assert storage.DatasetStore(store.path, 1).read_column("a").tolist() == [1, 2]
+    assert storage.DatasetStore(store.path, 2).read_column("a").tolist() == [1, 2, 3]
+
+
+def test_append_segment_widens_columns(tmp_path):
+    df = pd.DataFrame({"a": np.array([1, 2], dtype=np.int8), "b": ["x", None]})
+    store = write_store(tmp_path / "store", df, segment_rows=1)
+    storage.save_version(store.path, 1)
+
+    storage.append_segment(
+        store.path,
+        pd.DataFrame({"a": np.array([300], dtype=np.int16), "b": ["y"]}),
+        version=2,
+        dtypes={"a": "int16", "b": "object"},
+    )
+
+    store = storage.DatasetStore(store.path)
+    assert store.dtypes == {"a": "int16", "b": "object"}
+    assert store.read().to_dict(orient="list") == {
+        "a": [1, 2, 300], "b": ["x", None, "y"]
+    }
+    # The previous version keeps its segments and types
+    first = storage.DatasetStore(store.path, 1)
+    assert first.dtypes["a"] == "int8"
+    assert first.read_column("a").tolist() == [1, 2]
+
+
+def test_prune_segments(tmp_path):
+    store = write_store(tmp_path / "store", pd.DataFrame({"a": [1, 2, 3]}))
+    segments = os.path.join(store.path, "segments")
+    os.makedirs(os.path.join(segments, "orphan"))
+
+    assert storage.prune_segments(store.path) == 1
+    assert sorted(os.listdir(segments)) == sorted(
+        os.path.basename(s.path) for s in store.segments
+    )
@@ -1,12 +1,14 @@
 import pytest
 from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy_utils import database_exists, create_database, drop_database
 from fastapi.testclient import TestClient
 import typing as t
 
 from app.core import config, security
-from app.db.session import Base, get_db
+from app.db.audit import audit_sink
+from app.db.session import Base, get_async_db, get_db
 from app.db import models
 from app.main import app
 
@@ -73,16 +75,49 @@ def create_test_db():
     drop_database(test_db_url)
 
 
+class AsyncSessionAdapter:
+    """
+    AsyncSession running its statements on the test session, so that the
+    async read paths see the rows of the test transaction
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    async def fetch_all(self, statement):
+        return [dict(row) for row in self.session.execute(statement)]
+
+    async def fetch_one(self, statement):
+        rows = await self.fetch_all(statement.limit(1))
+        return rows[0] if rows else None
+
+    async def estimate_rows(self, statement):
+        compiled = statement.compile(dialect=postgresql.dialect())
+        plan = self.session.connection().execute(
+            f"EXPLAIN (FORMAT JSON) {compiled.string}", compiled.params
+        ).scalar()
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    async def close(self):
+        pass
+
+
 @pytest.fixture
-def client(test_db):
+def client(test_db, monkeypatch):
     """
     Get a TestClient instance that reads/write to the test database.
     """
+    # Write audit entries in the test transaction, as requests make them
+    monkeypatch.setattr(audit_sink, "sync", True)
 
     def get_test_db():
         yield test_db
 
+    async def get_test_async_db():
+        yield AsyncSessionAdapter(test_db)
+
     app.dependency_overrides[get_db] = get_test_db
+    app.dependency_overrides[get_async_db] = get_test_async_db
 
     yield TestClient(app)
 